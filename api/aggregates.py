@@ -0,0 +1,66 @@
+from typing import Dict, Optional, Iterable
+from datetime import datetime
+from pydantic import BaseModel, Field
+
+from supplier_data import Supplier, ESG_CRITERIA
+
+
+# Portfolio-level counts for an org, stored in orgs/{org_id}/aggregates/esg
+class OrgAggregates(BaseModel):
+    total: int = 0
+    segments: Dict[str, int] = Field(default_factory=dict)
+    available: Dict[str, int] = Field(default_factory=dict)
+    updated: Optional[datetime] = None
+
+
+    def share_available(self, criterion: str) -> float:
+        return self.available.get(criterion, 0) / self.total if self.total else 0.0
+
+
+# What one supplier contributes to its org's counts, as {"group": {"key": count}}
+def supplier_counts(supplier: Optional[Supplier]) -> Dict[str, Dict[str, int]]:
+    if supplier is None:
+        return {}
+    counts = {
+        "segments": {supplier.esg.segment: 1},
+        "available": {},
+    }
+    for criterion in ESG_CRITERIA:
+        data = getattr(supplier.esg, criterion)
+        if data is not None and data.available:
+            counts["available"][criterion] = 1
+    return counts
+
+
+# Change in the org's counts when a supplier goes from before to after, None when added or deleted
+# Returns {"total": n, "segments": {...}, "available": {...}} holding only non-zero changes
+def aggregate_diff(before: Optional[Supplier], after: Optional[Supplier]) -> dict:
+    diff = {}
+    total = (after is not None) - (before is not None)
+    if total:
+        diff["total"] = total
+    before_counts = supplier_counts(before)
+    after_counts = supplier_counts(after)
+    for group in ("segments", "available"):
+        keys = set(before_counts.get(group, {})) | set(after_counts.get(group, {}))
+        changes = {
+            key: after_counts.get(group, {}).get(key, 0) - before_counts.get(group, {}).get(key, 0)
+            for key in keys
+        }
+        changes = {key: change for key, change in changes.items() if change}
+        if changes:
+            diff[group] = changes
+    return diff
+
+
+# Full recompute from every supplier, used to build or repair the stored counts
+def compute_aggregates(suppliers: Iterable[Supplier]) -> OrgAggregates:
+    aggregates = OrgAggregates()
+    for supplier in suppliers:
+        diff = aggregate_diff(None, supplier)
+        aggregates.total += diff["total"]
+        for group in ("segments", "available"):
+            counts = getattr(aggregates, group)
+            for key, change in diff.get(group, {}).items():
+                counts[key] = counts.get(key, 0) + change
+    return aggregates
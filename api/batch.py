@@ -0,0 +1,191 @@
+import os
+import json
+import uuid
+import tempfile
+import threading
+from typing import Callable, Dict, List, Optional
+from pydantic import BaseModel, PrivateAttr
+
+from compositeai.drivers.base_driver import BaseDriver, DriverInput, DriverResponse, DriverUsage
+
+
+# "openai" submits to the OpenAI Batch API, "local" runs batches in-process for testing
+LLM_BATCH_BACKEND = os.getenv("LLM_BATCH_BACKEND", "openai")
+
+# A batch is submitted once this many companies are waiting, or the oldest has waited this long
+BATCH_FLUSH_COMPANIES = int(os.getenv("BATCH_FLUSH_COMPANIES", "20"))
+BATCH_FLUSH_SECONDS = int(os.getenv("BATCH_FLUSH_SECONDS", "300"))
+
+# Seconds between checks on submitted batches, 0 leaves it to POST /batch_poll
+BATCH_POLL_INTERVAL = int(os.getenv("BATCH_POLL_INTERVAL", "60"))
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+class BatchRequest(BaseModel):
+    custom_id: str
+    body: dict
+
+
+# Driver used in batch mode: research steps run as usual, but the final structured output call
+# is recorded as a batch request instead of being sent, and the agent gets an empty result
+class DeferredOutputDriver(BaseDriver):
+    _driver: BaseDriver = PrivateAttr()
+    _deferred: List[dict] = PrivateAttr(default_factory=list)
+
+
+    def __init__(self, driver: BaseDriver, **data):
+        super().__init__(model=driver.model, seed=driver.seed, **data)
+        self._driver = driver
+
+
+    @property
+    def deferred(self) -> List[dict]:
+        return self._deferred
+
+
+    def generate(self, input: DriverInput) -> DriverResponse:
+        if isinstance(input.response_format, str):
+            return self._driver.generate(input=input)
+
+        from openai.lib._parsing._completions import type_to_response_format_param
+
+        body = {
+            "model": self.model,
+            "messages": self._driver._messages_driver_to_openai(input.messages),
+            "temperature": input.temperature,
+            "max_tokens": input.max_tokens,
+            "seed": self.seed,
+            "response_format": type_to_response_format_param(input.response_format),
+        }
+        self._deferred.append({key: value for key, value in body.items() if value is not None})
+        return DriverResponse(content=None, usage=DriverUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0))
+
+
+# Read a batch output file into {custom_id: message content}, None for requests that failed
+def parse_batch_output(text: str) -> Dict[str, Optional[str]]:
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response")
+        if response and response.get("status_code") == 200:
+            results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        else:
+            results[item["custom_id"]] = None
+    return results
+
+
+def batch_input_lines(requests: List[BatchRequest]) -> str:
+    return "\n".join(
+        json.dumps({"custom_id": request.custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": request.body})
+        for request in requests
+    )
+
+
+class OpenAIBatchClient():
+
+
+    def __init__(self) -> None:
+        from openai import OpenAI
+
+        self._client = OpenAI()
+
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        batch_file = self._client.files.create(
+            file=("batch.jsonl", batch_input_lines(requests).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = self._client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+
+    def status(self, batch_id: str) -> str:
+        # One of validating, in_progress, finalizing, completed, failed, expired, cancelling, cancelled
+        return self._client.batches.retrieve(batch_id).status
+
+
+    def results(self, batch_id: str) -> Dict[str, Optional[str]]:
+        batch = self._client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return {}
+        return parse_batch_output(self._client.files.content(batch.output_file_id).text)
+
+
+# Stand-in for the batch endpoint: same file formats and statuses, but requests run in a
+# background thread of this process through handler, by default the regular chat completions API
+class LocalBatchClient():
+
+
+    def __init__(self, handler: Optional[Callable[[dict], dict]] = None, directory: Optional[str] = None) -> None:
+        self._handler = handler or self._chat_completion
+        self._directory = directory or tempfile.mkdtemp(prefix="llm-batches-")
+        self._statuses: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def _chat_completion(body: dict) -> dict:
+        from openai import OpenAI
+
+        return OpenAI().chat.completions.create(**body).model_dump()
+
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self._directory, f"{batch_id}_{kind}.jsonl")
+
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        with open(self._path(batch_id, "input"), "w") as f:
+            f.write(batch_input_lines(requests))
+        with self._lock:
+            self._statuses[batch_id] = "in_progress"
+        threading.Thread(target=self._run, args=(batch_id,), daemon=True).start()
+        return batch_id
+
+
+    def _run(self, batch_id: str) -> None:
+        output = []
+        with open(self._path(batch_id, "input")) as f:
+            for line in f:
+                request = json.loads(line)
+                try:
+                    response = {"status_code": 200, "body": self._handler(request["body"])}
+                    error = None
+                except Exception as e:
+                    response = None
+                    error = {"message": str(e)}
+                output.append(json.dumps({"custom_id": request["custom_id"], "response": response, "error": error}))
+        with open(self._path(batch_id, "output"), "w") as f:
+            f.write("\n".join(output))
+        with self._lock:
+            self._statuses[batch_id] = "completed"
+
+
+    def status(self, batch_id: str) -> str:
+        with self._lock:
+            return self._statuses.get(batch_id, "failed")
+
+
+    def results(self, batch_id: str) -> Dict[str, Optional[str]]:
+        if self.status(batch_id) != "completed":
+            return {}
+        with open(self._path(batch_id, "output")) as f:
+            return parse_batch_output(f.read())
+
+
+_client = None
+
+
+def batch_client():
+    global _client
+    if _client is None:
+        _client = LocalBatchClient() if LLM_BATCH_BACKEND == "local" else OpenAIBatchClient()
+    return _client
@@ -0,0 +1,275 @@
+import os
+import re
+import json
+from typing import List, Optional, Set, Type
+from datetime import datetime, timedelta
+from pydantic import BaseModel
+
+from supplier_data import Supplier, DataSummary, AgentSupplier, compact_supplier
+
+
+# Stop criterion agents as soon as their tool results hold explicit evidence, set to 0 to turn off
+EARLY_STOP_ON_EVIDENCE = os.getenv("EARLY_STOP_ON_EVIDENCE", "1") != "0"
+
+
+# Characters either side of a match the company has to be named within for it to count
+EVIDENCE_SUBJECT_WINDOW = 200
+
+# Sentences with these are denials, advice or hypotheticals rather than claims, e.g. "We are not ISO 14001 certified"
+NOT_A_CLAIM = re.compile(r"\b(?:not|no|never|without|neither|nor|lacks?|yet to|should|could|would)\b|n't\b", re.IGNORECASE)
+QUESTION_START = re.compile(r"^\W*(?:what|which|who|how|why|does|do|did|is|are|has|have|can|will)\b", re.IGNORECASE)
+
+# Legal forms left off a company's name when looking for it in text, e.g. "Acme" for "Acme Ltd."
+LEGAL_SUFFIXES = {"ltd", "limited", "inc", "incorporated", "plc", "llc", "llp", "gmbh", "ag", "sa", "sas", "bv", "nv", "co", "corp", "corporation", "company"}
+
+
+# Ways a company may be referred to in a page: its name with and without its legal form, and its website's domain
+def company_terms(name: Optional[str], website: Optional[str] = None) -> List[str]:
+    terms = set()
+    if name and name.strip():
+        terms.add(name.strip())
+        words = re.findall(r"[\w&'-]+", name)
+        while words and words[-1].lower().strip(".") in LEGAL_SUFFIXES:
+            words.pop()
+        if words and len(" ".join(words)) >= 3:
+            terms.add(" ".join(words))
+    if website and website.strip():
+        host = re.sub(r"^(?:https?://)?(?:www\.)?", "", website.strip().lower()).split("/")[0]
+        if host:
+            terms.add(host)
+    return sorted(terms, key=len, reverse=True)
+
+
+# Cheap local check of scraped pages for a criterion's evidence, e.g. a tCO2e figure next to "Scope 1"
+# A match only counts as a claim by the company: named nearby, and not in a question or a denial
+# Each pattern found counts once, the agent answers once threshold different patterns have matched
+class EvidenceDetector():
+    # Search results are left out, their titles and snippets are mostly about the topic, not the company
+    tools = ["scrape_website"]
+
+
+    def __init__(self, patterns: List[str], threshold: int = 1, subject: Optional[List[str]] = None) -> None:
+        self.patterns = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+        self.threshold = threshold
+        self.subject = re.compile("|".join(rf"\b{re.escape(term)}\b" for term in subject), re.IGNORECASE) if subject else None
+
+
+    def _is_claim(self, text: str, match: re.Match) -> bool:
+        start = max(text.rfind(mark, 0, match.start()) for mark in ".!?\n") + 1
+        ends = [end for end in (text.find(mark, match.end()) for mark in ".!?\n") if end != -1]
+        end = min(ends) if ends else len(text)
+        sentence = text[start:end]
+        if text[end:end + 1] == "?" or QUESTION_START.match(sentence) or NOT_A_CLAIM.search(sentence):
+            return False
+        if self.subject is None:
+            return True
+        window_start = max(0, match.start() - EVIDENCE_SUBJECT_WINDOW)
+        return self.subject.search(text[window_start:match.end() + EVIDENCE_SUBJECT_WINDOW]) is not None
+
+
+    def matches(self, text: str) -> Set[str]:
+        return {
+            pattern.pattern for pattern in self.patterns
+            if any(self._is_claim(text, match) for match in pattern.finditer(text))
+        }
+
+
+# One ESG criterion researched by an agent: where its result is stored, how it is asked for,
+# how much it counts towards the segment, how long its data stays fresh and what counts as evidence
+class Criterion(BaseModel):
+    key: str
+    label: str
+    prompt: str
+    response_format: Type[BaseModel] = DataSummary
+    weight: float = 1.0
+    ttl_days: int = 180
+    evidence: List[str] = []
+    evidence_threshold: int = 1
+
+
+    def task(self, task_prefix: str) -> str:
+        return task_prefix + "\n" + self.prompt
+
+
+    def detector(self, name: Optional[str] = None, website: Optional[str] = None) -> Optional[EvidenceDetector]:
+        # Evidence has to name the company, so there is no early stop without its name or website
+        subject = company_terms(name, website)
+        if not EARLY_STOP_ON_EVIDENCE or not self.evidence or not subject:
+            return None
+        return EvidenceDetector(self.evidence, threshold=self.evidence_threshold, subject=subject)
+
+
+# An emissions figure, e.g. "12,345 tCO2e", "1.2 million tonnes of CO2 equivalent"
+EMISSIONS_FIGURE = r"\d[\d,.]*\s*(?:k|m|thousand|million)?\s*(?:metric\s+)?(?:t|tonnes?|tons?|mt|kt)\s*(?:of\s+)?co2(?:e|-?eq\w*)?"
+
+
+def scope_evidence(scope: str) -> List[str]:
+    # The scope named within a sentence of a figure, either way round, also as in "Scope 1 and 2"
+    named = rf"scope\s*(?:[123]\s*(?:,|and|&|\+)\s*)*{scope}\b"
+    return [
+        rf"{named}[^.\n]{{0,120}}?{EMISSIONS_FIGURE}",
+        rf"{EMISSIONS_FIGURE}[^.\n]{{0,120}}?{named}",
+    ]
+
+
+# Research run before the criteria when onboarding a new supplier
+BASIC_INFO = Criterion(
+    key="basic_info",
+    label="Basic Information",
+    prompt="Use the web to find a URL to the company's website and come up with your best description on what this company does.",
+    response_format=AgentSupplier,
+)
+
+
+CRITERIA: List[Criterion] = [
+    Criterion(
+        key="scope_1",
+        label="Scope 1 Emissions",
+        prompt="""
+    Please find any data on THEIR OWN scope 1 emissions calculations.
+    Scope 1 emissions are direct emissions from sources owned or controlled by a company.
+    These include things like: on-site energy, fleet vehicles, process emissions, or accidental emissions.
+    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 1" DATA.
+    """,
+        ttl_days=180,
+        evidence=scope_evidence("1"),
+    ),
+    Criterion(
+        key="scope_2",
+        label="Scope 2 Emissions",
+        prompt="""
+    Please find any data on THEIR OWN scope 2 emissions calculations.
+    Scope 2 emissions are indirect greenhouse gas (GHG) emissions that result from the generation of energy that an organization purchases and uses.
+    These include things like the purchase of electricity from: steam, heat, cooling, etc.
+    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 2" DATA.
+    """,
+        ttl_days=180,
+        evidence=scope_evidence("2"),
+    ),
+    Criterion(
+        key="scope_3",
+        label="Scope 3 Emissions",
+        prompt="""
+    Please find any data on THEIR OWN scope 3 emissions calculations.
+    Scope 3 emissions are greenhouse gas (GHG) emissions that are a result of activities that a company indirectly affects as part of its value chain, but that are not owned or controlled by the company.
+    These include things like: supply chain emissions, use of sold products, waste disposal, employee travel, contracted waste disposal, etc.
+    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 3" DATA.
+    """,
+        ttl_days=180,
+        evidence=scope_evidence("3"),
+    ),
+    Criterion(
+        key="ecovadis",
+        label="Ecovadis Score",
+        prompt="Please find if this company has a publicly available Ecovadis score.",
+        ttl_days=90,
+        # A medal held, as in "awarded an EcoVadis Gold medal", not the list of medals there are
+        evidence=[
+            r"ecovadis\b[^.\n]{0,80}?(?<!,\s)(?<!\band\s)(?<!\bor\s)\b(?:platinum|gold|silver|bronze)\s+(?:medal|rating|status|level|badge)\b",
+            r"\b(?:awarded|received|achieved|earned|holds?|won)\b[^.\n]{0,40}?\b(?:platinum|gold|silver|bronze)\b(?!\s*(?:,|and|or)\s)[^.\n]{0,80}?ecovadis\b",
+            r"ecovadis\b[^.\n]{0,80}?\b\d{2}\s*(?:/\s*100|points|out of 100)",
+        ],
+    ),
+    Criterion(
+        key="reduction_targets",
+        label="Reduction Targets",
+        prompt="Please find if this company has set any carbon emissions reduction targets.",
+        ttl_days=180,
+        evidence=[
+            r"\b(?:reduc\w*|cut\w*|lower\w*)\b[^.\n]{0,80}?\b\d{1,3}\s*%[^.\n]{0,80}?\b20[2-5]\d\b",
+            r"net[- ]zero[^.\n]{0,60}?\b(?:by|in)\s+20[3-5]\d\b",
+            r"(?:science based targets initiative|sbti)[^.\n]{0,80}?\b(?:approved|validated|verified)\b",
+            r"\b(?:approved|validated|verified)\b[^.\n]{0,80}?(?:science based targets initiative|sbti)",
+        ],
+    ),
+    Criterion(
+        key="iso_14001",
+        label="ISO 14001 Certification",
+        prompt="Please find if this company has an ISO 14001 certification.",
+        ttl_days=365,
+        evidence=[
+            r"iso\s*14001\s*:\s*20(?:04|15)",
+            r"iso\s*14001\b[^.\n]{0,60}?\bcertifi(?:ed|cate|cation)\b",
+            r"\bcertifi(?:ed|cate|cation)\b[^.\n]{0,60}?iso\s*14001\b",
+        ],
+    ),
+    Criterion(
+        key="product_lca",
+        label="Product LCAs",
+        prompt="Please find if this company has any products undergoing a Life Cycle Assessment, or LCA.",
+        ttl_days=180,
+        # A passing mention of LCAs is common, so a second, more specific sign is needed as well
+        evidence=[
+            r"\blife[- ]cycle assessments?\b",
+            r"\benvironmental product declarations?\b|\bepds?\b",
+            r"iso\s*1404[04]\b",
+        ],
+        evidence_threshold=2,
+    ),
+]
+
+
+# Refresh TTLs can be overridden with a JSON CRITERIA_TTL_DAYS environment variable, e.g. {"ecovadis": 30}
+CRITERIA_TTL_DAYS = json.loads(os.getenv("CRITERIA_TTL_DAYS") or "{}")
+
+
+# Wall-clock budgets in seconds for one criterion's agent run and for all of a company's runs,
+# once spent the agent answers with what it has found so far, 0 for no limit
+CRITERION_TIMEOUT = int(os.getenv("CRITERION_TIMEOUT", "300"))
+COMPANY_TIMEOUT = int(os.getenv("COMPANY_TIMEOUT", "1800"))
+
+
+def criterion_ttl(criterion: Criterion) -> timedelta:
+    return timedelta(days=CRITERIA_TTL_DAYS.get(criterion.key, criterion.ttl_days))
+
+
+def company_task_prefix(
+    name: str,
+    website: Optional[str] = None,
+    description: Optional[str] = None,
+    notes: Optional[str] = None,
+) -> str:
+    return f"""
+    Given the following info about a company:
+        Name - {name}
+        Website - {website}
+        Description - {description}
+        Notes - {notes}
+    """
+
+
+# When a supplier's criterion was last researched, older documents only have the overall timestamp
+def criterion_updated(supplier: Supplier, key: str) -> datetime:
+    return supplier.esg.criteria_updated.get(key, supplier.esg.updated)
+
+
+# When the first of a supplier's criteria passes its TTL, stored as esg.refresh_due so scheduled scans
+# find suppliers by their earliest due criterion rather than by their last update
+def refresh_due(supplier: Supplier) -> datetime:
+    return min(criterion_updated(supplier, criterion.key) + criterion_ttl(criterion) for criterion in CRITERIA)
+
+
+# Storage form of a supplier, its compact form with its refresh due date
+def supplier_document(supplier: Supplier) -> dict:
+    data = compact_supplier(supplier)
+    data["esg"]["refresh_due"] = refresh_due(supplier)
+    return data
+
+
+# A run cut short (cancelled, or out of time or tokens) that found nothing says nothing about the
+# criterion, so it must not replace stored data, e.g. a Stop click downgrading a supplier's segment
+def inconclusive(result, stopped: bool) -> bool:
+    return stopped and not getattr(result, "available", False)
+
+
+# Criteria worth re-running for a supplier: older than their TTL, or previously unavailable unless
+# include_unavailable is off, as for scheduled refreshes which only re-check them once their TTL passes
+def stale_criteria(supplier: Supplier, now: datetime, include_unavailable: bool = True) -> List[Criterion]:
+    stale = []
+    for criterion in CRITERIA:
+        data = getattr(supplier.esg, criterion.key)
+        if include_unavailable and (data is None or not data.available):
+            stale.append(criterion)
+        elif now - criterion_updated(supplier, criterion.key) > criterion_ttl(criterion):
+            stale.append(criterion)
+    return stale
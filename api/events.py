@@ -0,0 +1,103 @@
+import os
+import json
+import asyncio
+import itertools
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+from collections import OrderedDict, deque
+
+
+# Events kept per task or job so a client connecting late, or reconnecting, can catch up
+EVENT_HISTORY = int(os.getenv("EVENT_HISTORY", "200"))
+
+# Tasks and jobs whose events are kept, the least recently active are dropped first
+EVENT_TOPICS = int(os.getenv("EVENT_TOPICS", "500"))
+
+# Agent step contents (e.g. scraped pages) are cut to this many characters
+EVENT_CONTENT_CHARS = int(os.getenv("EVENT_CONTENT_CHARS", "2000"))
+
+# Seconds between keep-alive comments on an idle stream
+EVENT_KEEPALIVE = 15
+
+
+# In-memory pub/sub of agent progress per topic (a task id, or a supplier id for refreshes),
+# published to from agent worker threads and read by server-sent event streams
+class EventBroker():
+
+
+    def __init__(self) -> None:
+        self._history: OrderedDict[str, deque] = OrderedDict()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._ids = itertools.count(1)
+
+
+    def _publish(self, topic: str, event: str, data: dict) -> None:
+        item = (next(self._ids), event, data)
+        if topic not in self._history:
+            self._history[topic] = deque(maxlen=EVENT_HISTORY)
+            while len(self._history) > EVENT_TOPICS:
+                self._history.popitem(last=False)
+        self._history.move_to_end(topic)
+        self._history[topic].append(item)
+        for queue in self._subscribers.get(topic, ()):
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # A client that stopped reading misses events rather than holding up the agents
+                pass
+
+
+    def emitter(self, topic: str, **fields) -> Callable[[str, dict], None]:
+        # Called on the event loop, returns a callback agent threads use to publish,
+        # e.g. emit("step", {"criterion": ...}), with fields added to every event
+        loop = asyncio.get_running_loop()
+
+        def emit(event: str, data: Optional[dict] = None) -> None:
+            loop.call_soon_threadsafe(self._publish, topic, event, {**fields, **(data or {})})
+        return emit
+
+
+    async def subscribe(self, topic: str, last_id: int = 0) -> AsyncIterator[tuple]:
+        queue = asyncio.Queue(maxsize=1000)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        try:
+            for item in list(self._history.get(topic, ())):
+                if item[0] > last_id:
+                    yield item
+                    last_id = item[0]
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if item[0] > last_id:
+                    yield item
+        finally:
+            self._subscribers[topic].discard(queue)
+            if not self._subscribers[topic]:
+                del self._subscribers[topic]
+
+
+    async def stream(self, topic: str, last_id: int = 0) -> AsyncIterator[str]:
+        # Server-sent events wire format, None items become keep-alive comments
+        # Closing the subscription straight away when the client disconnects removes its queue
+        subscription = self.subscribe(topic, last_id)
+        try:
+            async for item in subscription:
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event_id, event, data = item
+                yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            await subscription.aclose()
+
+
+def step_content(content) -> str:
+    content = str(content)
+    if len(content) > EVENT_CONTENT_CHARS:
+        return content[:EVENT_CONTENT_CHARS] + "..."
+    return content
+
+
+events = EventBroker()
@@ -0,0 +1,97 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict
+
+
+# Seconds between progress writes, each write covers every company that moved on since the last
+PROGRESS_WRITE_INTERVAL = int(os.getenv("PROGRESS_WRITE_INTERVAL", "10"))
+
+# Firestore allows at most 500 writes per batch
+PROGRESS_BATCH_SIZE = 500
+
+
+# Company progress recorded from agent events as they happen, but written to the company documents
+# at most once per interval, latest state only, in one batch across all the companies in flight
+class ProgressWriter():
+
+
+    def __init__(self, get_db: Callable[[], Awaitable], interval: int = PROGRESS_WRITE_INTERVAL) -> None:
+        self._get_db = get_db
+        self.interval = interval
+        self._progress: Dict[str, dict] = {}
+        self._started: Dict[str, float] = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+
+    def start(self, path: str) -> None:
+        with self._lock:
+            self._started[path] = time.monotonic()
+            self._progress[path] = {"criterion": None, "criteria_done": 0, "iterations": 0}
+            self._dirty.add(path)
+
+
+    def record(self, path: str, event: str, data: dict) -> None:
+        # Called from agent threads for every event, only updates memory
+        with self._lock:
+            progress = self._progress.get(path)
+            if progress is None:
+                return
+            if event == "step":
+                progress["criterion"] = data.get("criterion")
+                progress["iterations"] += 1
+            elif event == "criterion_completed":
+                progress["criteria_done"] += 1
+            else:
+                return
+            self._dirty.add(path)
+
+
+    def finish(self, path: str) -> None:
+        # Company is done and its status says so, progress still pending is dropped
+        with self._lock:
+            self._progress.pop(path, None)
+            self._started.pop(path, None)
+            self._dirty.discard(path)
+
+
+    def tracked(self, path: str, emit: Callable[[str, dict], None]) -> Callable[[str, dict], None]:
+        # Wraps an event emitter so its events also update the company's progress
+        def tracked_emit(event: str, data: dict = None) -> None:
+            self.record(path, event, data or {})
+            emit(event, data)
+        return tracked_emit
+
+
+    async def flush(self) -> int:
+        from google.cloud import firestore
+
+        with self._lock:
+            now = time.monotonic()
+            updates = {
+                path: {**self._progress[path], "elapsed_seconds": round(now - self._started[path])}
+                for path in self._dirty
+            }
+            self._dirty.clear()
+        if not updates:
+            return 0
+
+        db = await self._get_db()
+        paths = list(updates)
+        for start in range(0, len(paths), PROGRESS_BATCH_SIZE):
+            batch = db.batch()
+            for path in paths[start:start + PROGRESS_BATCH_SIZE]:
+                batch.update(db.document(path), {"progress": {**updates[path], "updated": firestore.SERVER_TIMESTAMP}})
+            await batch.commit()
+        return len(updates)
+
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error writing company progress: {e}")
@@ -0,0 +1,208 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+from collections import deque
+from pydantic import BaseModel
+
+from supplier_data import Supplier, expand_supplier
+from criteria import Criterion, criterion_ttl, criterion_updated, stale_criteria
+from run_stats import run_stats
+
+
+# Seconds between scans for stale suppliers, 0 leaves scans to POST /refresh_scan (e.g. from Cloud Scheduler)
+REFRESH_SCAN_INTERVAL = int(os.getenv("REFRESH_SCAN_INTERVAL", "0"))
+
+# Oldest suppliers looked at per scan, across all orgs
+REFRESH_SCAN_LIMIT = int(os.getenv("REFRESH_SCAN_LIMIT", "200"))
+
+# Refreshes running at once, overall and per org
+REFRESH_MAX_CONCURRENT = int(os.getenv("REFRESH_MAX_CONCURRENT", "2"))
+REFRESH_MAX_PER_ORG = int(os.getenv("REFRESH_MAX_PER_ORG", "1"))
+
+# LLM tokens refreshes may use per rolling hour, overall and per org, counting running refreshes
+# at their reservation and finished ones at the tokens their agents actually used
+REFRESH_TOKENS_PER_HOUR = int(os.getenv("REFRESH_TOKENS_PER_HOUR", "2000000"))
+REFRESH_ORG_TOKENS_PER_HOUR = int(os.getenv("REFRESH_ORG_TOKENS_PER_HOUR", "500000"))
+
+# Tokens reserved against the budgets for each criterion an agent re-runs, until its run statistics give a budget
+REFRESH_TOKENS_PER_CRITERION = int(os.getenv("REFRESH_TOKENS_PER_CRITERION", "30000"))
+
+
+class RefreshCandidate(BaseModel):
+    org_id: str
+    supplier: Supplier
+    criteria: List[str]
+    priority: float
+
+
+# How much a refresh is worth: each due criterion counts its weight times how many TTLs overdue it is,
+# so the stalest data on the criteria that count most towards the segment goes first
+def refresh_priority(supplier: Supplier, criteria: List[Criterion], now: datetime) -> float:
+    return sum(
+        criterion.weight * (now - criterion_updated(supplier, criterion.key)) / criterion_ttl(criterion)
+        for criterion in criteria
+    )
+
+
+# Tokens to reserve for re-running the criteria, each criterion's run token budget from its recorded runs
+def reserved_tokens(criteria: List[str]) -> int:
+    return sum(run_stats.budget(criterion).max_tokens or REFRESH_TOKENS_PER_CRITERION for criterion in criteria)
+
+
+# Supplier from its stored document, raises if it doesn't parse
+def parse_supplier(data: dict) -> Supplier:
+    data = expand_supplier(data)
+    # Backfill fields missing from older supplier documents, as DB.parse_supplier does in the app
+    data["esg"].setdefault("reduction_targets", {"available": False, "summary": "", "sources": []})
+    return Supplier(**data)
+
+
+# Token use over the last hour, as [time, tokens] entries: a reservation when a refresh starts,
+# settled to the tokens its agents used once it is done
+class HourlyBudget():
+
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._spent = deque()
+
+
+    def used(self) -> int:
+        cutoff = time.monotonic() - 3600
+        while self._spent and self._spent[0][0] < cutoff:
+            self._spent.popleft()
+        return sum(tokens for _, tokens in self._spent)
+
+
+    def allows(self, tokens: int) -> bool:
+        return self.used() + tokens <= self.limit
+
+
+    def reserve(self, tokens: int) -> list:
+        entry = [time.monotonic(), tokens]
+        self._spent.append(entry)
+        return entry
+
+
+    @staticmethod
+    def settle(entry: list, tokens: int) -> None:
+        entry[1] = tokens
+
+
+# Periodically finds suppliers whose ESG data is past its TTL and refreshes them in the background,
+# stalest and most valuable first, within concurrency and hourly token budgets
+class RefreshScheduler():
+
+
+    def __init__(
+        self,
+        get_db: Callable[[], Awaitable],
+        refresh: Callable[[str, Supplier, List[str]], Awaitable[int]],
+    ) -> None:
+        self._get_db = get_db
+        self._refresh = refresh
+        self._running: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._tokens = HourlyBudget(REFRESH_TOKENS_PER_HOUR)
+        self._org_tokens: Dict[str, HourlyBudget] = {}
+
+
+    def status(self) -> dict:
+        return {
+            "running": [f"{org_id}/{supplier_id}" for org_id, supplier_id in self._running],
+            "tokens_last_hour": self._tokens.used(),
+        }
+
+
+    async def find_candidates(self) -> List[RefreshCandidate]:
+        # Suppliers with the earliest due criteria across all orgs, needs collection group indexes
+        # on suppliers.esg.refresh_due and suppliers.esg.updated
+        # Documents written before refresh_due existed are found by their oldest update instead
+        db = await self._get_db()
+        now = datetime.now(timezone.utc)
+        suppliers = db.collection_group("suppliers")
+        queries = [
+            suppliers.where("esg.refresh_due", "<=", now).order_by("esg.refresh_due").limit(REFRESH_SCAN_LIMIT),
+            suppliers.order_by("esg.updated").limit(REFRESH_SCAN_LIMIT),
+        ]
+        candidates = []
+        seen = set()
+        for query in queries:
+            async for doc in query.stream():
+                if doc.reference.path in seen:
+                    continue
+                seen.add(doc.reference.path)
+                candidate = self._candidate(doc, now)
+                if candidate:
+                    candidates.append(candidate)
+        return sorted(candidates, key=lambda candidate: candidate.priority, reverse=True)
+
+
+    @staticmethod
+    def _candidate(doc, now: datetime) -> Optional[RefreshCandidate]:
+        org_id = doc.reference.parent.parent.id
+        try:
+            supplier = parse_supplier(doc.to_dict())
+        except Exception as e:
+            print(f"Error parsing supplier {doc.id}: {e}")
+            return None
+        due = stale_criteria(supplier, now=now, include_unavailable=False)
+        if not due:
+            return None
+        return RefreshCandidate(
+            org_id=org_id,
+            supplier=supplier,
+            criteria=[criterion.key for criterion in due],
+            priority=refresh_priority(supplier, due, now),
+        )
+
+
+    def _org_budget(self, org_id: str) -> HourlyBudget:
+        if org_id not in self._org_tokens:
+            self._org_tokens[org_id] = HourlyBudget(REFRESH_ORG_TOKENS_PER_HOUR)
+        return self._org_tokens[org_id]
+
+
+    async def dispatch(self) -> List[str]:
+        # Start as many refreshes as the budgets allow, returns the suppliers started
+        started = []
+        for candidate in await self.find_candidates():
+            if len(self._running) >= REFRESH_MAX_CONCURRENT:
+                break
+            key = (candidate.org_id, candidate.supplier.id)
+            org_running = sum(1 for org_id, _ in self._running if org_id == candidate.org_id)
+            tokens = reserved_tokens(candidate.criteria)
+            org_budget = self._org_budget(candidate.org_id)
+            if key in self._running or org_running >= REFRESH_MAX_PER_ORG:
+                continue
+            if not self._tokens.allows(tokens) or not org_budget.allows(tokens):
+                continue
+            reservations = [self._tokens.reserve(tokens), org_budget.reserve(tokens)]
+            self._running[key] = asyncio.create_task(self._run(key, candidate, reservations))
+            started.append(f"{candidate.org_id}/{candidate.supplier.id}")
+        return started
+
+
+    async def _run(self, key: Tuple[str, str], candidate: RefreshCandidate, reservations: List[list]) -> None:
+        try:
+            tokens = await self._refresh(candidate.org_id, candidate.supplier, candidate.criteria)
+            # Failed refreshes keep their reservation, what they used before failing isn't known
+            for entry in reservations:
+                HourlyBudget.settle(entry, tokens)
+        except Exception as e:
+            print(f"Error refreshing supplier {key[1]}: {e}")
+        finally:
+            self._running.pop(key, None)
+
+
+    async def run(self) -> None:
+        # Scan loop, only started when REFRESH_SCAN_INTERVAL is set
+        while True:
+            try:
+                started = await self.dispatch()
+                if started:
+                    print(f"Scheduled refreshes: {started}")
+            except Exception as e:
+                print(f"Error scanning for stale suppliers: {e}")
+            await asyncio.sleep(REFRESH_SCAN_INTERVAL)
@@ -0,0 +1,132 @@
+import os
+import json
+import asyncio
+import itertools
+from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+
+
+# Agent runs (one company or one refresh each) the worker runs at once
+AGENT_SLOTS = int(os.getenv("AGENT_SLOTS", "8"))
+
+# Slots only interactive runs may use, so a new supplier never waits behind bulk or refresh work
+AGENT_RESERVED_SLOTS = int(os.getenv("AGENT_RESERVED_SLOTS", "2"))
+
+# Largest share of the slots one task may hold, so other tasks of the same class still progress
+AGENT_TASK_SHARE = float(os.getenv("AGENT_TASK_SHARE", "0.5"))
+
+# Relative share of the slots per org when several are waiting, JSON e.g. {"org_a": 2}, default 1
+AGENT_ORG_WEIGHTS = json.loads(os.getenv("AGENT_ORG_WEIGHTS") or "{}")
+
+# Job types from most to least urgent
+PRIORITIES = ["interactive", "refresh", "bulk"]
+
+
+class SlotRequest():
+
+
+    def __init__(self, kind: str, org_id: str, task_id: Optional[str], seq: int) -> None:
+        self.kind = kind
+        self.org_id = org_id
+        self.task_id = task_id
+        self.seq = seq
+        self.granted = asyncio.get_running_loop().create_future()
+
+
+# Hands out agent slots by priority class, then weighted fair share across orgs: each org has a
+# virtual clock advanced by 1 / weight per run started, and the waiting org furthest behind goes next
+class AgentSlots():
+
+
+    def __init__(
+        self,
+        slots: int = AGENT_SLOTS,
+        reserved: int = AGENT_RESERVED_SLOTS,
+        task_share: float = AGENT_TASK_SHARE,
+        org_weights: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.slots = slots
+        self.reserved = min(reserved, slots - 1)
+        self.task_cap = max(1, int(slots * task_share))
+        self.org_weights = AGENT_ORG_WEIGHTS if org_weights is None else org_weights
+        self._waiting: List[SlotRequest] = []
+        self._running: List[SlotRequest] = []
+        self._virtual: Dict[str, float] = {}
+        self._clock = 0.0
+        self._seq = itertools.count()
+
+
+    def status(self) -> dict:
+        def counts(requests: List[SlotRequest]) -> Dict[str, int]:
+            return {kind: sum(1 for request in requests if request.kind == kind) for kind in PRIORITIES}
+
+        return {
+            "slots": self.slots,
+            "running": counts(self._running),
+            "waiting": counts(self._waiting),
+        }
+
+
+    def _allowed(self, request: SlotRequest) -> bool:
+        running = len(self._running)
+        if running >= self.slots:
+            return False
+        if request.kind != "interactive" and running >= self.slots - self.reserved:
+            return False
+        if request.task_id is not None:
+            task_running = sum(1 for other in self._running if other.task_id == request.task_id)
+            if task_running >= self.task_cap:
+                return False
+        return True
+
+
+    def _org_clock(self, org_id: str) -> float:
+        # Orgs that were idle rejoin at the current clock instead of cashing in their idle time
+        return max(self._virtual.get(org_id, 0.0), self._clock)
+
+
+    def _dispatch(self) -> None:
+        # A waiter cancelled since its last check has a cancelled future but is still queued until its task runs
+        self._waiting = [request for request in self._waiting if not request.granted.done()]
+        while True:
+            allowed = [request for request in self._waiting if self._allowed(request)]
+            if not allowed:
+                return
+            request = min(allowed, key=lambda request: (
+                PRIORITIES.index(request.kind),
+                self._org_clock(request.org_id),
+                request.seq,
+            ))
+            start = self._org_clock(request.org_id)
+            self._clock = start
+            self._virtual[request.org_id] = start + 1 / self.org_weights.get(request.org_id, 1.0)
+            self._waiting.remove(request)
+            self._running.append(request)
+            request.granted.set_result(None)
+
+
+    def _release(self, request: SlotRequest) -> None:
+        if request in self._running:
+            self._running.remove(request)
+        self._dispatch()
+
+
+    @asynccontextmanager
+    async def slot(self, kind: str, org_id: str, task_id: Optional[str] = None):
+        # Waits for a slot, e.g. async with slots.slot("bulk", org_id, task_id): ...
+        if kind not in PRIORITIES:
+            raise ValueError(f"Unknown job type: {kind}")
+        request = SlotRequest(kind=kind, org_id=org_id, task_id=task_id, seq=next(self._seq))
+        self._waiting.append(request)
+        self._dispatch()
+        try:
+            await request.granted
+        except asyncio.CancelledError:
+            if request in self._waiting:
+                self._waiting.remove(request)
+            self._release(request)
+            raise
+        try:
+            yield
+        finally:
+            self._release(request)
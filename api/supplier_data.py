@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+import hashlib
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional
+from datetime import datetime, timezone
 
 class Source(BaseModel):
     key_quote: str
@@ -23,6 +24,10 @@ class ESGData(BaseModel):
     product_lca: DataSummary
     segment: str
     updated: datetime
+    # When each criterion was last researched, criteria missing here date from updated
+    criteria_updated: Dict[str, datetime] = Field(default_factory=dict)
+    # When the segment was last re-scored without new research, so mirrors syncing on updated still see it
+    segment_updated: Optional[datetime] = None
 
 
 class Supplier(BaseModel):
@@ -37,4 +42,69 @@ class Supplier(BaseModel):
 class AgentSupplier(BaseModel):
     name: str
     website: Optional[str] = None
-    description: Optional[str] = None
\ No newline at end of file
+    description: Optional[str] = None
+
+
+# Names of the ESGData fields holding a DataSummary for one criterion
+ESG_CRITERIA = [
+    "scope_1",
+    "scope_2",
+    "scope_3",
+    "ecovadis",
+    "reduction_targets",
+    "iso_14001",
+    "product_lca",
+]
+
+
+# When anything stored about a supplier's ESG data last changed, its research or a re-scored segment
+def supplier_changed(supplier: Supplier) -> datetime:
+    times = [supplier.esg.updated, supplier.esg.segment_updated or supplier.esg.updated]
+    return max(value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in times)
+
+
+# Supplier documents are stored in a compact form: each source link is kept once per supplier in a
+# source table keyed by a hash of the URL, with its distinct quotes, and each criterion refers to
+# them as {"source": id, "quote": index}. The same report is often cited for several criteria.
+def source_id(link: str) -> str:
+    return hashlib.sha1(link.encode("utf-8")).hexdigest()[:12]
+
+
+# Serialize a supplier into its compact storage form
+def compact_supplier(supplier: Supplier) -> dict:
+    data = supplier.model_dump()
+    source_table = {}
+    for criterion in ESG_CRITERIA:
+        summary = data["esg"].get(criterion)
+        if summary is None:
+            continue
+        refs = []
+        for source in summary["sources"]:
+            sid = source_id(source["link"])
+            entry = source_table.setdefault(sid, {"link": source["link"], "quotes": []})
+            if source["key_quote"] not in entry["quotes"]:
+                entry["quotes"].append(source["key_quote"])
+            refs.append({"source": sid, "quote": entry["quotes"].index(source["key_quote"])})
+        summary["sources"] = refs
+    data["source_table"] = source_table
+    return data
+
+
+# Expand stored supplier data back into the Supplier shape
+# Documents written before the compact form have no source table and are returned unchanged
+def expand_supplier(data: dict) -> dict:
+    source_table = data.pop("source_table", None)
+    if source_table is None:
+        return data
+    for criterion in ESG_CRITERIA:
+        summary = data["esg"].get(criterion)
+        if summary is None:
+            continue
+        summary["sources"] = [
+            {
+                "key_quote": source_table[ref["source"]]["quotes"][ref["quote"]],
+                "link": source_table[ref["source"]]["link"],
+            }
+            for ref in summary["sources"]
+        ]
+    return data
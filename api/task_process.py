@@ -1,57 +1,169 @@
 # main.py
+import time
+_IMPORT_STARTED = time.perf_counter()
 
-from fastapi import FastAPI, HTTPException
-from google.cloud import secretmanager
-from google.oauth2 import service_account
-from google.cloud import firestore
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from datetime import datetime
-from compositeai.tools import GoogleSerperApiTool, WebScrapeTool
-from compositeai.drivers import OpenAIDriver
-from compositeai.agents import AgentResult
 from pydantic import BaseModel
+from typing import Callable, List, Optional
+import asyncio
 import pytz
 import os
 import uuid
 import json
-from supplier_data import DataSummary, ESGData, Supplier, AgentSupplier
-from agent import Agent
+from supplier_data import ESGData, Supplier, DataSummary
+from criteria import CRITERIA, BASIC_INFO, CRITERION_TIMEOUT, COMPANY_TIMEOUT, company_task_prefix, inconclusive, supplier_document
+from aggregates import aggregate_diff
+from scheduler import RefreshScheduler, REFRESH_SCAN_INTERVAL, parse_supplier
+from esg_history import esg_state, esg_delta, history_entries
+from scoring import segment_for
+from slots import AgentSlots, PRIORITIES
+from events import events, step_content
+from run_stats import run_stats, CriterionBudget
+from progress import ProgressWriter
 
 load_dotenv()
  
 app = FastAPI()
 
-# Initialize Firestore client
-async def initialize_firestore():
-    GCLOUD_PROJECT_NUMBER = os.getenv("GCLOUD_PROJECT_NUMBER")
-    FIREBASE_SA_SECRET_NAME = os.getenv("FIREBASE_SA_SECRET_NAME")
+# Seconds spent in each startup phase, reported by /healthz
+STARTUP_TIMINGS = {}
+
+_db = None
+_db_lock = asyncio.Lock()
 
-    # Create credentials object then initialize the firebase admin client
-    client = secretmanager.SecretManagerServiceClient()
-    name = client.secret_version_path(project=GCLOUD_PROJECT_NUMBER, secret=FIREBASE_SA_SECRET_NAME, secret_version="latest")
-    response = client.access_secret_version(name=name)
-    service_account_info = json.loads(response.payload.data.decode('UTF-8'))
+# Agent runs of every job type share these slots, by priority and fair share across orgs
+slots = AgentSlots()
 
-    # Create credentials object
-    credentials = service_account.Credentials.from_service_account_info(service_account_info)
+# Load Firestore credentials from a local key file or the environment when available,
+# and only fall back to fetching the service account from Secret Manager
+def load_credentials():
+    from google.oauth2 import service_account
+
+    FIREBASE_SA_FILE = os.getenv("FIREBASE_SA_FILE")
+    FIREBASE_SA_JSON = os.getenv("FIREBASE_SA_JSON")
+    GCLOUD_PROJECT_NUMBER = os.getenv("GCLOUD_PROJECT_NUMBER")
+    FIREBASE_SA_SECRET_NAME = os.getenv("FIREBASE_SA_SECRET_NAME")
 
-    # Initialize Firestore client with the credentials
-    return firestore.AsyncClient(credentials=credentials)
+    if FIREBASE_SA_FILE and os.path.exists(FIREBASE_SA_FILE):
+        return service_account.Credentials.from_service_account_file(FIREBASE_SA_FILE)
+    if FIREBASE_SA_JSON:
+        return service_account.Credentials.from_service_account_info(json.loads(FIREBASE_SA_JSON))
+    if FIREBASE_SA_SECRET_NAME:
+        from google.cloud import secretmanager
+
+        client = secretmanager.SecretManagerServiceClient()
+        name = client.secret_version_path(project=GCLOUD_PROJECT_NUMBER, secret=FIREBASE_SA_SECRET_NAME, secret_version="latest")
+        response = client.access_secret_version(name=name)
+        service_account_info = json.loads(response.payload.data.decode('UTF-8'))
+        return service_account.Credentials.from_service_account_info(service_account_info)
+    # Otherwise use the service's default credentials
+    return None
+
+
+# Initialize Firestore client once, on first use, and reuse it for every request
+async def get_db():
+    global _db
+    if _db is None:
+        async with _db_lock:
+            if _db is None:
+                started = time.perf_counter()
+                from google.cloud import firestore
+
+                # Credential loading blocks on the network, so keep it off the event loop
+                credentials = await asyncio.to_thread(load_credentials)
+                _db = firestore.AsyncClient(credentials=credentials)
+                STARTUP_TIMINGS["firestore"] = round(time.perf_counter() - started, 3)
+    return _db
+
+
+# Throttled progress write-back to the company documents of running tasks
+progress = ProgressWriter(get_db=get_db)
+
+
+# Load the Firestore client and agent stack in the background after the server starts listening,
+# so health checks are answered straight away and the first task does not pay for it
+async def warm_up():
+    try:
+        await get_db()
+    except Exception as e:
+        print(f"Error initializing Firestore: {e}")
+    started = time.perf_counter()
+    await asyncio.to_thread(__import__, "agent")
+    STARTUP_TIMINGS["agent"] = round(time.perf_counter() - started, 3)
+    print(f"Startup timings (s): {STARTUP_TIMINGS}")
 
 
-# Use this in your FastAPI app startup
 @app.on_event("startup")
 async def startup_event():
-    global db
-    db = await initialize_firestore()
+    # Threads for every agent slot plus a few for Firestore and batch calls, the default pool is sized by CPU count
+    from concurrent.futures import ThreadPoolExecutor
+
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=slots.slots + 4))
+    app.state.warm_up = asyncio.create_task(warm_up())
+    app.state.progress = asyncio.create_task(progress.run())
+    if REFRESH_SCAN_INTERVAL > 0:
+        app.state.scheduler = asyncio.create_task(scheduler.run())
+    if int(os.getenv("BATCH_POLL_INTERVAL", "60")) > 0:
+        app.state.batches = asyncio.create_task(batch_loop())
+
+
+# Submit whatever is queued for batching rather than lose it when the instance stops
+@app.on_event("shutdown")
+async def shutdown_event():
+    try:
+        await flush_batch()
+    except Exception as e:
+        print(f"Error submitting queued batch: {e}")
+
+
+@app.get("/healthz")
+async def healthz():
+    return {
+        "status": "ok",
+        "ready": _db is not None,
+        "startup": STARTUP_TIMINGS,
+    }
+
+
+# Change in counts applied to its org's aggregate document, mirrors DB._add_aggregate_diff in the app
+def org_aggregate_update(diff: dict) -> dict:
+    from google.cloud import firestore
+
+    update = {"updated": firestore.SERVER_TIMESTAMP}
+    if "total" in diff:
+        update["total"] = firestore.Increment(diff["total"])
+    for group in ("segments", "available"):
+        if group in diff:
+            update[group] = {key: firestore.Increment(change) for key, change in diff[group].items()}
+    return update
 
 
 # HELPER COMPONENT
 # Runs structured output agent to process a task and display expander of results
 # e.g. "Find scope 1 emissions for company"
-def supplier_obtain_esg_data(label: str, task: str, response_format: BaseModel) -> BaseModel:
+def supplier_obtain_esg_data(
+    label: str,
+    task: str,
+    response_format: BaseModel,
+    driver=None,
+    emit: Optional[Callable[[str, dict], None]] = None,
+    cancel_token=None,
+    key: Optional[str] = None,
+    evidence=None,
+    runs: Optional[list] = None,
+) -> BaseModel:
+    from agent import Agent, CancelToken
+    from compositeai.tools import GoogleSerperApiTool, WebScrapeTool
+    from compositeai.drivers import OpenAIDriver
+    from compositeai.agents import AgentResult
+
+    # Criteria with enough past runs get iteration and token budgets sized from them
+    budget = run_stats.budget(key) if key else CriterionBudget()
     agent = Agent(
-        driver=OpenAIDriver(
+        driver=driver or OpenAIDriver(
             model="gpt-4o-mini", 
             seed=1337,
         ),
@@ -67,119 +179,483 @@ def supplier_obtain_esg_data(label: str, task: str, response_format: BaseModel)
             WebScrapeTool(),
             GoogleSerperApiTool(),
         ],
-        max_iterations=20,
+        max_iterations=budget.max_iterations,
+        token_budget=budget.max_tokens,
+        evidence=evidence,
         response_format=response_format,
+        cancel_token=(cancel_token or CancelToken()).child(timeout=CRITERION_TIMEOUT),
     )
+    started = time.perf_counter()
     for chunk in agent.execute(task, stream=True):
         if isinstance(chunk, AgentResult):
             agent_result = chunk.content
+        elif emit:
+            emit("step", {"criterion": label, "content": step_content(chunk.content)})
+    if emit:
+        emit("criterion_completed", {"criterion": label, "available": getattr(agent_result, "available", None)})
+    # Callers counting the tokens their runs used get each run's stats
+    if runs is not None and agent.last_run:
+        runs.append(agent.last_run)
+    # Deferred batch outputs are not known yet, so those runs are not recorded
+    if key and agent.last_run and agent_result is not None:
+        run_stats.record(
+            criterion=key,
+            iterations=agent.last_run.iterations,
+            tokens=agent.last_run.tokens,
+            available=isinstance(agent_result, BaseModel) and getattr(agent_result, "available", True),
+            stopped=agent.last_run.stopped,
+            seconds=time.perf_counter() - started,
+        )
     return agent_result
 
 
-async def process_company(company_ref, org_id: str):
+# Research a company with the ESG agents, blocking, so it is run off the event loop
+def research_company(
+    company_name: str,
+    company_id: str,
+    emit: Optional[Callable[[str, dict], None]] = None,
+    cancel_token=None,
+) -> Supplier:
+    task_prefix = company_task_prefix(name=company_name)
+    data_basic_info = supplier_obtain_esg_data(
+        label=BASIC_INFO.label,
+        task=BASIC_INFO.task(task_prefix),
+        response_format=BASIC_INFO.response_format,
+        emit=emit,
+        cancel_token=cancel_token,
+        key=BASIC_INFO.key,
+    )
+    results = {}
+    for criterion in CRITERIA:
+        # Criteria not started before the company's budget ran out or its task was cancelled are skipped
+        if cancel_token is not None and cancel_token.cancelled:
+            break
+        results[criterion.key] = supplier_obtain_esg_data(
+            label=criterion.label,
+            task=criterion.task(task_prefix),
+            response_format=criterion.response_format,
+            emit=emit,
+            cancel_token=cancel_token,
+            key=criterion.key,
+            evidence=criterion.detector(name=company_name, website=data_basic_info.website),
+        )
+    return build_supplier(company_id, data_basic_info, results)
+
+
+# Supplier for a newly researched company from its basic info and criterion results,
+# criteria without a result have no data available and are re-run by the next refresh
+def build_supplier(company_id: str, data_basic_info: BaseModel, results: dict) -> Supplier:
+    now = datetime.now(pytz.timezone('Europe/London'))
+    missing = {
+        criterion.key: DataSummary(available=False, summary="", sources=[])
+        for criterion in CRITERIA
+        if criterion.key not in results
+    }
+    esg = ESGData(
+        **results,
+        **missing,
+        segment="",
+        updated=now,
+        criteria_updated={key: now for key in results},
+    )
+    esg.segment = segment_for(esg)
+    return Supplier(
+        id=company_id,
+        name=data_basic_info.name,
+        website=data_basic_info.website,
+        description=data_basic_info.description,
+        esg=esg,
+    )
+
+
+# Re-research the given criteria of a stored supplier, blocking, so it is run off the event loop
+def research_refresh(
+    supplier: Supplier,
+    criteria: List[str],
+    emit: Optional[Callable[[str, dict], None]] = None,
+    cancel_token=None,
+    runs: Optional[list] = None,
+) -> Supplier:
+    supplier = supplier.model_copy(deep=True)
+    task_prefix = company_task_prefix(
+        name=supplier.name,
+        website=supplier.website,
+        description=supplier.description,
+        notes=supplier.notes,
+    )
+    now = datetime.now(pytz.timezone('Europe/London'))
+    runs = runs if runs is not None else []
+    for criterion in CRITERIA:
+        if criterion.key not in criteria:
+            continue
+        # Criteria not reached within the budget keep their stored data
+        if cancel_token is not None and cancel_token.cancelled:
+            break
+        started_runs = len(runs)
+        data = supplier_obtain_esg_data(
+            label=criterion.label,
+            task=criterion.task(task_prefix),
+            response_format=criterion.response_format,
+            emit=emit,
+            cancel_token=cancel_token,
+            key=criterion.key,
+            evidence=criterion.detector(name=supplier.name, website=supplier.website),
+            runs=runs,
+        )
+        # A run stopped before it found anything keeps the stored data, and the criterion stays due
+        if inconclusive(data, len(runs) > started_runs and runs[-1].stopped):
+            continue
+        setattr(supplier.esg, criterion.key, data)
+        supplier.esg.criteria_updated[criterion.key] = now
+    supplier.esg.segment = segment_for(supplier.esg)
+    supplier.esg.updated = now
+    return supplier
+
+
+# Refresh a supplier and save it with its history entry and aggregate counts, used by the scheduler
+# Returns the tokens its agents used, which the scheduler settles its token budgets with
+async def refresh_supplier(org_id: str, supplier: Supplier, criteria: List[str]) -> int:
+    emit = events.emitter(supplier.id, org_id=org_id)
+    emit("refresh_started", {"criteria": criteria})
+    runs = []
+    async with slots.slot("refresh", org_id):
+        from agent import CancelToken
+
+        refreshed = await asyncio.to_thread(research_refresh, supplier, criteria, emit, CancelToken(timeout=COMPANY_TIMEOUT), runs)
+    tokens = sum(run.tokens for run in runs)
+    from google.cloud import firestore
+
+    # Criteria this run researched, ones it didn't reach keep what is stored
+    researched = [
+        key for key in criteria
+        if refreshed.esg.criteria_updated.get(key) != supplier.esg.criteria_updated.get(key)
+    ]
+    db = await get_db()
+    supplier_ref = db.document(f"orgs/{org_id}/suppliers/{supplier.id}")
+
+    # The supplier is read again in the same transaction as the writes, so a concurrent write of it
+    # (an app job, a task) makes this retry instead of recording wrong history and counts
+    @firestore.async_transactional
+    async def write(transaction) -> Optional[Supplier]:
+        current_doc = await supplier_ref.get(transaction=transaction)
+        if not current_doc.exists:
+            return None
+        current = parse_supplier(current_doc.to_dict())
+        updated = merge_refresh(current, refreshed, researched)
+        # Suppliers saved before the history existed get a base entry of their previous state first
+        has_history = bool(await supplier_ref.collection("history").limit(1).get(transaction=transaction))
+        transaction.update(supplier_ref, supplier_document(updated))
+        for entry in history_entries(esg_state(current), esg_state(updated), has_history):
+            transaction.set(supplier_ref.collection("history").document(), entry)
+        diff = aggregate_diff(current, updated)
+        if diff:
+            transaction.set(db.document(f"orgs/{org_id}/aggregates/esg"), org_aggregate_update(diff), merge=True)
+        return updated
+
+    updated = await write(db.transaction())
+    if updated is None:
+        emit("refresh_completed", {"status": "deleted"})
+        return tokens
+    emit("refresh_completed", {"segment": updated.esg.segment})
+    return tokens
+
+
+# The stored supplier with the criteria a refresh researched replaced by its results
+def merge_refresh(current: Supplier, refreshed: Supplier, researched: List[str]) -> Supplier:
+    updated = current.model_copy(deep=True)
+    for key in researched:
+        setattr(updated.esg, key, getattr(refreshed.esg, key))
+        updated.esg.criteria_updated[key] = refreshed.esg.criteria_updated[key]
+    updated.esg.segment = segment_for(updated.esg)
+    updated.esg.updated = refreshed.esg.updated
+    return updated
+
+
+scheduler = RefreshScheduler(get_db=get_db, refresh=refresh_supplier)
+
+
+# Save a newly researched supplier with its first history entry and aggregate counts,
+# then mark its company in the task as done
+async def save_new_supplier(company_ref, org_id: str, supplier: Supplier) -> None:
+    db = await get_db()
+    supplier_ref = db.document(f"orgs/{org_id}/suppliers/{supplier.id}")
+    batch = db.batch()
+    batch.set(supplier_ref, supplier_document(supplier))
+    batch.set(supplier_ref.collection("history").document(), esg_delta(None, esg_state(supplier)))
+    batch.set(db.document(f"orgs/{org_id}/aggregates/esg"), org_aggregate_update(aggregate_diff(None, supplier)), merge=True)
+    await batch.commit()
+    await company_ref.update({
+        'processed': True,
+        'status': 'success'
+    })
+
+
+# Seconds between checks of a running task's document for a cancellation made elsewhere, e.g. the app
+TASK_CANCEL_POLL = 10
+
+# Cancel tokens of the tasks with companies running on this instance, with how many are running
+_task_tokens = {}
+_task_running = {}
+_task_watchers = {}
+
+
+def acquire_task_token(task_id: str):
+    from agent import CancelToken
+
+    if task_id not in _task_tokens:
+        _task_tokens[task_id] = CancelToken()
+        _task_watchers[task_id] = asyncio.create_task(watch_task_cancel(task_id))
+    _task_running[task_id] = _task_running.get(task_id, 0) + 1
+    return _task_tokens[task_id]
+
+
+def release_task_token(task_id: str) -> None:
+    _task_running[task_id] -= 1
+    if not _task_running[task_id]:
+        del _task_running[task_id]
+        del _task_tokens[task_id]
+        _task_watchers.pop(task_id).cancel()
+
+
+async def watch_task_cancel(task_id: str) -> None:
+    while True:
+        await asyncio.sleep(TASK_CANCEL_POLL)
+        try:
+            db = await get_db()
+            task_doc = await db.collection('tasks').document(task_id).get()
+            if (task_doc.to_dict() or {}).get('cancelled') and task_id in _task_tokens:
+                _task_tokens[task_id].cancel()
+                return
+        except Exception as e:
+            print(f"Error checking task {task_id} for cancellation: {e}")
+
+
+async def process_company(company_ref, org_id: str, task_id: str, kind: str = "bulk"):
     """Process a single company name and update the Firestore document."""
+    emit = progress.tracked(company_ref.path, events.emitter(task_id, company_doc_id=company_ref.id))
+    task_token = acquire_task_token(task_id)
     try:
         company_doc = await company_ref.get()
         company_data = company_doc.to_dict()
         company_name = company_data.get('name', '')
         company_id = str(uuid.uuid4())
 
-        task_prefix = f"""
-        Given the following info about a company:
-            Name - {company_name}
-        """
-        esg_score = 0
-
-        task_basic_info = task_prefix + """
-        \nUse the web to find a URL to the company's website and come up with your best description on what this company does.
-        """
-        data_basic_info = supplier_obtain_esg_data(label="Basic Information", task=task_basic_info, response_format=AgentSupplier)
-
-        task_scope_1 = task_prefix + """
-        \nPlease find any data on THEIR OWN scope 1 emissions calculations.
-        Scope 1 emissions are direct emissions from sources owned or controlled by a company.
-        These include things like: on-site energy, fleet vehicles, process emissions, or accidental emissions.
-        ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 1" DATA.
-        """
-        data_scope_1 = supplier_obtain_esg_data(label="Scope 1 Emissions", task=task_scope_1, response_format=DataSummary)
-        esg_score += 1 if data_scope_1.available else 0
-
-        task_scope_2 = task_prefix + f"""
-        Please find any data on THEIR OWN scope 2 emissions calculations.
-        Scope 2 emissions are indirect greenhouse gas (GHG) emissions that result from the generation of energy that an organization purchases and uses.
-        These include things like the purchase of electricity from: steam, heat, cooling, etc.
-        ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 2" DATA.
-        """
-        data_scope_2 = supplier_obtain_esg_data(label="Scope 2 Emissions", task=task_scope_2, response_format=DataSummary)
-        esg_score += 1 if data_scope_2.available else 0
-
-        task_scope_3 = task_prefix + """
-        Please find any data on THEIR OWN scope 3 emissions calculations.
-        Scope 3 emissions are greenhouse gas (GHG) emissions that are a result of activities that a company indirectly affects as part of its value chain, but that are not owned or controlled by the company.
-        These include things like: supply chain emissions, use of sold products, waste disposal, employee travel, contracted waste disposal, etc.
-        ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 3" DATA.
-        """
-        data_scope_3 = supplier_obtain_esg_data(label="Scope 3 Emissions", task=task_scope_3, response_format=DataSummary)
-        esg_score += 1 if data_scope_3.available else 0
-
-        task_ecovadis = task_prefix + "\nPlease find if this company has a publicly available Ecovadis score."
-        data_ecovadis = supplier_obtain_esg_data(label="Ecovadis Score", task=task_ecovadis, response_format=DataSummary)
-        esg_score += 1 if data_ecovadis.available else 0
-
-        task_reduction_targets = task_prefix + "\nPlease find if this company has set any carbon emissions reduction targets."
-        data_reduction_targets = supplier_obtain_esg_data(label="Reduction Targets", task=task_reduction_targets, response_format=DataSummary)
-        esg_score += 1 if data_reduction_targets.available else 0
-
-        task_iso_14001 = task_prefix + "\nPlease find if this company has an ISO 14001 certification."
-        data_iso_14001 = supplier_obtain_esg_data(label="ISO 14001 Certification", task=task_iso_14001, response_format=DataSummary)
-        esg_score += 1 if data_iso_14001.available else 0
-
-        task_product_lca = task_prefix + "\nPlease find if this company has any products undergoing a Life Cycle Assessment, or LCA."
-        data_product_lca = supplier_obtain_esg_data(label="Product LCAs", task=task_product_lca, response_format=DataSummary)
-        esg_score += 1 if data_product_lca.available else 0
-
-        if esg_score <= 2:
-            segment = "Low"
-        elif esg_score <= 5:
-            segment = "Medium"
-        else:
-            segment = "High"
-
-        processed_supplier = Supplier(
-            id=company_id,
-            name=data_basic_info.name,
-            website=data_basic_info.website,
-            description=data_basic_info.description,
-            esg=ESGData(
-                scope_1=data_scope_1,
-                scope_2=data_scope_2,
-                scope_3=data_scope_3,
-                ecovadis=data_ecovadis,
-                reduction_targets=data_reduction_targets,
-                iso_14001=data_iso_14001,
-                product_lca=data_product_lca,
-                segment=segment,
-                updated=datetime.now(pytz.timezone('Europe/London')),
-            )
-        )
+        # Agents run in a worker thread so health checks and other requests are still served
+        async with slots.slot(kind, org_id, task_id):
+            # Companies still waiting for a slot when their task is cancelled are never started
+            if task_token.cancelled:
+                emit("company_completed", {"status": "cancelled"})
+                await company_ref.update({'processed': True, 'status': 'cancelled'})
+                return None
+            emit("company_started", {"name": company_name})
+            progress.start(company_ref.path)
+            try:
+                # A company cancelled or out of time part way through is saved with what was found
+                company_token = task_token.child(timeout=COMPANY_TIMEOUT)
+                processed_supplier = await asyncio.to_thread(research_company, company_name, company_id, emit, company_token)
+            finally:
+                progress.finish(company_ref.path)
+        await save_new_supplier(company_ref, org_id, processed_supplier)
+        emit("company_completed", {"status": "success", "supplier_id": company_id})
+        return processed_supplier.dict()
 
-        supplier_ref = db.document(f"orgs/{org_id}/suppliers/{company_id}")
-        supplier_dict = processed_supplier.model_dump()
-        await supplier_ref.set(supplier_dict)
+    except Exception as e:
+        emit("company_completed", {"status": "error", "error_message": str(e)})
+        # Update the Firestore document with error status
         await company_ref.update({
             'processed': True,
-            'status': 'success'
+            'status': 'error',
+            'error_message': str(e)
         })
-        return processed_supplier.dict()
+        return None
+    finally:
+        release_task_token(task_id)
+
+
+# BATCH MODE
+# Research runs as usual, but each criterion's structured output call is queued here and sent
+# in one batch for many companies, the suppliers are saved once the batch has completed
+_batch_requests = []
+_batch_companies = {}
+_batch_oldest = None
+_batch_lock = asyncio.Lock()
+
+
+# Research a company with output calls deferred, blocking, returns {criterion key: request body}
+def research_company_deferred(company_name: str, cancel_token=None) -> dict:
+    from batch import DeferredOutputDriver
+    from compositeai.drivers import OpenAIDriver
+
+    task_prefix = company_task_prefix(name=company_name)
+    # One driver for the whole company, each criterion's output call is the one it adds
+    driver = DeferredOutputDriver(driver=OpenAIDriver(model="gpt-4o-mini", seed=1337))
+    bodies = {}
+    for criterion in [BASIC_INFO] + CRITERIA:
+        if cancel_token is not None and cancel_token.cancelled:
+            break
+        deferred = len(driver.deferred)
+        supplier_obtain_esg_data(
+            label=criterion.label,
+            task=criterion.task(task_prefix),
+            response_format=criterion.response_format,
+            driver=driver,
+            cancel_token=cancel_token,
+            key=criterion.key,
+            evidence=criterion.detector(name=company_name),
+        )
+        if len(driver.deferred) > deferred:
+            bodies[criterion.key] = driver.deferred[-1]
+    return bodies
+
+
+async def defer_company(company_ref, task_doc_id: str, company_doc_id: str, org_id: str) -> str:
+    from batch import BatchRequest, BATCH_FLUSH_COMPANIES
+    global _batch_oldest
 
+    task_token = acquire_task_token(task_doc_id)
+    try:
+        company_doc = await company_ref.get()
+        company_name = company_doc.to_dict().get('name', '')
+        async with slots.slot("bulk", org_id, task_doc_id):
+            # Companies still waiting for a slot when their task is cancelled are never started
+            if not task_token.cancelled:
+                company_token = task_token.child(timeout=COMPANY_TIMEOUT)
+                bodies = await asyncio.to_thread(research_company_deferred, company_name, company_token)
+        # Nothing of a company whose task was cancelled goes into a batch
+        if task_token.cancelled:
+            await company_ref.update({'processed': True, 'status': 'cancelled'})
+            return 'cancelled'
+        if BASIC_INFO.key not in bodies:
+            raise ValueError("Agent did not reach its output step")
     except Exception as e:
-        # Update the Firestore document with error status
         await company_ref.update({
             'processed': True,
             'status': 'error',
             'error_message': str(e)
         })
+        return 'error'
+    finally:
+        release_task_token(task_doc_id)
+
+    key = f"{task_doc_id}:{company_doc_id}"
+    async with _batch_lock:
+        for criterion_key, body in bodies.items():
+            _batch_requests.append(BatchRequest(custom_id=f"{key}:{criterion_key}", body=body))
+        _batch_companies[key] = {
+            "task_doc_id": task_doc_id,
+            "company_doc_id": company_doc_id,
+            "org_id": org_id,
+            "company_id": str(uuid.uuid4()),
+        }
+        _batch_oldest = _batch_oldest or time.monotonic()
+        full = len(_batch_companies) >= BATCH_FLUSH_COMPANIES
+    await company_ref.update({'status': 'batched'})
+    if full:
+        await flush_batch()
+    return 'batched'
+
+
+# Submit the queued requests as one batch and record it in Firestore for polling
+async def flush_batch(force: bool = True):
+    from google.cloud import firestore
+    from batch import batch_client, LLM_BATCH_BACKEND, BATCH_FLUSH_SECONDS
+    global _batch_requests, _batch_companies, _batch_oldest
+
+    async with _batch_lock:
+        if not _batch_companies:
+            return None
+        if not force and time.monotonic() - _batch_oldest < BATCH_FLUSH_SECONDS:
+            return None
+        batch_requests, companies, oldest = _batch_requests, _batch_companies, _batch_oldest
+        _batch_requests, _batch_companies, _batch_oldest = [], {}, None
+
+    batch_id = None
+    try:
+        batch_id = await asyncio.to_thread(batch_client().submit, batch_requests)
+        db = await get_db()
+        await db.collection('batches').document(batch_id).set({
+            'status': 'submitted',
+            'backend': LLM_BATCH_BACKEND,
+            'companies': companies,
+            'created': firestore.SERVER_TIMESTAMP,
+        })
+    except Exception as e:
+        # Back in the queue for the next flush, a batch submitted but not recorded is never polled
+        print(f"Error submitting batch {batch_id or ''} for {len(companies)} companies, requeued: {e}")
+        async with _batch_lock:
+            _batch_requests = batch_requests + _batch_requests
+            _batch_companies = {**companies, **_batch_companies}
+            _batch_oldest = min(oldest, _batch_oldest or oldest)
         return None
+    print(f"Submitted batch {batch_id} for {len(companies)} companies")
+    return batch_id
+
+
+# Save the suppliers of a completed batch, companies missing their basic info are marked as errors
+# and criteria missing their output are saved without data
+# Companies already saved are skipped, so a merge interrupted part way can be run again
+async def merge_batch(batch_id: str, companies: dict, outputs: dict) -> None:
+    db = await get_db()
+    for key, company in companies.items():
+        company_ref = db.document(f"tasks/{company['task_doc_id']}/companies/{company['company_doc_id']}")
+        try:
+            if ((await company_ref.get()).to_dict() or {}).get('status') == 'success':
+                continue
+            results = {}
+            for criterion in [BASIC_INFO] + CRITERIA:
+                content = outputs.get(f"{key}:{criterion.key}")
+                if content:
+                    results[criterion.key] = criterion.response_format.model_validate_json(content)
+            if BASIC_INFO.key not in results:
+                raise ValueError(f"No basic info in batch {batch_id}")
+            data_basic_info = results.pop(BASIC_INFO.key)
+            supplier = build_supplier(company['company_id'], data_basic_info, results)
+            await save_new_supplier(company_ref, company['org_id'], supplier)
+        except Exception as e:
+            await company_ref.update({
+                'processed': True,
+                'status': 'error',
+                'error_message': str(e)
+            })
+
+
+# Check submitted batches, merging completed ones and failing the companies of dead ones
+async def poll_batches() -> dict:
+    from batch import batch_client
+
+    db = await get_db()
+    client = batch_client()
+    statuses = {}
+    async for doc in db.collection('batches').where('status', '==', 'submitted').stream():
+        status = await asyncio.to_thread(client.status, doc.id)
+        statuses[doc.id] = status
+        companies = doc.to_dict().get('companies', {})
+        if status == 'completed':
+            outputs = await asyncio.to_thread(client.results, doc.id)
+            await merge_batch(doc.id, companies, outputs)
+            await doc.reference.update({'status': 'merged'})
+        elif status in ('failed', 'expired', 'cancelled'):
+            for company in companies.values():
+                await db.document(f"tasks/{company['task_doc_id']}/companies/{company['company_doc_id']}").update({
+                    'processed': True,
+                    'status': 'error',
+                    'error_message': f"Batch {doc.id} {status}"
+                })
+            await doc.reference.update({'status': status})
+    return statuses
+
+
+# Batch loop, flushes queued companies once the oldest has waited long enough and polls batches
+async def batch_loop():
+    from batch import BATCH_POLL_INTERVAL
+
+    while True:
+        try:
+            await flush_batch(force=False)
+            await poll_batches()
+        except Exception as e:
+            print(f"Error processing batches: {e}")
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
 
 
 @app.post("/task_upload")
@@ -192,15 +668,122 @@ async def task_upload(data: dict):
 
     try:
         # Get the task document reference
+        db = await get_db()
         task_doc_ref = db.collection('tasks').document(task_doc_id)
 
         # Get the company document reference
         company_ref = task_doc_ref.collection('companies').document(company_doc_id)
 
-        # Process the company
-        result = await process_company(company_ref, org_id)
+        # Bulk tasks uploaded in batch mode have their final LLM calls sent through the batch API
+        task_data = (await task_doc_ref.get()).to_dict() or {}
+        if task_data.get('cancelled'):
+            await company_ref.update({'processed': True, 'status': 'cancelled'})
+            return {'company': company_doc_id, 'result': 'cancelled'}
+        if task_data.get('mode') == 'batch':
+            result = await defer_company(company_ref, task_doc_id, company_doc_id, org_id)
+            return {'company': company_doc_id, 'result': result}
+
+        # Process the company, tasks are bulk work unless created with another priority
+        kind = task_data.get('priority') if task_data.get('priority') in PRIORITIES else 'bulk'
+        result = await process_company(company_ref, org_id, task_doc_id, kind)
 
         return {'company': company_doc_id, 'result': result}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing company: {str(e)}")
+
+
+# Start refreshes of stale suppliers within the budgets, for Cloud Scheduler when the scan loop is off
+@app.post("/refresh_scan")
+async def refresh_scan():
+    try:
+        started = await scheduler.dispatch()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error scanning for stale suppliers: {str(e)}")
+    return {"started": started, **scheduler.status()}
+
+
+# Flush due companies and check batches, for Cloud Scheduler when BATCH_POLL_INTERVAL is 0
+@app.post("/batch_poll")
+async def batch_poll():
+    try:
+        submitted = await flush_batch(force=False)
+        statuses = await poll_batches()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing batches: {str(e)}")
+    return {"submitted": submitted, "batches": statuses, "queued": len(_batch_companies)}
+
+
+@app.get("/refresh_status")
+async def refresh_status():
+    return scheduler.status()
+
+
+# Tasks and suppliers are only reachable with the id of the org they belong to,
+# ones of other orgs are reported as not found so their existence is not given away
+async def check_task_org(task_id: str, org_id: str) -> None:
+    db = await get_db()
+    task_doc = await db.collection('tasks').document(task_id).get()
+    if not task_doc.exists or (task_doc.to_dict() or {}).get('org_id') != org_id:
+        raise HTTPException(status_code=404, detail="Task not found.")
+
+
+async def check_supplier_org(supplier_id: str, org_id: str) -> None:
+    db = await get_db()
+    supplier_doc = await db.document(f"orgs/{org_id}/suppliers/{supplier_id}").get()
+    if not supplier_doc.exists:
+        raise HTTPException(status_code=404, detail="Supplier not found.")
+
+
+# Stop a task: companies not yet started are skipped, running ones stop at their next agent step
+# and are saved with what they found, other instances see the flag on the task document
+@app.post("/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str, org_id: str):
+    await check_task_org(task_id, org_id)
+    try:
+        db = await get_db()
+        await db.collection('tasks').document(task_id).update({'cancelled': True})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error cancelling task: {str(e)}")
+    if task_id in _task_tokens:
+        _task_tokens[task_id].cancel()
+    return {"task": task_id, "running": _task_running.get(task_id, 0)}
+
+
+# Event id a reconnecting client has seen up to, 0 when the header is missing or not an id
+def last_event_id(request: Request) -> int:
+    try:
+        return max(0, int(request.headers.get("last-event-id") or 0))
+    except ValueError:
+        return 0
+
+
+# Live progress of a task's companies as server-sent events: company_started, step,
+# criterion_completed and company_completed, resuming after the Last-Event-ID header on reconnect
+@app.get("/tasks/{task_id}/events")
+async def task_events(task_id: str, org_id: str, request: Request):
+    await check_task_org(task_id, org_id)
+    last_id = last_event_id(request)
+    return StreamingResponse(events.stream(task_id, last_id), media_type="text/event-stream")
+
+
+# Live progress of a supplier's scheduled refresh, as for tasks with refresh_started and refresh_completed
+@app.get("/suppliers/{supplier_id}/events")
+async def supplier_events(supplier_id: str, org_id: str, request: Request):
+    await check_supplier_org(supplier_id, org_id)
+    last_id = last_event_id(request)
+    return StreamingResponse(events.stream(supplier_id, last_id), media_type="text/event-stream")
+
+
+# Iteration and token budgets each criterion currently runs with, from this instance's run statistics
+@app.get("/run_budgets")
+async def run_budgets():
+    return run_stats.budgets([BASIC_INFO.key] + [criterion.key for criterion in CRITERIA])
+
+
+@app.get("/slots_status")
+async def slots_status():
+    return slots.status()
+
+
+STARTUP_TIMINGS["imports"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
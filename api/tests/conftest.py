@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The API is deployed on its own and imports its modules by their flat names
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
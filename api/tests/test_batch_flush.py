@@ -0,0 +1,79 @@
+import time
+import asyncio
+
+import task_process
+from batch import BatchRequest
+
+
+class FailingClient():
+
+
+    def __init__(self) -> None:
+        self.submitted = []
+
+
+    def submit(self, batch_requests):
+        self.submitted.append(batch_requests)
+        raise RuntimeError("batch endpoint unavailable")
+
+
+class Client():
+
+
+    def submit(self, batch_requests):
+        return "batch_1"
+
+
+class FailingDB():
+
+
+    def collection(self, name):
+        return self
+
+
+    def document(self, doc_id):
+        return self
+
+
+    async def set(self, data):
+        raise RuntimeError("firestore unavailable")
+
+
+def queue(key: str) -> None:
+    task_process._batch_requests.append(BatchRequest(custom_id=f"{key}:basic_info", body={}))
+    task_process._batch_companies[key] = {"task_doc_id": "task", "company_doc_id": key, "org_id": "org", "company_id": key}
+    task_process._batch_oldest = task_process._batch_oldest or time.monotonic()
+
+
+def reset() -> None:
+    task_process._batch_requests, task_process._batch_companies, task_process._batch_oldest = [], {}, None
+
+
+def test_failed_submit_requeues_companies(monkeypatch):
+    reset()
+    client = FailingClient()
+    monkeypatch.setattr("batch.batch_client", lambda: client)
+    queue("task:a")
+    queue("task:b")
+
+    assert asyncio.run(task_process.flush_batch()) is None
+    assert len(client.submitted) == 1
+    assert list(task_process._batch_companies) == ["task:a", "task:b"]
+    assert [request.custom_id for request in task_process._batch_requests] == ["task:a:basic_info", "task:b:basic_info"]
+    assert task_process._batch_oldest is not None
+    reset()
+
+
+def test_failed_record_requeues_companies(monkeypatch):
+    reset()
+    monkeypatch.setattr("batch.batch_client", lambda: Client())
+
+    async def get_db():
+        return FailingDB()
+    monkeypatch.setattr(task_process, "get_db", get_db)
+    queue("task:a")
+
+    assert asyncio.run(task_process.flush_batch()) is None
+    assert list(task_process._batch_companies) == ["task:a"]
+    assert len(task_process._batch_requests) == 1
+    reset()
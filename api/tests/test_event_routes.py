@@ -0,0 +1,14 @@
+from starlette.requests import Request
+
+from task_process import last_event_id
+
+
+def request(headers: dict) -> Request:
+    return Request({"type": "http", "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()]})
+
+
+def test_last_event_id_falls_back_to_zero_when_invalid():
+    assert last_event_id(request({})) == 0
+    assert last_event_id(request({"Last-Event-ID": "42"})) == 42
+    assert last_event_id(request({"Last-Event-ID": "abc"})) == 0
+    assert last_event_id(request({"Last-Event-ID": "-5"})) == 0
@@ -0,0 +1,84 @@
+import asyncio
+
+import progress
+from progress import ProgressWriter
+
+
+class Batch():
+
+
+    def __init__(self, db) -> None:
+        self.db = db
+        self.updates = {}
+
+
+    def update(self, path, data) -> None:
+        self.updates[path] = data
+
+
+    async def commit(self) -> None:
+        self.db.batches.append(self.updates)
+
+
+class DB():
+
+
+    def __init__(self) -> None:
+        self.batches = []
+
+
+    def batch(self) -> Batch:
+        return Batch(self)
+
+
+    def document(self, path: str) -> str:
+        return path
+
+
+def writer() -> tuple:
+    db = DB()
+
+    async def get_db():
+        return db
+    return ProgressWriter(get_db=get_db), db
+
+
+def test_flush_writes_latest_progress_of_changed_companies_once():
+    progress_writer, db = writer()
+    progress_writer.start("tasks/t/companies/a")
+    progress_writer.start("tasks/t/companies/b")
+    emit = progress_writer.tracked("tasks/t/companies/a", lambda event, data: None)
+    emit("step", {"criterion": "Scope 1 Emissions"})
+    emit("step", {"criterion": "Scope 2 Emissions"})
+    emit("criterion_completed", {"criterion": "Scope 1 Emissions"})
+
+    assert asyncio.run(progress_writer.flush()) == 2
+    assert len(db.batches) == 1
+    written = db.batches[0]["tasks/t/companies/a"]["progress"]
+    assert (written["criterion"], written["iterations"], written["criteria_done"]) == ("Scope 2 Emissions", 2, 1)
+
+    # Only companies that moved on since are written again, and nothing when none did
+    emit("step", {"criterion": "Scope 3 Emissions"})
+    assert asyncio.run(progress_writer.flush()) == 1
+    assert list(db.batches[1]) == ["tasks/t/companies/a"]
+    assert asyncio.run(progress_writer.flush()) == 0
+    assert len(db.batches) == 2
+
+
+def test_finished_companies_are_not_written():
+    progress_writer, db = writer()
+    progress_writer.start("tasks/t/companies/a")
+    progress_writer.record("tasks/t/companies/a", "step", {"criterion": "Scope 1 Emissions"})
+    progress_writer.finish("tasks/t/companies/a")
+    progress_writer.record("tasks/t/companies/a", "step", {"criterion": "Scope 2 Emissions"})
+    assert asyncio.run(progress_writer.flush()) == 0
+    assert db.batches == []
+
+
+def test_large_flushes_are_split_into_batches(monkeypatch):
+    monkeypatch.setattr(progress, "PROGRESS_BATCH_SIZE", 2)
+    progress_writer, db = writer()
+    for company in "abcde":
+        progress_writer.start(f"tasks/t/companies/{company}")
+    assert asyncio.run(progress_writer.flush()) == 5
+    assert [len(batch) for batch in db.batches] == [2, 2, 1]
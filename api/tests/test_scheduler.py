@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import scheduler
+from scheduler import HourlyBudget, RefreshScheduler
+from criteria import CRITERIA, criterion_ttl, refresh_due
+from supplier_data import Supplier, ESGData, DataSummary
+
+
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def supplier(updated: datetime, criteria_updated: dict) -> Supplier:
+    data = {criterion.key: DataSummary(available=True, summary="", sources=[]) for criterion in CRITERIA}
+    return Supplier(id="acme", name="Acme", esg=ESGData(**data, segment="High", updated=updated, criteria_updated=criteria_updated))
+
+
+def test_settled_reservation_counts_actual_usage():
+    budget = HourlyBudget(limit=100_000)
+    entry = budget.reserve(60_000)
+    assert not budget.allows(50_000)
+    HourlyBudget.settle(entry, 12_000)
+    assert budget.used() == 12_000
+    assert budget.allows(50_000)
+
+
+def test_refresh_due_is_the_earliest_criterion_due():
+    # A partial refresh moved updated on, but the criteria it didn't re-run are still as old
+    old = NOW - timedelta(days=400)
+    fresh = supplier(NOW, {criterion.key: NOW for criterion in CRITERIA if criterion.key != "ecovadis"})
+    fresh.esg.criteria_updated["ecovadis"] = old
+    ecovadis = next(criterion for criterion in CRITERIA if criterion.key == "ecovadis")
+    assert refresh_due(fresh) == old + criterion_ttl(ecovadis)
+    assert refresh_due(fresh) < NOW
+
+
+def test_dispatch_settles_budgets_with_tokens_used(monkeypatch):
+    monkeypatch.setattr(scheduler, "reserved_tokens", lambda criteria: 40_000)
+
+    async def refresh(org_id, supplier, criteria):
+        return 7_000
+
+    async def main():
+        refresher = RefreshScheduler(get_db=None, refresh=refresh)
+        candidate = scheduler.RefreshCandidate(org_id="org", supplier=supplier(NOW, {}), criteria=["ecovadis"], priority=1.0)
+
+        async def find_candidates():
+            return [candidate]
+        refresher.find_candidates = find_candidates
+        assert await refresher.dispatch() == ["org/acme"]
+        assert refresher.status()["tokens_last_hour"] == 40_000
+        await asyncio.gather(*refresher._running.values())
+        assert refresher.status()["tokens_last_hour"] == 7_000
+        assert refresher._org_budget("org").used() == 7_000
+
+    asyncio.run(main())
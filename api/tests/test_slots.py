@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from slots import AgentSlots
+
+
+# Requests a slot for each (kind, org_id, task_id) in order while all slots are held,
+# then frees them one at a time and returns the order the requests were granted in
+async def grant_order(slots: AgentSlots, holders: int, requests: list) -> list:
+    order = []
+    release = asyncio.Event()
+
+    async def hold(kind, org_id):
+        async with slots.slot(kind, org_id):
+            await release.wait()
+
+    async def run(name, kind, org_id, task_id):
+        async with slots.slot(kind, org_id, task_id):
+            order.append(name)
+
+    held = [asyncio.create_task(hold("interactive", "holder")) for _ in range(holders)]
+    await asyncio.sleep(0)
+    waiting = [asyncio.create_task(run(*request)) for request in requests]
+    await asyncio.sleep(0)
+    assert order == []
+    release.set()
+    await asyncio.gather(*held, *waiting)
+    return order
+
+
+def test_priority_classes_go_first():
+    slots = AgentSlots(slots=1, reserved=0)
+    order = asyncio.run(grant_order(slots, 1, [
+        ("bulk", "bulk", "org_a", None),
+        ("refresh", "refresh", "org_a", None),
+        ("interactive", "interactive", "org_a", None),
+    ]))
+    assert order == ["interactive", "refresh", "bulk"]
+
+
+def test_orgs_share_slots_by_weight():
+    slots = AgentSlots(slots=1, reserved=0, org_weights={"org_b": 2})
+    requests = [(f"a{i}", "bulk", "org_a", None) for i in range(3)] + [(f"b{i}", "bulk", "org_b", None) for i in range(4)]
+    order = asyncio.run(grant_order(slots, 1, requests))
+    # org_b has twice org_a's weight, so it gets two runs for each of org_a's
+    assert order == ["a0", "b0", "b1", "a1", "b2", "b3", "a2"]
+
+
+def test_reserved_slots_are_kept_for_interactive_runs():
+    async def main():
+        slots = AgentSlots(slots=2, reserved=1)
+        async with slots.slot("bulk", "org_a"):
+            bulk = asyncio.create_task(slots.slot("bulk", "org_a").__aenter__())
+            await asyncio.sleep(0)
+            assert not bulk.done()
+            async with slots.slot("interactive", "org_b"):
+                assert slots.status()["running"] == {"interactive": 1, "refresh": 0, "bulk": 1}
+            bulk.cancel()
+
+    asyncio.run(main())
+
+
+def test_one_task_is_capped_to_its_share():
+    async def main():
+        slots = AgentSlots(slots=4, reserved=0, task_share=0.5)
+        async with slots.slot("bulk", "org_a", "task_1"), slots.slot("bulk", "org_a", "task_1"):
+            third = asyncio.create_task(slots.slot("bulk", "org_a", "task_1").__aenter__())
+            await asyncio.sleep(0)
+            assert not third.done()
+            # Another task still gets the free slots
+            async with slots.slot("bulk", "org_a", "task_2"):
+                assert slots.status()["running"]["bulk"] == 3
+            third.cancel()
+
+    asyncio.run(main())
+
+
+def test_unknown_job_type_is_rejected():
+    async def main():
+        async with AgentSlots().slot("urgent", "org_a"):
+            pass
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
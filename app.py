@@ -1,46 +1,12 @@
 import streamlit as st
 from dotenv import load_dotenv
 
-from utils.agent import Agent
-from components import (
-    authenticate,
-    home_page,
-    supplier_details,
-)
-from compositeai.tools import GoogleSerperApiTool, WebScrapeTool
-from compositeai.drivers import OpenAIDriver
-
 
 # Load environment variables
 load_dotenv()
 
 
 # Set up page session state
-if "chat_agent" not in st.session_state:
-    st.session_state["chat_agent"] = Agent(
-        driver=OpenAIDriver(
-            model="gpt-4o-mini", 
-            seed=1337,
-        ),
-        description=f"""
-        You are an analyst searches the web for a company's sustainability and ESG information.
-
-        Use the Google search tool to find relevant data sources and links.
-        Then, use the Web scraping tool to analyze the content of links of interest.
-        Cite quotes from the source to support your answer.
-        Provide a link to the sources.
-
-        Here is an example response with the format you should respond:
-            - [INSERT EXPLANATION ON WHAT YOU HAVE FOUND]
-            - [INSERT KEY QUOTES THAT YOU HAVE FOUND]
-            - [INSERT LINKS TO SOURCES]
-        """,
-        tools=[
-            WebScrapeTool(),
-            GoogleSerperApiTool(),
-        ],
-        max_iterations=20,
-    )
 if "chat_history" not in st.session_state:
     st.session_state["chat_history"] = []
 if "page" not in st.session_state:
@@ -54,11 +20,24 @@ if "page" not in st.session_state:
 if __name__=="__main__":
     st.set_page_config(page_title="Composite.ai", page_icon="♻️")
 
+    # Signed in pages need a valid session, the ID token is refreshed before it expires
+    if st.session_state["page"]["name"] != "Auth":
+        from utils.auth import auth
+        if not auth.ensure_session(st.session_state["page"]["data"]["session_data"]):
+            st.session_state["page"] = {
+                "name": "Auth",
+                "data": None,
+            }
+
+    # Page modules are imported when their page is first shown, later reruns reuse the loaded module
     if st.session_state["page"]["name"] == "Auth":
+        from components import authenticate
         authenticate()
     elif st.session_state["page"]["name"] == "Home":
+        from components import home_page
         home_page()
     elif st.session_state["page"]["name"] == "Supplier Details":
+        from components import supplier_details
         supplier_details()
     else:
         st.error(body="Page Not Found.")
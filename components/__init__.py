@@ -1,4 +1,16 @@
-from components.authenticate import authenticate
-from components.supplier import supplier_details
-from components.home import home_page
-from components.chat import chat_suppliers
\ No newline at end of file
+import importlib
+
+
+# Pages are imported on first use, so the sign in page does not load the agent, data and export stacks
+_PAGES = {
+    "authenticate": "components.authenticate",
+    "supplier_details": "components.supplier",
+    "home_page": "components.home",
+    "chat_suppliers": "components.chat",
+}
+
+
+def __getattr__(name: str):
+    if name in _PAGES:
+        return getattr(importlib.import_module(_PAGES[name]), name)
+    raise AttributeError(f"module 'components' has no attribute '{name}'")
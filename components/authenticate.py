@@ -37,7 +37,6 @@ def authenticate():
                 st.session_state["page"] = {
                     "name": "Home",
                     "data": {
-                        "processing_supplier": False,
                         "session_data": session_data,
                     },
                 }
@@ -106,7 +105,6 @@ def authenticate():
                 st.session_state["page"] = {
                     "name": "Home",
                     "data": {
-                        "processing_supplier": False,
                         "session_data": session_data,
                     },
                 }
@@ -3,6 +3,9 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from compositeai.agents import AgentResult
 from utils.auth import auth
+from utils.agent import Agent
+from utils.tools import SupplierDataTool
+from utils.resources import openai_driver, web_tools
 
 
 
@@ -77,11 +80,44 @@ def user_settings_dialog():
         confirm_delete_account(user_id=uid, email=email)
 
 
+# Create the chat assistant for a session
+# Driver and web tools are shared process-wide, only the agent's memory belongs to the session
+def new_chat_agent() -> Agent:
+    return Agent(
+        driver=openai_driver(),
+        description=f"""
+        You are an analyst searches the web for a company's sustainability and ESG information.
+
+        For questions about the user's own suppliers, first use the supplier data tool to look up their stored ESG data.
+        Only search the web if the stored data cannot answer the question.
+        Use the Google search tool to find relevant data sources and links.
+        Then, use the Web scraping tool to analyze the content of links of interest.
+        Cite quotes from the source to support your answer.
+        Provide a link to the sources.
+
+        Here is an example response with the format you should respond:
+            - [INSERT EXPLANATION ON WHAT YOU HAVE FOUND]
+            - [INSERT KEY QUOTES THAT YOU HAVE FOUND]
+            - [INSERT LINKS TO SOURCES]
+        """,
+        tools=[SupplierDataTool()] + web_tools(),
+        max_iterations=20,
+    )
+
+
 # Chat widget for supplier details page
 def chat_suppliers():
-    # Retrieve agent from session state
+    # Retrieve agent from session state, created when the chat is first shown
+    if "chat_agent" not in st.session_state:
+        st.session_state["chat_agent"] = new_chat_agent()
     agent = st.session_state["chat_agent"]
 
+    # Scope the stored supplier data tool to the signed in organization
+    org_id = st.session_state["page"]["data"]["session_data"]["org_id"]
+    for tool in agent.tools:
+        if isinstance(tool, SupplierDataTool):
+            tool.set_org(org_id)
+
     # Setup sidebar chat
     with st.sidebar:
         # Display CompositeAI logo
@@ -1,138 +1,79 @@
+import os
+import math
 import time
-import uuid
 import streamlit as st
-from datetime import datetime
-import pytz
-from fuzzywuzzy import fuzz, process
 from typing import List
 from components.chat import chat_suppliers
+from components.jobs import jobs_panel
 from components.supplier import (
     supplier_display, 
-    supplier_obtain_esg_data, 
+    supplier_table,
 )
 from utils.db import db
+from utils.local_store import get_org_suppliers, iter_org_suppliers
+from utils.export import EXPORT_FORMATS, write_export
+from utils.search import get_search_index
+from utils.upload import UploadResult, file_hash, parse_supplier_names
+from utils.jobs import job_manager
 from utils.supplier_data import (
     Supplier, 
-    ESGData,
-    DataSummary,
-    AgentSupplier,
+    ESG_CRITERIA_LABELS,
 )
-import pandas as pd
-from io import BytesIO
-
-
-# Function to perform fuzzy search on company names and return results with ids
-def fuzzy_search(search: str, suppliers: List[Supplier], threshold: int = 70):
-    # Return search score of companies sorted alphabetically
-    supplier_names = [supplier.name for supplier in suppliers]
-    results = process.extract(search, supplier_names, scorer=fuzz.token_set_ratio)
-    results = sorted(results, key=lambda pair: pair[0])
-
-    # Match results to dataset
-    num_suppliers = len(suppliers)
-    matches = []
-    for i in range(num_suppliers):
-        score = results[i][1]
-        supplier = suppliers[i]
-        if score >= threshold:
-            matches.append(supplier)
-    return matches
-
-
-@st.dialog(title="Processing New Supplier...", width="large")
-def processing_dialog(name: str, website: str = None, description: str = None, notes: str = None):
-    task_prefix = f"""
-    Given the following info about a company:
-        Name - {name}
-        Website - {website}
-        Description - {description}
-        Notes - {notes}
-    """
-    esg_score = 0
-
-    task_basic_info = task_prefix + """
-    \nUse the web to find a URL to the company's website and come up with your best description on what this company does.
-    """
-    data_basic_info = supplier_obtain_esg_data(label="Basic Information", task=task_basic_info, response_format=AgentSupplier)
-
-    task_scope_1 = task_prefix + """
-    \nPlease find any data on THEIR OWN scope 1 emissions calculations.
-    Scope 1 emissions are direct emissions from sources owned or controlled by a company.
-    These include things like: on-site energy, fleet vehicles, process emissions, or accidental emissions.
-    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 1" DATA.
-    """
-    data_scope_1 = supplier_obtain_esg_data(label="Scope 1 Emissions", task=task_scope_1, response_format=DataSummary)
-    esg_score += 1 if data_scope_1.available else 0
-
-    task_scope_2 = task_prefix + f"""
-    Please find any data on THEIR OWN scope 2 emissions calculations.
-    Scope 2 emissions are indirect greenhouse gas (GHG) emissions that result from the generation of energy that an organization purchases and uses.
-    These include things like the purchase of electricity from: steam, heat, cooling, etc.
-    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 2" DATA.
-    """
-    data_scope_2 = supplier_obtain_esg_data(label="Scope 2 Emissions", task=task_scope_2, response_format=DataSummary)
-    esg_score += 1 if data_scope_2.available else 0
-
-    task_scope_3 = task_prefix + """
-    Please find any data on THEIR OWN scope 3 emissions calculations.
-    Scope 3 emissions are greenhouse gas (GHG) emissions that are a result of activities that a company indirectly affects as part of its value chain, but that are not owned or controlled by the company.
-    These include things like: supply chain emissions, use of sold products, waste disposal, employee travel, contracted waste disposal, etc.
-    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 3" DATA.
-    """
-    data_scope_3 = supplier_obtain_esg_data(label="Scope 3 Emissions", task=task_scope_3, response_format=DataSummary)
-    esg_score += 1 if data_scope_3.available else 0
-
-    task_ecovadis = task_prefix + "\nPlease find if this company has a publicly available Ecovadis score."
-    data_ecovadis = supplier_obtain_esg_data(label="Ecovadis Score", task=task_ecovadis, response_format=DataSummary)
-    esg_score += 1 if data_ecovadis.available else 0
-
-    task_reduction_targets = task_prefix + "\nPlease find if this company has set any carbon emissions reduction targets."
-    data_reduction_targets = supplier_obtain_esg_data(label="Reduction Targets", task=task_reduction_targets, response_format=DataSummary)
-    esg_score += 1 if data_reduction_targets.available else 0
-
-    task_iso_14001 = task_prefix + "\nPlease find if this company has an ISO 14001 certification."
-    data_iso_14001 = supplier_obtain_esg_data(label="ISO 14001 Certification", task=task_iso_14001, response_format=DataSummary)
-    esg_score += 1 if data_iso_14001.available else 0
-
-    task_product_lca = task_prefix + "\nPlease find if this company has any products undergoing a Life Cycle Assessment, or LCA."
-    data_product_lca = supplier_obtain_esg_data(label="Product LCAs", task=task_product_lca, response_format=DataSummary)
-    esg_score += 1 if data_product_lca.available else 0
-
-    if esg_score <= 2:
-        segment = "Low"
-    elif esg_score <= 5:
-        segment = "Medium"
-    else:
-        segment = "High"
-    processed_supplier = Supplier(
-        id=str(uuid.uuid4()),
-        name=data_basic_info.name,
-        website=data_basic_info.website,
-        description=data_basic_info.description,
-        esg=ESGData(
-            scope_1=data_scope_1,
-            scope_2=data_scope_2,
-            scope_3=data_scope_3,
-            ecovadis=data_ecovadis,
-            reduction_targets=data_reduction_targets,
-            iso_14001=data_iso_14001,
-            product_lca=data_product_lca,
-            segment=segment,
-            updated=datetime.now(pytz.timezone('Europe/London')),
-        )
-    )
-    org_id = st.session_state["page"]["data"]["session_data"]["org_id"]
-    db.insert_supplier(supplier=processed_supplier, org_id=org_id)
-    st.session_state["page"] = {
-        "name": "Supplier Details", 
-        "data": {
-            "supplier": processed_supplier,
-            "session_data": st.session_state["page"]["data"]["session_data"],
-        },
-    }
-    st.success(body=f"Successfully added {name} as a supplier!")
-    time.sleep(2)
-    st.rerun()
+import tempfile
+
+
+# Page size options for the supplier list on the home page
+PAGE_SIZE_OPTIONS = [10, 25, 50, 100]
+DEFAULT_PAGE_SIZE = int(os.getenv("SUPPLIERS_PAGE_SIZE", "10"))
+if DEFAULT_PAGE_SIZE not in PAGE_SIZE_OPTIONS:
+    PAGE_SIZE_OPTIONS = sorted(PAGE_SIZE_OPTIONS + [DEFAULT_PAGE_SIZE])
+
+
+# Function to render page navigation and return the items on the current page
+# The page resets to the first one whenever key (the filters producing items) changes
+def paginate(items: list, page_size: int, key: str) -> list:
+    num_pages = max(1, math.ceil(len(items) / page_size))
+    if st.session_state.get("suppliers_page_key") != key:
+        st.session_state["suppliers_page_key"] = key
+        st.session_state["suppliers_page"] = 0
+    page = min(st.session_state.get("suppliers_page", 0), num_pages - 1)
+    st.session_state["suppliers_page"] = page
+
+    # Clicks move the stored page in callbacks, which run before the rerun renders the buttons,
+    # so their disabled state and the items shown always match the page
+    def move(step: int) -> None:
+        st.session_state["suppliers_page"] = min(max(page + step, 0), num_pages - 1)
+
+    col1, col2, col3 = st.columns([0.2, 0.6, 0.2])
+    with col1:
+        st.button(label="Previous", disabled=page == 0, on_click=move, args=(-1,), use_container_width=True)
+    with col3:
+        st.button(label="Next", disabled=page >= num_pages - 1, on_click=move, args=(1,), use_container_width=True)
+    with col2:
+        start = page * page_size
+        end = min(start + page_size, len(items))
+        st.caption(f"Page {page + 1} of {num_pages} ({start + 1 if items else 0}-{end} of {len(items)} suppliers)")
+
+    return items[start:end]
+
+
+# Function to parse a bulk upload file, reusing the result for the same file within the session
+def read_upload(uploaded_file) -> UploadResult:
+    data = uploaded_file.getvalue()
+    key = file_hash(data)
+    cache = st.session_state.setdefault("upload_cache", {})
+    if key not in cache:
+        # Keep only the most recent upload, earlier files are not needed once replaced
+        cache.clear()
+        cache[key] = parse_supplier_names(data=data, filename=uploaded_file.name)
+    return cache[key]
+
+
+# Function to perform fuzzy search on supplier names, websites and descriptions, best matches first
+def fuzzy_search(search: str, suppliers: List[Supplier], threshold: int = 70) -> List[Supplier]:
+    # Index is built once per version of the supplier list and reused across reruns
+    index = get_search_index(suppliers)
+    return [supplier for supplier, score in index.search(query=search, threshold=threshold)]
 
 
 @st.dialog(title="Add New Supplier", width="large")
@@ -152,22 +93,23 @@ def add_dialog():
 
             # Submit logic
             if submit:
-                # Conduct checks
+                # Conduct checks, suppliers still being added count towards the plan limit
                 suppliers_db = db.get_org_suppliers(org_id=org_id)
                 num_suppliers_db = len(suppliers_db)
-                if num_suppliers_db >= 10:
+                num_suppliers_queued = sum(1 for job in job_manager.get_jobs(org_id) if job.kind == "onboard" and job.active)
+                if num_suppliers_db + num_suppliers_queued >= 10:
                     st.error("Your plan current supports only 10 total suppliers in your database.")
                 elif not name:
                     st.error("Please provide the supplier name.")
                 else:
-                    # Continue with submission
-                    st.session_state["page"]["data"]["processing_supplier"] = True
-                    st.session_state["page"]["data"]["add_supplier"] = {
-                        "name": name,
-                        "website": website,
-                        "description": description,
-                        "notes": notes,
-                    }
+                    # Continue with submission in the background, progress is shown on the home page
+                    job_manager.submit_onboarding(
+                        org_id=org_id,
+                        name=name,
+                        website=website,
+                        description=description,
+                        notes=notes,
+                    )
                     st.rerun()
     with tab2:
         uploaded_file = st.file_uploader(
@@ -175,29 +117,31 @@ def add_dialog():
             accept_multiple_files=False,
             type=['csv', 'xlsx'],
         )
+        batch_mode = st.checkbox(
+            label="Process as a low-cost batch",
+            help="Final answers are generated through the batch API, which is cheaper but can take up to 24 hours.",
+        )
+        task_mode = "batch" if batch_mode else "interactive"
         if uploaded_file:
+            upload_result = None
             with st.spinner("Processing..."):
                 try:
-                    # Determine file type and read accordingly
-                    if uploaded_file.name.endswith('.csv'):
-                        df = pd.read_csv(uploaded_file)
-                    else:  # Excel file
-                        df = pd.read_excel(uploaded_file)
-                    
-                    # Check if "Supplier Names" column exists
-                    supplier_column = next((col for col in df.columns if col.lower() == "supplier names"), None)
-                    if not supplier_column:
-                        raise Exception("No \"Supplier Names\" column")
-                        
                     # Check user_id and org_id from session data
                     session_data = st.session_state["page"]["data"]["session_data"]
                     user_id = session_data.get("localId")
                     org_id = session_data.get("org_id")
                     if not user_id or not org_id:
                         raise Exception("Missing user or organization information")
-                    
+
+                    # Parse only the "Supplier Names" column, cached by file hash while the dialog reruns
+                    upload_result = read_upload(uploaded_file)
+                    st.caption(
+                        f"Read {upload_result.total_rows} rows: {len(upload_result.names)} unique names, "
+                        f"{upload_result.duplicates} repeated in file, {upload_result.rejected} rejected."
+                    )
+
                     # Get supplier names from upload and database
-                    supplier_names_uploaded = df[supplier_column].dropna().tolist()
+                    supplier_names_uploaded = upload_result.names
                     supplier_names_uploaded_lower = {supplier_name.lower() for supplier_name in supplier_names_uploaded}
                     num_supplier_upload = len(supplier_names_uploaded_lower)
                     suppliers_db = db.get_org_suppliers(org_id=org_id)
@@ -212,16 +156,21 @@ def add_dialog():
                     supplier_names_db_lower = {supplier.name.lower() for supplier in suppliers_db}
                     duplicates = supplier_names_uploaded_lower.intersection(supplier_names_db_lower)
                 except Exception as e:
+                    upload_result = None
                     st.error(f"An error occurred while processing the file: {str(e)}")
 
+            # Nothing to upload if the file could not be parsed, the error is already shown
+            if upload_result is None:
+                pass
+
             # Check if capacity of suppliers in the system is going to be over
-            if over_capacity:
+            elif over_capacity:
                 st.error("Your plan current supports only 10 total suppliers in your database.")
                 time.sleep(2)
                 st.rerun()
 
             # Check for duplicates and ask
-            if duplicates:
+            elif duplicates:
                 st.warning("The following companies already exist in the database:")
                 with st.expander("Duplicates"):
                     for item in duplicates:
@@ -229,20 +178,20 @@ def add_dialog():
                 but1, but2 = st.columns([1, 1])
                 with but1:
                     if st.button("Upload All", use_container_width=True):
-                        task_id = db.create_task(user_id, org_id, list(supplier_names_uploaded))
+                        task_id = db.create_task(user_id, org_id, list(supplier_names_uploaded), mode=task_mode)
                         st.success(f"Successfully extracted {len(supplier_names_uploaded)} supplier names and created task with ID: {task_id}")
                         time.sleep(2)
                         st.rerun()
                 with but2:
                     if st.button("Upload Non-duplicates", use_container_width=True):
                         # Subtract duplicates from uploaded supplier names
-                        supplier_names_uploaded_lower -= duplicates  # Remove duplicates from the set
-                        task_id = db.create_task(user_id, org_id, list(supplier_names_uploaded_lower))
-                        st.success(f"Successfully extracted {len(supplier_names_uploaded_lower)} supplier names and created task with ID: {task_id}")
+                        supplier_names_uploaded = [name for name in supplier_names_uploaded if name.lower() not in duplicates]
+                        task_id = db.create_task(user_id, org_id, supplier_names_uploaded, mode=task_mode)
+                        st.success(f"Successfully extracted {len(supplier_names_uploaded)} supplier names and created task with ID: {task_id}")
                         time.sleep(2)
                         st.rerun()
             else:
-                task_id = db.create_task(user_id, org_id, list(supplier_names_uploaded))
+                task_id = db.create_task(user_id, org_id, list(supplier_names_uploaded), mode=task_mode)
                 st.success(f"Successfully extracted {len(supplier_names_uploaded)} supplier names and created task with ID: {task_id}")
                 time.sleep(2)
                 st.rerun()
@@ -263,6 +212,7 @@ def add_dialog():
                     total_companies = len(task['companies'])
                     processed_companies = sum(1 for company in task['companies'] if company['status'] == 'success')
                     error_companies = sum(1 for company in task['companies'] if company['status'] == 'error')
+                    cancelled_companies = sum(1 for company in task['companies'] if company['status'] == 'cancelled')
                     
                     # Calculate progress percentage
                     progress_percentage = (processed_companies / total_companies) * 100 if total_companies > 0 else 0
@@ -274,7 +224,16 @@ def add_dialog():
                     st.write(f"Total Companies: {total_companies}")
                     st.write(f"Processed: {processed_companies}")
                     st.write(f"Errors: {error_companies}")
-                    st.write(f"Remaining: {total_companies - processed_companies - error_companies}")
+                    if cancelled_companies:
+                        st.write(f"Cancelled: {cancelled_companies}")
+                    remaining_companies = total_companies - processed_companies - error_companies - cancelled_companies
+                    st.write(f"Remaining: {remaining_companies}")
+                    if remaining_companies and not task.get('cancelled'):
+                        if st.button("Cancel Task", key=f"cancel_task_{task['id']}"):
+                            db.cancel_task(task['id'])
+                            st.rerun()
+                    elif remaining_companies:
+                        st.caption("Cancelling, running companies are saved with what has been found so far.")
                     
                     # Display company list
                     if st.checkbox(f"Show Companies", key=f"show_companies_{task['id']}"):
@@ -282,34 +241,63 @@ def add_dialog():
                             status_color = {
                                 'success': 'green',
                                 'error': 'red',
-                                'unprocessed': 'orange'
+                                'unprocessed': 'orange',
+                                'batched': 'blue',
                             }.get(company['status'], 'gray')
-                            st.markdown(f"- {company['name']}: <font color='{status_color}'>{company['status']}</font>", unsafe_allow_html=True)
+                            # Companies being researched show the API's latest progress write
+                            progress = company.get('progress') if company['status'] == 'unprocessed' else None
+                            progress_text = ""
+                            if progress:
+                                minutes, seconds = divmod(progress.get('elapsed_seconds', 0), 60)
+                                progress_text = f" ({progress.get('criterion') or 'starting'}, {progress.get('criteria_done', 0)} criteria done, {progress.get('iterations', 0)} steps, {minutes}m {seconds}s)"
+                            st.markdown(f"- {company['name']}: <font color='{status_color}'>{company['status']}</font>{progress_text}", unsafe_allow_html=True)
+
+
+@st.dialog(title="Download Supplier Info")
+def export_dialog():
+    org_id = st.session_state["page"]["data"]["session_data"]["org_id"]
+    export_format = st.selectbox(label="File Format", options=list(EXPORT_FORMATS.keys()))
+    extension, mime = EXPORT_FORMATS[export_format]
+
+    # Export is only built on request, streamed to a temporary file on disk so suppliers are never
+    # all held in memory as rows or a DataFrame. st.download_button only takes bytes and keeps them in
+    # Streamlit's media file manager, so the finished file itself is held in memory once
+    if st.button(label="Prepare Export", use_container_width=True):
+        with st.spinner("Preparing export..."):
+            export_file = tempfile.TemporaryFile()
+            try:
+                write_export(export_format, iter_org_suppliers(org_id=org_id), export_file)
+                export_file.seek(0)
+                st.download_button(
+                    label=f"Download {export_format}",
+                    data=export_file.read(),
+                    file_name=f"supplier_info.{extension}",
+                    mime=mime,
+                    use_container_width=True,
+                )
+            finally:
+                # Only closed once the button has registered its copy of the data
+                export_file.close()
 
 
 def home_page():
     # Get org id from session state
     org_id = st.session_state["page"]["data"]["session_data"]["org_id"]
 
-    # Get suppliers data from session state
-    suppliers_data = db.get_org_suppliers(org_id=org_id)
-    suppliers_data = sorted(suppliers_data, key=lambda supplier: supplier.name)
-
-    # Check if in the middle of processing supplier
-    if st.session_state["page"]["data"]["processing_supplier"]:
-        add_supplier = st.session_state["page"]["data"]["add_supplier"]
-        processing_dialog(
-            name=add_supplier["name"], 
-            website=add_supplier["website"], 
-            description=add_supplier["description"],
-            notes=add_supplier["notes"],
-        )
-
     # Chat assistant sidebar
     chat_suppliers()
 
     # Title of page
     st.header("ESG Supplier Management System", anchor=False)
+
+    # Portfolio summary, read from the org's aggregate document
+    aggregates = db.get_org_aggregates(org_id=org_id)
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric(label="Suppliers", value=aggregates.total)
+    col2.metric(label="High", value=aggregates.segments.get("High", 0))
+    col3.metric(label="Medium", value=aggregates.segments.get("Medium", 0))
+    col4.metric(label="Low", value=aggregates.segments.get("Low", 0))
+    col5.metric(label="With Scope 3", value=f"{aggregates.share_available('scope_3'):.0%}")
     
     # Create a container for buttons to display them side by side
     col1, col2 = st.columns(2)
@@ -320,23 +308,27 @@ def home_page():
     with col2:
         # Button to download supplier info
         if st.button(label="Download Supplier Info", use_container_width=True):
-            org_id = st.session_state["page"]["data"]["session_data"]["org_id"]
-            suppliers = db.get_org_suppliers(org_id=org_id)
-            suppliers_info = [(supplier.name, supplier.website, supplier.description, supplier.notes, supplier.esg.segment, supplier.esg) for supplier in suppliers]
-            df = pd.DataFrame(suppliers_info, columns=["Supplier Names", "Website", "Description", "Notes", "ESG Rating", "ESG Data"])
-            
-            # Use BytesIO to create an in-memory buffer for the Excel file
-            excel_file = BytesIO()
-            df.to_excel(excel_file, index=False, engine='openpyxl')
-            excel_file.seek(0)  # Move to the beginning of the BytesIO buffer
-            
-            # Ensure the download button uses the correct data type
-            st.download_button(
-                label="Download Excel",
-                data=excel_file.getvalue(),  # Get the value of the BytesIO buffer
-                file_name="supplier_info.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            export_dialog()
+
+    # Suppliers being added or updated in the background
+    jobs_panel(org_id=org_id)
+
+    # Full-text search over stored ESG summaries and source quotes
+    with st.expander(label="Search ESG Evidence", expanded=False):
+        evidence_query = st.text_input(
+            label="Search Summaries and Source Quotes",
+            placeholder="e.g. SBTi validated",
+        ).strip()
+        if evidence_query:
+            hits = db.search_evidence(org_id=org_id, query=evidence_query)
+            if not hits:
+                st.info("No matching evidence found.")
+            for hit in hits:
+                with st.container(border=True):
+                    st.markdown(f"**{hit.supplier_name}** - {ESG_CRITERIA_LABELS[hit.criterion]}")
+                    st.markdown(f'"{hit.text}"' if hit.field == "quote" else hit.text)
+                    if hit.link:
+                        st.markdown(f"URL: {hit.link}")
 
     # Filtering UI
     col1, col2 = st.columns([0.5, 0.5])
@@ -347,17 +339,36 @@ def home_page():
         )
     with col2:
         search = st.text_input(label="Filter by Supplier Name").strip()
+
+    # Display options
+    col1, col2 = st.columns([0.5, 0.5])
+    with col1:
+        view = st.radio(label="View", options=["Cards", "Table"], horizontal=True)
+    with col2:
+        page_size = st.selectbox(
+            label="Suppliers per Page",
+            options=PAGE_SIZE_OPTIONS,
+            index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE),
+        )
     
-    # Filtering logic
-    if filter_rating == "All":
-        filtered_suppliers = suppliers_data
-    else:
-        filtered_suppliers = [supplier for supplier in suppliers_data if supplier.esg.segment == filter_rating]
+    # Filtering logic, segment filter is served by the local store index when enabled
+    segment = None if filter_rating == "All" else filter_rating
+    filtered_suppliers = get_org_suppliers(org_id=org_id, segment=segment)
     if search:
         filtered_suppliers = fuzzy_search(search=search, suppliers=filtered_suppliers)
 
-    # Display all suppliers
-    for supplier in filtered_suppliers:
-        supplier_display(supplier=supplier)
     if not filtered_suppliers:
         st.warning("No suppliers found.", icon="⚠️")
+        return
+
+    # Only the current page is rendered, so rerun cost does not grow with the supplier base
+    page_suppliers = paginate(
+        items=filtered_suppliers,
+        page_size=page_size,
+        key=f"{filter_rating}|{search}|{page_size}",
+    )
+    if view == "Table":
+        supplier_table(suppliers=page_suppliers)
+    else:
+        for supplier in page_suppliers:
+            supplier_display(supplier=supplier)
@@ -0,0 +1,89 @@
+import streamlit as st
+
+from utils.jobs import Job, job_manager
+
+
+# Seconds between progress refreshes while a job is running
+JOBS_POLL_INTERVAL = 2
+
+
+# HELPER COMPONENT
+# Card showing a background job's progress and the agent's intermediate steps
+def job_display(job: Job):
+    container = st.container(border=True)
+    action = "Adding" if job.kind == "onboard" else "Updating"
+    col1, col2 = container.columns([0.75, 0.25])
+    with col1:
+        st.markdown(f"**{action} {job.supplier_name}**")
+    with col2:
+        if job.active:
+            if st.button(key=f"{job.id}_cancel", label="Stop", use_container_width=True, disabled=job.cancelled):
+                job_manager.cancel(job.id)
+                st.rerun()
+        elif job.result and job.kind == "onboard":
+            if st.button(key=f"{job.id}_view", label="View Details", use_container_width=True):
+                st.session_state["page"] = {
+                    "name": "Supplier Details",
+                    "data": {
+                        "supplier": job.result,
+                        "session_data": st.session_state["page"]["data"]["session_data"],
+                    },
+                }
+                job_manager.dismiss(job.id)
+                st.rerun()
+        elif not job.active:
+            if st.button(key=f"{job.id}_dismiss", label="Dismiss", use_container_width=True):
+                job_manager.dismiss(job.id)
+                st.rerun()
+
+    if job.status == "queued":
+        container.progress(0.0, text="Queued...")
+    elif job.status == "running" and job.cancelled:
+        container.progress(job.progress, text="Stopping...")
+    elif job.status == "running":
+        container.progress(job.progress, text=f"Finding {job.current}..." if job.current else "Processing...")
+    elif job.status == "success":
+        container.progress(1.0, text="Completed.")
+    elif job.status == "cancelled":
+        container.warning("Stopped early, saved what was found so far." if job.result else "Stopped before it started.")
+    else:
+        container.error(f"Failed: {job.error}")
+
+    if job.steps:
+        with container.expander(label="Intermediate Steps", expanded=False):
+            for step in job.steps[-10:]:
+                with st.container(border=True):
+                    st.caption(step.label)
+                    st.markdown(step.content)
+
+
+def _show_jobs(jobs: list):
+    for job in jobs:
+        job_display(job=job)
+
+    # Rerun the whole page once a job finishes so saved suppliers appear
+    active_ids = {job.id for job in jobs if job.active}
+    if st.session_state.get("active_job_ids", set()) - active_ids:
+        st.session_state["active_job_ids"] = active_ids
+        st.rerun()
+    st.session_state["active_job_ids"] = active_ids
+
+
+@st.fragment(run_every=JOBS_POLL_INTERVAL)
+def _jobs_live(org_id: str, supplier_id: str = None):
+    jobs = job_manager.get_jobs(org_id)
+    if supplier_id:
+        jobs = [job for job in jobs if job.supplier_id == supplier_id][:1]
+    _show_jobs(jobs)
+
+
+# COMPONENT
+# Background jobs for the org (or one supplier), polled only while any of them is still running
+def jobs_panel(org_id: str, supplier_id: str = None):
+    jobs = job_manager.get_jobs(org_id)
+    if supplier_id:
+        jobs = [job for job in jobs if job.supplier_id == supplier_id][:1]
+    if any(job.active for job in jobs):
+        _jobs_live(org_id=org_id, supplier_id=supplier_id)
+    else:
+        _show_jobs(jobs)
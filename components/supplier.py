@@ -1,53 +1,14 @@
 import uuid
 import time
-import pytz
 import streamlit as st
-from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime
 
-from utils.agent import Agent
 from utils.db import db
+from utils.jobs import job_manager
+from utils.pipeline import refresh_criteria
 from utils.supplier_data import Supplier, DataSummary
 from components.chat import chat_suppliers
-from compositeai.tools import GoogleSerperApiTool, WebScrapeTool
-from compositeai.drivers import OpenAIDriver
-from compositeai.agents import AgentResult
-
-
-# HELPER COMPONENT
-# Runs structured output agent to process a task and display expander of results
-# e.g. "Find scope 1 emissions for company"
-def supplier_obtain_esg_data(label: str, task: str, response_format: BaseModel) -> BaseModel:
-    agent = Agent(
-        driver=OpenAIDriver(
-            model="gpt-4o-mini", 
-            seed=1337,
-        ),
-        description=f"""
-        You are an analyst searches the web for a company's sustainability and ESG information.
-
-        Use the Google search tool to find relevant data sources and links.
-        Then, use the Web scraping tool to analyze the content of links of interest.
-
-        BE AS CONCISE AS POSSIBLE.
-        """,
-        tools=[
-            WebScrapeTool(),
-            GoogleSerperApiTool(),
-        ],
-        max_iterations=20,
-        response_format=response_format,
-    )
-    with st.status(f"Finding {label}...") as status:
-        for chunk in agent.execute(task, stream=True):
-            if isinstance(chunk, AgentResult):
-                agent_result = chunk.content
-                status.update(label=f"Completed Search on {label}.", state="complete", expanded=False)
-            else:
-                with st.container(border=True):
-                    st.markdown(chunk.content)
-        return agent_result
+from components.jobs import jobs_panel
 
 
 # HELPER COMPONENT
@@ -112,6 +73,49 @@ def supplier_display(supplier: Supplier):
     container.write(f"**ESG Segment**: :{color}[{supplier.esg.segment}]")
 
 
+# HELPER COMPONENT
+# Compact table of suppliers as an alternative to cards, selecting a row opens its details page
+def supplier_table(suppliers: List[Supplier]):
+    rows = [
+        {
+            "Name": supplier.name,
+            "Website": supplier.website,
+            "ESG Segment": supplier.esg.segment,
+            "Scope 1": supplier.esg.scope_1.available,
+            "Scope 2": supplier.esg.scope_2.available,
+            "Scope 3": supplier.esg.scope_3.available,
+            "Ecovadis": supplier.esg.ecovadis.available,
+            "Reduction Targets": bool(supplier.esg.reduction_targets and supplier.esg.reduction_targets.available),
+            "ISO 14001": supplier.esg.iso_14001.available,
+            "LCA": supplier.esg.product_lca.available,
+            "Last Updated": supplier.esg.updated,
+        }
+        for supplier in suppliers
+    ]
+    event = st.dataframe(
+        data=rows,
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key="suppliers_table",
+        column_config={
+            "Website": st.column_config.LinkColumn(),
+            "Last Updated": st.column_config.DatetimeColumn(format="MM/DD/YYYY"),
+        },
+    )
+    if event.selection.rows:
+        # Update page state and rerun
+        st.session_state["page"] = {
+            "name": "Supplier Details",
+            "data": {
+                "supplier": suppliers[event.selection.rows[0]],
+                "session_data": st.session_state["page"]["data"]["session_data"],
+            },
+        }
+        st.rerun()
+
+
 # HELPER COMPONENT
 # Expander to display summary if one piece of ESG data
 # e.g. Scope 1 emissions for a company
@@ -134,79 +138,6 @@ def supplier_esg_expander(property: str, data_summary: DataSummary):
                     """)
 
 
-# HELPER COMPONENT
-# Used exclusively by supplier_details page to display dialog of updating ESG info
-@st.dialog(title="Updating ESG Data...", width="large")
-def update_dialog(supplier: Supplier):
-    task_prefix = f"""
-    Given the following info about a company:
-        Name - {supplier.name}
-        Website - {supplier.website}
-        Description - {supplier.description}
-        Notes - {supplier.notes}
-    """
-    esg_score = 0
-
-    task_scope_1 = task_prefix + """
-    \nPlease find any data on THEIR OWN scope 1 emissions calculations.
-    Scope 1 emissions are direct emissions from sources owned or controlled by a company.
-    These include things like: on-site energy, fleet vehicles, process emissions, or accidental emissions.
-    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 1" DATA.
-    """
-    data_scope_1 = supplier_obtain_esg_data(label="Scope 1 Emissions", task=task_scope_1, response_format=DataSummary)
-    esg_score += 1 if data_scope_1.available else 0
-
-    task_scope_2 = task_prefix + f"""
-    Please find any data on THEIR OWN scope 2 emissions calculations.
-    Scope 2 emissions are indirect greenhouse gas (GHG) emissions that result from the generation of energy that an organization purchases and uses.
-    These include things like the purchase of electricity from: steam, heat, cooling, etc.
-    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 2" DATA.
-    """
-    data_scope_2 = supplier_obtain_esg_data(label="Scope 2 Emissions", task=task_scope_2, response_format=DataSummary)
-    esg_score += 1 if data_scope_2.available else 0
-
-    task_scope_3 = task_prefix + """
-    Please find any data on THEIR OWN scope 3 emissions calculations.
-    Scope 3 emissions are greenhouse gas (GHG) emissions that are a result of activities that a company indirectly affects as part of its value chain, but that are not owned or controlled by the company.
-    These include things like: supply chain emissions, use of sold products, waste disposal, employee travel, contracted waste disposal, etc.
-    ONLY INCLUDE EXPLICIT MENTIONS OF "SCOPE 3" DATA.
-    """
-    data_scope_3 = supplier_obtain_esg_data(label="Scope 3 Emissions", task=task_scope_3, response_format=DataSummary)
-    esg_score += 1 if data_scope_3.available else 0
-
-    task_ecovadis = task_prefix + "\nPlease find if this company has a publicly available Ecovadis score."
-    data_ecovadis = supplier_obtain_esg_data(label="Ecovadis Score", task=task_ecovadis, response_format=DataSummary)
-    esg_score += 1 if data_ecovadis.available else 0
-
-    task_iso_14001 = task_prefix + "\nPlease find if this company has an ISO 14001 certification."
-    data_iso_14001 = supplier_obtain_esg_data(label="ISO 14001 Certification", task=task_iso_14001, response_format=DataSummary)
-    esg_score += 1 if data_iso_14001.available else 0
-
-    task_product_lca = task_prefix + "\nPlease find if this company has any products undergoing a Life Cycle Assessment, or LCA."
-    data_product_lca = supplier_obtain_esg_data(label="Product LCAs", task=task_product_lca, response_format=DataSummary)
-    esg_score += 1 if data_product_lca.available else 0
-
-    if esg_score <= 2:
-        segment = "Low"
-    elif esg_score <= 4:
-        segment = "Medium"
-    else:
-        segment = "High"
-    supplier.esg.scope_1 = data_scope_1
-    supplier.esg.scope_2 = data_scope_2
-    supplier.esg.scope_3 = data_scope_3
-    supplier.esg.ecovadis = data_ecovadis
-    supplier.esg.iso_14001 = data_iso_14001
-    supplier.esg.product_lca = data_product_lca
-    supplier.esg.segment = segment
-    supplier.esg.updated = datetime.now(pytz.timezone('Europe/London'))
-    org_id = st.session_state["page"]["data"]["session_data"]["org_id"]
-    db.update_supplier(supplier=supplier, org_id=org_id)
-    st.success(body=f"Successfully updated ESG data for {supplier.name}!")
-    time.sleep(2)
-    st.rerun()
-
-
 # PAGE
 # Display supplier data and editing forms
 def supplier_details():
@@ -215,6 +146,15 @@ def supplier_details():
 
     # Retrieve supplier data class and display name as title
     supplier = st.session_state["page"]["data"]["supplier"]
+    org_id = st.session_state["page"]["data"]["session_data"]["org_id"]
+
+    # Pick up ESG data saved by a background update that finished since the page was opened,
+    # including the partial results of a stopped update
+    job = job_manager.get_supplier_job(org_id=org_id, supplier_id=supplier.id)
+    if job and not job.active and job.result and job.result.esg.updated > supplier.esg.updated:
+        supplier = job.result
+        st.session_state["page"]["data"]["supplier"] = supplier
+
     st.title(body=f"**{supplier.name}**", anchor=False)
 
     # Supplier details edit form
@@ -226,7 +166,6 @@ def supplier_details():
             st.session_state["page"] = {
                 "name": "Home", 
                 "data": {
-                    "processing_supplier": False,
                     "session_data": st.session_state["page"]["data"]["session_data"],
                 },
             }
@@ -263,8 +202,15 @@ def supplier_details():
     supplier_esg_expander(property="Ecovadis Score", data_summary=supplier.esg.ecovadis)
     supplier_esg_expander(property="ISO 14001 Compliance", data_summary=supplier.esg.iso_14001)
     supplier_esg_expander(property="Life Cycle Assessments (LCA)", data_summary=supplier.esg.product_lca)
-    if st.button("Run Automatic Update"):
-        update_dialog(supplier=supplier)
+    # Only criteria that were unavailable or are past their refresh TTL are re-run
+    update_help = "Re-runs: " + (", ".join(criterion.label for criterion in refresh_criteria(supplier)) or "nothing, all data is current")
+    if job and job.active:
+        st.button("Run Automatic Update", disabled=True)
+    elif st.button("Run Automatic Update", help=update_help):
+        # Update runs in the background, the user can keep browsing meanwhile
+        job_manager.submit_refresh(org_id=org_id, supplier=supplier)
+        st.rerun()
+    jobs_panel(org_id=org_id, supplier_id=supplier.id)
 
 
 # # Initial supplier data
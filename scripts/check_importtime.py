@@ -0,0 +1,113 @@
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+
+# Run from the repo root:
+#   python scripts/check_importtime.py           check startup imports against the recorded baseline
+#   python scripts/check_importtime.py --update  record a new baseline after an intended change
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "scripts", "importtime_baseline.json")
+
+# What a cold container imports before the sign in page can render
+ENTRY = "import app; from components import authenticate"
+
+# Heavy stacks that must only load once a page needing them is shown
+DEFERRED_MODULES = [
+    "pandas",
+    "numpy",
+    "pyarrow",
+    "openpyxl",
+    "rapidfuzz",
+    "compositeai",
+    "openai",
+    "pytz",
+    "google.cloud.firestore",
+    "google.cloud.secretmanager",
+    "firebase_admin.auth",
+]
+
+# Import times are noisy, so the best of several runs is compared with some headroom
+RUNS = 5
+TOLERANCE = float(os.getenv("IMPORTTIME_TOLERANCE", "0.5"))
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+# Run the entry point once and return {module: cumulative microseconds} for top-level imports, plus all loaded modules
+def profile_once() -> Tuple[Dict[str, int], List[str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", ENTRY],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Entry point failed to import:\n{result.stderr}")
+    top_level = {}
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, module = int(match.group(2)), len(match.group(3)), match.group(4)
+        modules.append(module)
+        if indent == 1:
+            top_level[module] = top_level.get(module, 0) + cumulative
+    return top_level, modules
+
+
+def profile() -> Tuple[int, Dict[str, int], List[str]]:
+    best = None
+    for _ in range(RUNS):
+        top_level, modules = profile_once()
+        total = sum(top_level.values())
+        if best is None or total < best[0]:
+            best = (total, top_level, modules)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check app startup import time against a recorded baseline.")
+    parser.add_argument("--update", action="store_true", help="Record the current profile as the new baseline")
+    args = parser.parse_args()
+
+    total, top_level, modules = profile()
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:10]
+    print(f"Startup imports: {total / 1000:.0f} ms (best of {RUNS})")
+    for module, cumulative in slowest:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    loaded = sorted({
+        deferred for deferred in DEFERRED_MODULES
+        if any(module == deferred or module.startswith(deferred + ".") for module in modules)
+    })
+    if loaded:
+        print(f"FAIL: heavy modules loaded at startup: {', '.join(loaded)}")
+        return 1
+
+    if args.update:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({"entry": ENTRY, "total_us": total, "top_level_us": dict(slowest)}, f, indent=4)
+            f.write("\n")
+        print(f"Baseline written to {os.path.relpath(BASELINE_PATH, ROOT)}")
+        return 0
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    limit = baseline["total_us"] * (1 + TOLERANCE)
+    if total > limit:
+        print(f"FAIL: startup imports took {total / 1000:.0f} ms, over the {limit / 1000:.0f} ms limit "
+              f"({baseline['total_us'] / 1000:.0f} ms baseline + {TOLERANCE:.0%})")
+        return 1
+    print(f"OK: within {limit / 1000:.0f} ms limit ({baseline['total_us'] / 1000:.0f} ms baseline + {TOLERANCE:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+
+# Create or repair an org's aggregate counts from its suppliers, e.g. for orgs that existed before the counts did
+#   python scripts/recompute_aggregates.py <org_id>
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Recompute the ESG aggregate counts of an org from its suppliers.")
+    parser.add_argument("org_ids", nargs="+", help="Organizations to recompute")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from utils.db import db
+
+    for org_id in args.org_ids:
+        started = time.perf_counter()
+        aggregates = db.recompute_org_aggregates(org_id=org_id)
+        print(f"{org_id}: {aggregates.total} suppliers, segments {aggregates.segments} in {time.perf_counter() - started:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+
+# Re-segment an org's suppliers after a change to the scoring policy, without re-running any agents
+#   SCORING_POLICY='{"medium_max": 4}' python scripts/rescore_segments.py <org_id>
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Re-score ESG segments for every supplier of an org.")
+    parser.add_argument("org_ids", nargs="+", help="Organizations to re-score")
+    args = parser.parse_args()
+
+    load_dotenv()
+    from utils.db import db
+    from utils.scoring import policy
+
+    print(f"Scoring policy: {policy.model_dump()}")
+    for org_id in args.org_ids:
+        started = time.perf_counter()
+        changed = db.rescore_org_segments(org_id=org_id)
+        print(f"{org_id}: {len(changed)} segments changed in {time.perf_counter() - started:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+from utils.supplier_data import Supplier, ESGData, DataSummary, Source
+from utils.esg_history import esg_state, history_entries, reconstruct, HISTORY_EPOCH
+
+
+RESEARCHED = datetime(2024, 3, 1, tzinfo=timezone.utc)
+REFRESHED = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+def summary(available: bool, text: str, link: str = None) -> DataSummary:
+    sources = [Source(key_quote=text, link=link)] if link else []
+    return DataSummary(available=available, summary=text, sources=sources)
+
+
+def supplier(updated: datetime, scope_3: DataSummary, segment: str = "Medium") -> Supplier:
+    return Supplier(
+        id="acme",
+        name="Acme",
+        esg=ESGData(
+            scope_1=summary(True, "Scope 1: 1,200 tCO2e", "https://acme.com/report.pdf"),
+            scope_2=summary(True, "Scope 2: 800 tCO2e", "https://acme.com/report.pdf"),
+            scope_3=scope_3,
+            ecovadis=summary(False, "No rating found"),
+            reduction_targets=summary(True, "Net zero by 2040", "https://acme.com/climate"),
+            iso_14001=summary(False, "No certificate found"),
+            product_lca=summary(False, "No LCA found"),
+            segment=segment,
+            updated=updated,
+        ),
+    )
+
+
+def test_supplier_without_history_gets_base_entry():
+    before = esg_state(supplier(RESEARCHED, summary(False, "No scope 3 found")))
+    after = esg_state(supplier(REFRESHED, summary(True, "Scope 3: 9,000 tCO2e", "https://acme.com/cdp"), segment="High"))
+
+    entries = history_entries(before, after, has_history=False)
+    assert [entry["timestamp"] for entry in entries] == [RESEARCHED, REFRESHED]
+    # The delta alone only covers scope_3 and the segment
+    assert set(entries[1]["changes"]) == {"scope_3"}
+
+    # Both the state before the refresh and the unchanged criteria after it replay in full
+    assert reconstruct(entries, at=RESEARCHED + timedelta(days=1)).model_dump() == before.model_dump()
+    assert reconstruct(entries, at=REFRESHED).model_dump() == after.model_dump()
+    assert reconstruct(entries, at=RESEARCHED - timedelta(days=1)) is None
+
+
+def test_supplier_with_history_gets_delta_only():
+    before = esg_state(supplier(RESEARCHED, summary(False, "No scope 3 found")))
+    after = esg_state(supplier(REFRESHED, summary(True, "Scope 3: 9,000 tCO2e", "https://acme.com/cdp")))
+
+    entries = history_entries(before, after, has_history=True)
+    assert len(entries) == 1
+    assert entries[0]["timestamp"] == REFRESHED
+
+
+def test_unchanged_supplier_without_history_still_gets_base_entry():
+    before = esg_state(supplier(RESEARCHED, summary(False, "No scope 3 found")))
+
+    entries = history_entries(before, before, has_history=False)
+    assert len(entries) == 1
+    assert reconstruct(entries, at=REFRESHED).model_dump() == before.model_dump()
+
+
+def test_base_entry_without_research_date_sorts_first():
+    before = esg_state(supplier(RESEARCHED, summary(False, "No scope 3 found")))
+    before.updated = None
+    after = esg_state(supplier(REFRESHED, summary(True, "Scope 3: 9,000 tCO2e", "https://acme.com/cdp")))
+
+    entries = history_entries(before, after, has_history=False)
+    assert entries[0]["timestamp"] == HISTORY_EPOCH
+    assert reconstruct(entries, at=REFRESHED).criteria["scope_1"].available
+
+
+def test_rescored_supplier_without_history_keeps_its_criteria():
+    before = esg_state(supplier(RESEARCHED, summary(False, "No scope 3 found")))
+    after = before.model_copy(update={"segment": "High", "updated": REFRESHED})
+
+    entries = history_entries(before, after, has_history=False)
+    assert entries[1] == {"segment": "High", "timestamp": REFRESHED}
+    state = reconstruct(entries, at=REFRESHED)
+    assert state.segment == "High"
+    assert state.criteria == before.criteria
@@ -0,0 +1,53 @@
+import pytest
+
+from utils.criteria import CRITERIA, EvidenceDetector, company_terms
+
+
+def detector(key: str) -> EvidenceDetector:
+    criterion = next(criterion for criterion in CRITERIA if criterion.key == key)
+    return criterion.detector(name="Acme Ltd", website="https://www.acme.com/about")
+
+
+def found(key: str, text: str) -> bool:
+    evidence = detector(key)
+    return len(evidence.matches(text)) >= evidence.threshold
+
+
+@pytest.mark.parametrize("key, text", [
+    ("scope_1", "In 2023 Acme reported Scope 1 emissions of 12,345 tCO2e."),
+    ("scope_2", "Acme's Scope 1 and 2 emissions were 4,200 tonnes CO2e in 2023."),
+    ("ecovadis", "Acme has been awarded an EcoVadis Gold medal for the second year running."),
+    ("ecovadis", "Acme holds a Silver rating from EcoVadis."),
+    ("reduction_targets", "Acme commits to reduce absolute emissions 42% by 2030 from a 2020 base year."),
+    ("iso_14001", "Acme is ISO 14001 certified across all its UK sites."),
+    ("product_lca", "Acme publishes a life cycle assessment and an Environmental Product Declaration for each range."),
+])
+def test_claims_by_the_company_are_evidence(key, text):
+    assert found(key, text)
+
+
+@pytest.mark.parametrize("key, text", [
+    ("iso_14001", "We are not ISO 14001 certified, Acme said."),
+    ("iso_14001", "Does Acme have ISO 14001 certification?"),
+    ("iso_14001", "ISO 14001 Certification - What is it?"),
+    ("ecovadis", "EcoVadis awards Gold, Silver and Bronze medals. Acme is one of its customers."),
+    ("product_lca", "LCA and EPD explained"),
+    ("reduction_targets", "Companies should reduce emissions 50% by 2030, says IPCC"),
+    ("reduction_targets", "Companies reduce emissions 50% by 2030 in the IPCC scenario."),
+    ("scope_1", "Scope 1 emissions of 12,345 tCO2e were reported by another company."),
+])
+def test_denials_questions_and_general_text_are_not_evidence(key, text):
+    assert not found(key, text)
+
+
+def test_company_is_named_by_name_without_legal_form_or_domain():
+    assert company_terms("Acme Ltd.", "https://www.acme.com/about") == ["Acme Ltd.", "acme.com", "Acme"]
+    assert found("scope_1", "acme.com: Scope 1 emissions 1,000 tCO2e.")
+
+
+def test_no_detector_without_the_company():
+    assert all(criterion.detector() is None for criterion in CRITERIA)
+
+
+def test_only_scraped_pages_are_checked():
+    assert EvidenceDetector.tools == ["scrape_website"]
@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from utils import local_store as local_store_module
+from utils.local_store import LocalStore
+from utils.criteria import CRITERIA
+from utils.supplier_data import Supplier, ESGData, DataSummary, supplier_changed
+
+
+def day(n: int) -> datetime:
+    return datetime(2025, 1, n, tzinfo=timezone.utc)
+
+
+def supplier(supplier_id: str, name: str, updated: datetime, segment: str = "Low", scope_1: bool = False) -> Supplier:
+    data = {criterion.key: DataSummary(available=False, summary="", sources=[]) for criterion in CRITERIA}
+    data["scope_1"] = DataSummary(available=scope_1, summary="", sources=[])
+    return Supplier(id=supplier_id, name=name, esg=ESGData(**data, segment=segment, updated=updated))
+
+
+class Remote():
+    # Stands in for the Firestore queries the mirror syncs from
+    def __init__(self) -> None:
+        self.suppliers = {}
+        self.since = []
+
+
+    def get_org_suppliers_updated_since(self, org_id, since=None):
+        self.since.append(since)
+        changed = [s for s in self.suppliers.values() if since is None or supplier_changed(s) >= since]
+        return sorted(changed, key=supplier_changed)
+
+
+    def get_org_supplier_ids(self, org_id):
+        return list(self.suppliers)
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    remote = Remote()
+    monkeypatch.setattr(local_store_module.db, "get_org_suppliers_updated_since", remote.get_org_suppliers_updated_since)
+    monkeypatch.setattr(local_store_module.db, "get_org_supplier_ids", remote.get_org_supplier_ids)
+    return remote
+
+
+def names(store: LocalStore, **filters) -> list:
+    return [s.name for s in store.get_suppliers(org_id="org", **filters)]
+
+
+def test_sync_pulls_changes_since_cursor_and_drops_deleted(remote, tmp_path):
+    store = LocalStore(str(tmp_path / "mirror.db"))
+    remote.suppliers = {"a": supplier("a", "Acme", day(1)), "b": supplier("b", "Bolt", day(2), scope_1=True)}
+    assert store.sync(org_id="org", force=True) == 2
+    assert names(store) == ["Acme", "Bolt"]
+    assert names(store, criterion="scope_1") == ["Bolt"]
+
+    # Bolt deleted, Crane added, Acme re-scored without new research
+    del remote.suppliers["b"]
+    remote.suppliers["c"] = supplier("c", "Crane", day(3))
+    rescored = supplier("a", "Acme", day(1), segment="High")
+    rescored.esg.segment_updated = day(4)
+    remote.suppliers["a"] = rescored
+
+    assert store.sync(org_id="org", force=True) == 2
+    assert remote.since[-1] == day(2)
+    assert names(store) == ["Acme", "Crane"]
+    assert names(store, segment="High") == ["Acme"]
+    assert names(store, criterion="scope_1") == []
+
+    # The cursor moved on to the re-scored segment, only the supplier at the cursor is pulled again
+    assert store.sync(org_id="org", force=True) == 1
+    assert remote.since[-1] == day(4)
+
+
+def test_sync_is_throttled_unless_forced(remote, tmp_path):
+    store = LocalStore(str(tmp_path / "mirror.db"))
+    remote.suppliers = {"a": supplier("a", "Acme", day(1))}
+    assert store.sync(org_id="org") == 1
+    remote.suppliers["b"] = supplier("b", "Bolt", day(2))
+    assert store.sync(org_id="org") == 0
+    assert names(store) == ["Acme"]
+    # The cursor is inclusive, so Acme at the cursor is pulled again along with Bolt
+    assert store.sync(org_id="org", force=True) == 2
+    assert names(store) == ["Acme", "Bolt"]
+
+
+def test_writes_through_listener_events(remote, tmp_path):
+    store = LocalStore(str(tmp_path / "mirror.db"))
+    store.on_supplier_change("insert", "org", supplier("a", "Acme", day(1)))
+    store.on_supplier_change("insert", "org", supplier("b", "Bolt", day(1)))
+    store.on_supplier_change("segments", "org", {"a": "High"})
+    store.on_supplier_change("delete", "org", "b")
+    assert names(store, segment="High") == ["Acme"]
+    assert [s.esg.segment for s in store.get_suppliers(org_id="org")] == ["High"]
+    assert names(store, name_prefix="ac") == ["Acme"]
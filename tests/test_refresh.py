@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+from utils import pipeline
+from utils.agent import AgentRunStats
+from utils.criteria import CRITERIA
+from utils.supplier_data import Supplier, ESGData, DataSummary, Source
+
+
+RESEARCHED = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def stored_supplier() -> Supplier:
+    data = {
+        criterion.key: DataSummary(
+            available=True,
+            summary=f"Found {criterion.label}",
+            sources=[Source(key_quote="quote", link="https://acme.com/report.pdf")],
+        )
+        for criterion in CRITERIA
+    }
+    return Supplier(
+        id="acme",
+        name="Acme",
+        esg=ESGData(**data, segment="High", updated=RESEARCHED, criteria_updated={criterion.key: RESEARCHED for criterion in CRITERIA}),
+    )
+
+
+def fake_runs(monkeypatch, stopped_keys: set, found_keys: set) -> None:
+    def obtain_esg_data(label, task, response_format, reporter, cancel_token=None, key=None, evidence=None, runs=None):
+        runs.append(AgentRunStats(iterations=3, tokens=1000, stopped=key in stopped_keys))
+        return DataSummary(available=key in found_keys, summary="new", sources=[])
+    monkeypatch.setattr(pipeline, "obtain_esg_data", obtain_esg_data)
+
+
+def test_stopped_run_without_evidence_keeps_stored_criterion(monkeypatch):
+    fake_runs(monkeypatch, stopped_keys={"ecovadis"}, found_keys=set())
+    refreshed = pipeline.refresh_supplier(stored_supplier(), force=True)
+
+    assert refreshed.esg.ecovadis.available
+    assert refreshed.esg.ecovadis.summary == "Found Ecovadis Score"
+    assert refreshed.esg.criteria_updated["ecovadis"] == RESEARCHED
+    # Runs that finished replace the stored data, even when they found nothing
+    assert not refreshed.esg.scope_1.available
+    assert refreshed.esg.criteria_updated["scope_1"] > RESEARCHED
+
+
+def test_stopped_run_with_evidence_is_saved(monkeypatch):
+    fake_runs(monkeypatch, stopped_keys={"ecovadis"}, found_keys={"ecovadis"})
+    refreshed = pipeline.refresh_supplier(stored_supplier(), force=True)
+
+    assert refreshed.esg.ecovadis.summary == "new"
+    assert refreshed.esg.criteria_updated["ecovadis"] > RESEARCHED
@@ -0,0 +1,53 @@
+import pytest
+
+from utils import run_stats as run_stats_module
+from utils.run_stats import RunStats, percentile, MAX_ITERATIONS, MIN_ITERATIONS, RUN_STATS_MIN_RUNS
+
+
+@pytest.fixture
+def stats(tmp_path):
+    return RunStats(str(tmp_path / "runs.db"))
+
+
+def record(stats: RunStats, criterion: str, runs: list, available: bool = True) -> None:
+    for iterations, tokens in runs:
+        stats.record(criterion, iterations=iterations, tokens=tokens, available=available, stopped=False, seconds=1.0)
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.95) == 95
+    assert percentile(values, 1.0) == 100
+    assert percentile([7], 0.95) == 7
+
+
+def test_default_budget_until_enough_successful_runs(stats):
+    record(stats, "scope_1", [(5, 1000)] * (RUN_STATS_MIN_RUNS - 1))
+    record(stats, "scope_1", [(9, 9000)] * 10, available=False)
+    budget = stats.budget("scope_1")
+    assert (budget.max_iterations, budget.max_tokens) == (MAX_ITERATIONS, None)
+    assert (budget.runs, budget.successful) == (RUN_STATS_MIN_RUNS + 9, RUN_STATS_MIN_RUNS - 1)
+
+
+def test_budget_is_p95_of_successful_runs_with_headroom(stats):
+    # 19 of 20 successful runs took 8 iterations, 1 took 12, unsuccessful runs don't count
+    record(stats, "scope_1", [(8, 10_000)] * 19 + [(12, 50_000)])
+    record(stats, "scope_1", [(20, 90_000)] * 5, available=False)
+    budget = stats.budget("scope_1")
+    assert budget.max_iterations == 8 + 2
+    assert budget.max_tokens == int(10_000 * run_stats_module.TOKEN_BUDGET_MARGIN)
+    assert budget.successful == 20
+
+
+def test_iteration_budget_is_clamped(stats):
+    record(stats, "ecovadis", [(1, 500)] * RUN_STATS_MIN_RUNS)
+    record(stats, "scope_3", [(40, 500)] * RUN_STATS_MIN_RUNS)
+    assert stats.budget("ecovadis").max_iterations == MIN_ITERATIONS
+    assert stats.budget("scope_3").max_iterations == MAX_ITERATIONS
+
+
+def test_budget_is_recomputed_after_new_runs(stats):
+    record(stats, "scope_1", [(6, 1000)] * RUN_STATS_MIN_RUNS)
+    assert stats.budget("scope_1").max_iterations == 8
+    record(stats, "scope_1", [(10, 1000)] * RUN_STATS_MIN_RUNS)
+    assert stats.budget("scope_1").max_iterations == 12
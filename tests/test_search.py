@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+
+from utils.search import suppliers_version
+from utils.criteria import CRITERIA
+from utils.supplier_data import Supplier, ESGData, DataSummary
+
+
+UPDATED = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def supplier(segment: str) -> Supplier:
+    data = {criterion.key: DataSummary(available=False, summary="", sources=[]) for criterion in CRITERIA}
+    return Supplier(id="acme", name="Acme", esg=ESGData(**data, segment=segment, updated=UPDATED))
+
+
+def test_rescored_segment_changes_the_version():
+    before = supplier("Medium")
+    after = supplier("High")
+    assert suppliers_version([before]) != suppliers_version([after])
+
+    rescored = supplier("Medium")
+    rescored.esg.segment_updated = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert suppliers_version([before]) != suppliers_version([rescored])
+    assert suppliers_version([before]) == suppliers_version([supplier("Medium")])
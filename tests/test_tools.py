@@ -0,0 +1,54 @@
+import json
+from datetime import datetime, timezone
+
+from utils import tools
+from utils.tools import SupplierDataIndex, SupplierDataTool
+from utils.criteria import CRITERIA
+from utils.supplier_data import Supplier, ESGData, DataSummary
+
+
+UPDATED = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def supplier(supplier_id: str, name: str, segment: str, available: set) -> Supplier:
+    data = {
+        criterion.key: DataSummary(available=criterion.key in available, summary=f"{name} {criterion.key}", sources=[])
+        for criterion in CRITERIA
+    }
+    return Supplier(id=supplier_id, name=name, esg=ESGData(**data, segment=segment, updated=UPDATED))
+
+
+SUPPLIERS = [
+    supplier("b", "Bolt GmbH", "Medium", {"scope_1"}),
+    supplier("a", "Acme Ltd", "High", {"scope_1", "ecovadis"}),
+    supplier("c", "Crane Inc", "Low", set()),
+]
+
+
+def test_index_filters_by_criterion_and_segment():
+    index = SupplierDataIndex(SUPPLIERS, version="v1")
+    assert [s.name for s in index.query(org_id="org")] == ["Acme Ltd", "Bolt GmbH", "Crane Inc"]
+    assert [s.name for s in index.query(org_id="org", criterion="scope_1")] == ["Acme Ltd", "Bolt GmbH"]
+    assert [s.name for s in index.query(org_id="org", criterion="scope_1", available=False)] == ["Crane Inc"]
+    assert [s.name for s in index.query(org_id="org", criterion="scope_1", segment="high")] == ["Acme Ltd"]
+    assert [s.name for s in index.query(org_id="org", name="crane")][:1] == ["Crane Inc"]
+
+
+def test_tool_describes_only_the_criterion_asked_about(monkeypatch):
+    monkeypatch.setattr(tools, "get_org_suppliers", lambda org_id: SUPPLIERS)
+    tool = SupplierDataTool()
+    tool.set_org("org")
+
+    result = json.loads(tool.func(criterion="ecovadis"))
+    assert (result["total_suppliers"], result["num_matches"]) == (3, 1)
+    match = result["matches"][0]
+    assert match["name"] == "Acme Ltd"
+    assert match["criteria_available"] == ["scope_1", "ecovadis"]
+    assert "ecovadis" in match and "scope_1" not in match
+
+
+def test_tool_reports_bad_arguments_and_missing_org():
+    tool = SupplierDataTool()
+    assert "no organization" in tool.func()
+    tool.set_org("org")
+    assert "criterion must be one of" in tool.func(criterion="scope_4")
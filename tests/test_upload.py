@@ -0,0 +1,59 @@
+import io
+
+import pytest
+
+from utils.upload import parse_supplier_names
+
+
+CSV = (
+    "id,Supplier Names ,country\n"
+    "1,Acme Ltd,UK\n"
+    "2,  acme ltd ,UK\n"
+    "3,,UK\n"
+    "4,12345,UK\n"
+    f"5,{'x' * 201},UK\n"
+    "6,Bolt GmbH,DE\n"
+    "7,Crane Inc,US\n"
+).encode()
+
+
+def xlsx(rows: list) -> bytes:
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 10000])
+def test_csv_names_are_cleaned_and_deduplicated_across_chunks(chunk_size):
+    result = parse_supplier_names(CSV, "suppliers.CSV", chunk_size=chunk_size)
+    assert result.names == ["Acme Ltd", "Bolt GmbH", "Crane Inc"]
+    assert (result.total_rows, result.rejected, result.duplicates) == (6, 2, 1)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 10000])
+def test_xlsx_reads_only_the_names_column(chunk_size):
+    data = xlsx([
+        ["id", "SUPPLIER NAMES"],
+        [1, "Acme Ltd"],
+        [2, "ACME LTD"],
+        [3, None],
+        [4, 2024],
+        [5, "Bolt GmbH"],
+    ])
+    result = parse_supplier_names(data, "suppliers.xlsx", chunk_size=chunk_size)
+    assert result.names == ["Acme Ltd", "Bolt GmbH"]
+    assert (result.total_rows, result.rejected, result.duplicates) == (4, 1, 1)
+
+
+@pytest.mark.parametrize("filename, data", [
+    ("suppliers.csv", b"id,name\n1,Acme\n"),
+    ("suppliers.xlsx", xlsx([["id", "name"], [1, "Acme"]])),
+])
+def test_missing_names_column_is_an_error(filename, data):
+    with pytest.raises(ValueError, match="Supplier Names"):
+        parse_supplier_names(data, filename)
@@ -1,6 +1,8 @@
 import json
-from typing import List, Optional
-from pydantic import BaseModel, PrivateAttr, Field
+import time
+import threading
+from typing import Any, List, Optional, Set
+from pydantic import BaseModel, ConfigDict, PrivateAttr, Field
 from enum import Enum
 from dotenv import load_dotenv
 
@@ -35,11 +37,66 @@ class StepCheck(BaseModel):
     complete: bool = Field(description="true if the current step is complete")
 
 
+# Cooperative cancellation for agent runs: cancelled when cancel() is called, its deadline passes,
+# or its parent is cancelled, e.g. a criterion's token as a child of its company's token
+class CancelToken():
+
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional["CancelToken"] = None) -> None:
+        self._event = threading.Event()
+        self._parent = parent
+        self.deadline = time.monotonic() + timeout if timeout else None
+        if parent is not None and parent.deadline is not None:
+            self.deadline = parent.deadline if self.deadline is None else min(self.deadline, parent.deadline)
+
+
+    def cancel(self) -> None:
+        self._event.set()
+
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self._parent is not None and self._parent.cancelled
+
+
+    def child(self, timeout: Optional[float] = None) -> "CancelToken":
+        return CancelToken(timeout=timeout, parent=self)
+
+
+class AgentCancelled(Exception):
+    pass
+
+
+# What an agent's last run used, stopped when it was cancelled or ran out of tokens
+class AgentRunStats(BaseModel):
+    iterations: int
+    tokens: int
+    stopped: bool = False
+
+
 class Agent(BaseAgent):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # Checked between steps and before every driver and tool call, a cancelled run
+    # skips to its output step and answers with what it has found so far
+    cancel_token: Optional[CancelToken] = Field(default=None)
+    # Tokens a run may use before it skips to its output step, None for no limit
+    token_budget: Optional[int] = Field(default=None)
+    # Local check of tool results, anything with matches(text) -> set of evidence found, a threshold and
+    # the names of the tools whose results it reads, the run skips straight to its output step
+    # once enough distinct evidence has been seen
+    evidence: Optional[Any] = Field(default=None)
     _memory_chat: List[DriverMessage] = PrivateAttr(default=[])
     _memory_curr_execution: List[DriverMessage] = PrivateAttr(default=[])
     _next_step: NextStep = PrivateAttr(default=NextStep.PLAN)
     _num_curr_iterations: int = PrivateAttr(default=0)
+    _num_curr_tokens: int = PrivateAttr(default=0)
+    _last_run: Optional[AgentRunStats] = PrivateAttr(default=None)
+    _evidence_found: Set = PrivateAttr(default_factory=set)
 
 
     def __init__(self, **data):
@@ -72,6 +129,10 @@ class Agent(BaseAgent):
         try:
             if self._num_curr_iterations == self.max_iterations - 1:
                 return self._output()
+            if self._is_cancelled():
+                return self._output(partial=True)
+            if self.token_budget is not None and self._num_curr_tokens >= self.token_budget:
+                return self._output(partial=True)
             self._num_curr_iterations += 1
 
             match self._next_step:
@@ -83,9 +144,38 @@ class Agent(BaseAgent):
                     return self._observe()
                 case NextStep.OUTPUT:
                     return self._output()
+        except AgentCancelled:
+            try:
+                return self._output(partial=True)
+            except Exception as e:
+                print(str(e))
+                return self._output(error=True)
         except Exception as e:
             print(str(e))
             return self._output(error=True)
+
+
+    def _is_cancelled(self) -> bool:
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+
+    def _generate(self, driver_input: DriverInput):
+        # Calls already in flight run to completion, bounded by the client timeouts
+        if self._is_cancelled():
+            raise AgentCancelled()
+        response = self.driver.generate(input=driver_input)
+        self._count_tokens(response)
+        return response
+
+
+    def _count_tokens(self, response) -> None:
+        if response.usage is not None:
+            self._num_curr_tokens += response.usage.total_tokens
+
+
+    @property
+    def last_run(self) -> Optional[AgentRunStats]:
+        return self._last_run
             
 
     def _plan(self) -> AgentStep:
@@ -97,7 +187,7 @@ class Agent(BaseAgent):
             messages=messages,
             temperature=0.0,
         )
-        response = self.driver.generate(input=driver_input)
+        response = self._generate(driver_input)
         self._memory_curr_execution.append(AssistantMessage(role="assistant", content=response.content))
         self._next_step = NextStep.ACTION
         return AgentStep(content=response.content)
@@ -113,7 +203,7 @@ class Agent(BaseAgent):
             tool_choice=DriverToolChoice.AUTO,
             temperature=0.0,
         )
-        response = self.driver.generate(input=driver_input)
+        response = self._generate(driver_input)
         tool_calls = response.tool_calls
 
         # If no tools called, 
@@ -127,7 +217,10 @@ class Agent(BaseAgent):
         else:
             tool_messages = []
             observations = ""
+            evidence_text = ""
             for tool_call in tool_calls:
+                if self._is_cancelled():
+                    raise AgentCancelled()
                 # Get function call info
                 function_name = tool_call.name
                 function_args = json.loads(tool_call.args)
@@ -152,6 +245,8 @@ class Agent(BaseAgent):
 
                             # Add to overall observations
                             observations += "\n\n" + function_result
+                            if self.evidence is not None and function_name in self.evidence.tools:
+                                evidence_text += "\n\n" + function_result
                     except Exception as e:
                         observations += "\n\n" + f"Error: {e}"
                 
@@ -164,6 +259,12 @@ class Agent(BaseAgent):
             self._memory_curr_execution += tool_messages
             self._next_step = NextStep.OBSERVE
 
+            # Skip the OBSERVE check when the results already hold enough evidence to answer
+            if self.evidence is not None:
+                self._evidence_found |= self.evidence.matches(evidence_text)
+                if len(self._evidence_found) >= self.evidence.threshold:
+                    self._next_step = NextStep.OUTPUT
+
             # Return string concatenated version of condensed tool call results
             tool_observe = ""
             for tool_call in tool_calls:
@@ -193,7 +294,7 @@ class Agent(BaseAgent):
             temperature=0.0,
             response_format="json_object"
         )
-        completed = self.driver.generate(input=driver_input)
+        completed = self._generate(driver_input)
         completed = json.loads(completed.content)["complete"]
 
         if completed:
@@ -206,20 +307,26 @@ class Agent(BaseAgent):
             return AgentStep(content=f"Continuing Task...")
 
 
-    def _output(self, error: bool = False) -> AgentResult:
+    def _output(self, error: bool = False, partial: bool = False) -> AgentResult:
         if error:
             agent_response = "An error occurred. Please try again."
         else:
             result_prompt = f"""
             ANSWER THE USER'S REQUEST.
             """
+            if partial:
+                result_prompt = f"""
+                YOU MUST STOP NOW. ANSWER THE USER'S REQUEST WITH ONLY WHAT YOU HAVE FOUND SO FAR.
+                """
             self._memory_curr_execution.append(SystemMessage(role="system", content=result_prompt))
             driver_input = DriverInput(
                 messages=self._memory_chat + self._memory_curr_execution,
                 temperature=0.0,
                 response_format=self.response_format,
             )
-            agent_response = self.driver.generate(input=driver_input).content
+            response = self.driver.generate(input=driver_input)
+            self._count_tokens(response)
+            agent_response = response.content
         
         self._memory_chat.append(AssistantMessage(role="assistant", content=str(agent_response)))
 
@@ -229,9 +336,12 @@ class Agent(BaseAgent):
             self._memory_chat.pop(1)
 
         # Reset state to intake new task
+        self._last_run = AgentRunStats(iterations=self._num_curr_iterations, tokens=self._num_curr_tokens, stopped=partial)
         self._next_step = NextStep.PLAN
         self._memory_curr_execution.clear()
         self._num_curr_iterations = 0
+        self._num_curr_tokens = 0
+        self._evidence_found = set()
 
         # Return final output
         return AgentResult(content=agent_response)
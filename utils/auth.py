@@ -1,14 +1,76 @@
 import requests
 import os
-from typing import Union, Any
-from firebase_admin import auth
+import time
+import hashlib
+import threading
+from typing import Union, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.db import DB
 
 FIREBASE_API_KEY = os.getenv("FIREBASE_API_KEY")
 
+# Timeout in seconds for Identity Toolkit calls, as (connect, read)
+AUTH_TIMEOUT = (5, 15)
+
+# Transient failures are retried with backoff, connection errors and these status codes only
+AUTH_RETRIES = 3
+AUTH_RETRY_STATUSES = (429, 502, 503, 504)
+
+# Verified token claims are reused for at most this many seconds, and never past the token's expiry
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_SIZE = 1024
+
+# ID tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+
 
 class Auth():
 
 
+    def __init__(self) -> None:
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._token_cache = {}
+        self._token_lock = threading.Lock()
+
+
+    @property
+    def session(self) -> requests.Session:
+        # Pooled keep-alive session shared by every sign in, created on first use
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    retry = Retry(
+                        total=AUTH_RETRIES,
+                        backoff_factor=0.3,
+                        status_forcelist=AUTH_RETRY_STATUSES,
+                        allowed_methods=["POST"],
+                        raise_on_status=False,
+                    )
+                    session = requests.Session()
+                    session.mount("https://", HTTPAdapter(max_retries=retry))
+                    self._session = session
+        return self._session
+
+
+    def _post(self, url: str, **kwargs) -> tuple[Optional[int], dict]:
+        # Returns (status, data), with no status if the service could not be reached
+        try:
+            response = self.session.post(url, timeout=AUTH_TIMEOUT, **kwargs)
+            return response.status_code, response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error calling Firebase Auth: {e}")
+            return None, {}
+
+
+    @staticmethod
+    def _stamp_expiry(data: dict) -> dict:
+        # Record when the ID token expires so it can be refreshed before then
+        data["expiresAt"] = time.time() + int(data.get("expiresIn", 3600))
+        return data
+
+
     def sign_up(self, email: str, password: str) -> tuple[Union[dict, None], str]:
         # Firebase Auth sign up API
         url = f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={FIREBASE_API_KEY}"
@@ -17,13 +79,11 @@ class Auth():
             "password": password,
             "returnSecureToken": True
         }
-        response = requests.post(url, json=payload)
-        status = response.status_code
-        data = response.json()
+        status, data = self._post(url, json=payload)
 
         # Error handling
         if status == 200:
-            return data, "Sign up successful"
+            return self._stamp_expiry(data), "Sign up successful"
         elif status == 400:
             error_message = data["error"]["message"]
             return None, f"Sign up failed: {error_message}"
@@ -39,13 +99,11 @@ class Auth():
             "password": password,
             "returnSecureToken": True
         }
-        response = requests.post(url, json=payload)
-        status = response.status_code
-        data = response.json()
+        status, data = self._post(url, json=payload)
 
         # Error handling
         if status == 200:
-            return data, "Sign in successful"
+            return self._stamp_expiry(data), "Sign in successful"
         elif status == 400:
             error_message = data["error"]["message"]
             return None, f"Sign in failed: {error_message}"
@@ -60,9 +118,7 @@ class Auth():
             "requestType":"PASSWORD_RESET",
             "email": email,
         }
-        response = requests.post(url, json=payload)
-        status = response.status_code
-        data = response.json()
+        status, data = self._post(url, json=payload)
 
         # Error handling
         if status == 200:
@@ -76,17 +132,64 @@ class Auth():
 
     def delete_user(self, uid: str) -> tuple[bool, str]:
         try:
-            auth.delete_user(uid=uid)
+            DB.ensure_firebase_admin()
+            # Imported here since the Admin SDK auth stack is slow to load
+            from firebase_admin import auth as firebase_auth
+
+            firebase_auth.delete_user(uid=uid)
             return True, "Account successfully deleted"
         except Exception:
             return False, "Account deletion failed"
 
 
+    def refresh_session(self, session_data: dict) -> bool:
+        # Exchange the refresh token for a new ID token, updating session_data in place
+        url = f"https://securetoken.googleapis.com/v1/token?key={FIREBASE_API_KEY}"
+        payload = {
+            "grant_type": "refresh_token",
+            "refresh_token": session_data.get("refreshToken"),
+        }
+        status, data = self._post(url, data=payload)
+        if status != 200:
+            return False
+        session_data["idToken"] = data["id_token"]
+        session_data["refreshToken"] = data["refresh_token"]
+        session_data["expiresIn"] = data["expires_in"]
+        self._stamp_expiry(session_data)
+        return True
+
+
     def verify_session_token(self, token: str) -> Any:
+        key = hashlib.sha256(token.encode()).hexdigest()
+        now = time.time()
+        with self._token_lock:
+            cached = self._token_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
         try:
-            decoded_token = auth.verify_id_token(id_token=token)
-            return decoded_token
+            DB.ensure_firebase_admin()
+            from firebase_admin import auth as firebase_auth
+
+            decoded_token = firebase_auth.verify_id_token(id_token=token)
         except Exception:
             return None
 
+        # Cache the claims until the TTL passes or the token expires, whichever is first
+        expires = min(now + TOKEN_CACHE_TTL, decoded_token.get("exp", now))
+        with self._token_lock:
+            if len(self._token_cache) >= TOKEN_CACHE_SIZE:
+                self._token_cache = {k: v for k, v in self._token_cache.items() if v[1] > now}
+                if len(self._token_cache) >= TOKEN_CACHE_SIZE:
+                    del self._token_cache[min(self._token_cache, key=lambda k: self._token_cache[k][1])]
+            self._token_cache[key] = (decoded_token, expires)
+        return decoded_token
+
+
+    def ensure_session(self, session_data: dict) -> bool:
+        # Refresh the ID token shortly before it expires, then check it is still valid
+        if time.time() > session_data.get("expiresAt", 0) - TOKEN_REFRESH_MARGIN:
+            if not self.refresh_session(session_data):
+                return False
+        return self.verify_session_token(session_data["idToken"]) is not None
+
 auth = Auth()
\ No newline at end of file
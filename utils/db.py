@@ -1,34 +1,66 @@
-from typing import Optional, List, Any
-from datetime import datetime
+from typing import Optional, List, Dict, Any, Callable, Iterator
+from datetime import datetime, timezone
 
 from pydantic import ValidationError
-from firebase_admin import firestore
 import firebase_admin
 import json
 import os
-from google.cloud import secretmanager
-from utils.supplier_data import Supplier
+import time
+import threading
+from utils.supplier_data import Supplier, ESG_CRITERIA, expand_supplier, supplier_changed
+from utils.criteria import supplier_document
+from utils.evidence_index import EvidenceIndex, EvidenceHit
+from utils.esg_history import ESGState, esg_state, esg_delta, history_entries, reconstruct
+from utils.aggregates import OrgAggregates, aggregate_diff, compute_aggregates
+from utils.scoring import ScoringPolicy, availability_matrix, segment_matrix
+
+# Seconds before an org's evidence index is rebuilt, picks up suppliers written by other processes
+EVIDENCE_INDEX_TTL = float(os.getenv("EVIDENCE_INDEX_TTL", "300"))
+
+# Suppliers re-segmented per Firestore batch, each takes up to three writes and batches allow 500
+SEGMENT_BATCH_SIZE = 150
 
 
 class DB():
     _instance = None
     firebase_admin_init = False
+    _listeners: List[Callable[[str, str, Any], None]] = []
+    _evidence_indexes: dict = {}
+    _evidence_lock = threading.Lock()
+
+    _client = None
+    _init_lock = threading.Lock()
 
     def __new__(cls, *args, **kwargs):
-        # If Firebase Admin has not been initalized, do it only once ever globally
-        # This prevents a breaking bug since firebase_admin initialize
-        # app cannot be run more than once globally.
-        if not cls.firebase_admin_init:
-            cls.init_firebase_admin()
-            cls.firebase_admin_init = True
         if cls._instance is None:
             cls._instance = super(DB, cls).__new__(cls)
         return cls._instance
 
 
-    def __init__(self) -> None:
-        # Instantiate the firestore client
-        self.client = firestore.client()
+    @classmethod
+    def ensure_firebase_admin(cls) -> None:
+        # Initialize Firebase Admin on first use rather than at import, only once ever globally
+        # This prevents a breaking bug since firebase_admin initialize
+        # app cannot be run more than once globally.
+        if not cls.firebase_admin_init:
+            with cls._init_lock:
+                if not cls.firebase_admin_init:
+                    cls.init_firebase_admin()
+                    cls.firebase_admin_init = True
+
+
+    @property
+    def client(self):
+        # Instantiate the firestore client lazily, shared by every session in the process
+        if DB._client is None:
+            self.ensure_firebase_admin()
+            with self._init_lock:
+                if DB._client is None:
+                    # Imported here since the Firestore stack is slow to load and the sign in page never needs it
+                    from firebase_admin import firestore
+
+                    DB._client = firestore.client()
+        return DB._client
 
 
     @classmethod
@@ -37,6 +69,8 @@ class DB():
         FIREBASE_SA_SECRET_NAME = os.getenv("FIREBASE_SA_SECRET_NAME")
 
         # Create credentials object then initialize the firebase admin client
+        from google.cloud import secretmanager
+
         client = secretmanager.SecretManagerServiceClient()
         name = client.secret_version_path(project=GCLOUD_PROJECT_NUMBER, secret=FIREBASE_SA_SECRET_NAME, secret_version="latest")
         response = client.access_secret_version(name=name)
@@ -49,9 +83,42 @@ class DB():
         firebase_admin.initialize_app(credential=creds)
 
 
+    def add_listener(self, listener: Callable[[str, str, Any], None]) -> None:
+        # Register a callback run after every supplier write as listener(event, org_id, payload),
+        # where event is "insert", "update" or "delete" and payload is the Supplier or supplier id,
+        # or event is "segments" and payload is {supplier_id: segment} after a bulk re-scoring
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+
+    def _notify(self, event: str, org_id: str, payload: Any) -> None:
+        # Listeners keep derived data (local mirror, indexes) in step, they must never break a write
+        for listener in self._listeners:
+            try:
+                listener(event, org_id, payload)
+            except Exception as e:
+                print(f"Error in supplier {event} listener: {e}")
+
+
+    @staticmethod
+    def parse_supplier(doc_id: str, data: dict) -> Optional[Supplier]:
+        # Expand the stored source table, then backfill fields missing from older supplier documents
+        data = expand_supplier(data)
+        if "reduction_targets" not in data["esg"]:
+            data["esg"]["reduction_targets"] = {"available": False, "summary": "", "sources": []}
+        try:
+            # Deserialize Firestore data into a Supplier instance
+            return Supplier(**data)
+        except ValidationError as e:
+            print(f"Error parsing supplier {doc_id}: {e}")
+            return None
+
+
     def create_user(self, uid: str, org_id: str) -> None:
+        from firebase_admin.firestore import SERVER_TIMESTAMP
+
         self.client.collection("users").document(uid).set({
-            "timestamp": firestore.SERVER_TIMESTAMP,
+            "timestamp": SERVER_TIMESTAMP,
             "org_id": org_id,
         })
 
@@ -75,12 +142,20 @@ class DB():
 
         supplier_id = supplier.id
 
-        # Serialize the Supplier instance to a dictionary
-        supplier_dict = supplier.model_dump()
+        # Serialize the Supplier instance to its compact storage form
+        supplier_dict = supplier_document(supplier)
 
-        # Insert into Firestore
+        # Insert into Firestore, with the first entry of its ESG history
         doc_ref = self.client.collection("orgs").document(org_id).collection("suppliers").document(supplier_id)
-        doc_ref.set(supplier_dict)
+        batch = self.client.batch()
+        batch.set(doc_ref, supplier_dict)
+        delta = esg_delta(None, esg_state(supplier))
+        if delta:
+            batch.set(doc_ref.collection("history").document(), delta)
+        self._add_aggregate_diff(batch, org_id, aggregate_diff(None, supplier))
+        batch.commit()
+        self._index_evidence(org_id, supplier)
+        self._notify("insert", org_id, supplier)
 
     
     def update_supplier(
@@ -94,12 +169,30 @@ class DB():
 
         supplier_id = supplier.id
 
-        # Serialize the Supplier instance to a dictionary
-        supplier_dict = supplier.model_dump()
+        # Serialize the Supplier instance to its compact storage form
+        supplier_dict = supplier_document(supplier)
+
+        # Update data, appending what changed in its ESG data to the history
+        # The previous state is read in the same transaction as the writes, so concurrent updates
+        # of the supplier (jobs, API tasks, scheduled refreshes) retry instead of recording wrong diffs
+        from firebase_admin import firestore
 
-        # Update data
         doc_ref = self.client.collection("orgs").document(org_id).collection("suppliers").document(supplier_id)
-        doc_ref.update(supplier_dict)
+
+        @firestore.transactional
+        def write(transaction) -> None:
+            previous_doc = doc_ref.get(transaction=transaction)
+            previous = self.parse_supplier(supplier_id, previous_doc.to_dict()) if previous_doc.exists else None
+            # Suppliers saved before the history existed get a base entry of their previous state first
+            has_history = bool(doc_ref.collection("history").limit(1).get(transaction=transaction))
+            transaction.update(doc_ref, supplier_dict)
+            for entry in history_entries(esg_state(previous) if previous else None, esg_state(supplier), has_history):
+                transaction.set(doc_ref.collection("history").document(), entry)
+            self._add_aggregate_diff(transaction, org_id, aggregate_diff(previous, supplier))
+
+        write(self.client.transaction())
+        self._index_evidence(org_id, supplier)
+        self._notify("update", org_id, supplier)
 
     
     def delete_supplier(
@@ -113,47 +206,228 @@ class DB():
         # Optional: Check if the document exists
         doc = doc_ref.get()
         if doc.exists:
-            # Delete the document
-            doc_ref.delete()
+            # Delete the document and remove it from the org's counts
+            previous = self.parse_supplier(supplier_id, doc.to_dict())
+            batch = self.client.batch()
+            batch.delete(doc_ref)
+            self._add_aggregate_diff(batch, org_id, aggregate_diff(previous, None) if previous else {})
+            batch.commit()
+        index = self._evidence_indexes.get(org_id)
+        if index:
+            index.remove_supplier(supplier_id)
+        self._notify("delete", org_id, supplier_id)
+
+
+    def _aggregates_ref(self, org_id: str):
+        return self.client.collection("orgs").document(org_id).collection("aggregates").document("esg")
+
+
+    def _add_aggregate_diff(self, batch, org_id: str, diff: dict) -> None:
+        # Apply a change in counts to the org aggregate document atomically, in the same batch or transaction as the supplier write
+        if not diff:
+            return
+        from firebase_admin.firestore import Increment, SERVER_TIMESTAMP
+
+        update = {"updated": SERVER_TIMESTAMP}
+        if "total" in diff:
+            update["total"] = Increment(diff["total"])
+        for group in ("segments", "available"):
+            if group in diff:
+                update[group] = {key: Increment(change) for key, change in diff[group].items()}
+        batch.set(self._aggregates_ref(org_id), update, merge=True)
+
+
+    def get_org_aggregates(self, org_id: str) -> OrgAggregates:
+        # Portfolio counts in a single document read, built with a full recompute the first time
+        # Increments can reach the document before that, so it only counts once marked complete
+        doc = self._aggregates_ref(org_id).get()
+        data = doc.to_dict() if doc.exists else None
+        if not data or not data.get("complete"):
+            return self.recompute_org_aggregates(org_id)
+        return OrgAggregates(**data)
+
+
+    def recompute_org_aggregates(self, org_id: str) -> OrgAggregates:
+        # Rebuild the org's counts from every supplier, to create or repair the aggregate document
+        from firebase_admin.firestore import SERVER_TIMESTAMP
+
+        aggregates = compute_aggregates(self.iter_org_suppliers(org_id))
+        self._aggregates_ref(org_id).set({
+            **aggregates.model_dump(exclude={"updated"}),
+            "complete": True,
+            "updated": SERVER_TIMESTAMP,
+        })
+        return aggregates
+
+
+    def rescore_org_segments(self, org_id: str, scoring_policy: Optional[ScoringPolicy] = None) -> Dict[str, str]:
+        # Re-segment every supplier of an org in one vectorized pass and write back only the segments that changed
+        # Reads just each supplier's segment and availability flags, and makes no LLM calls
+        import numpy as np
+
+        fields = ["esg.segment"] + [f"esg.{criterion}.available" for criterion in ESG_CRITERIA]
+        suppliers_ref = self.client.collection("orgs").document(org_id).collection("suppliers")
+        supplier_ids, segments, rows = [], [], []
+        for doc in suppliers_ref.select(fields).stream():
+            esg = (doc.to_dict() or {}).get("esg", {})
+            supplier_ids.append(doc.id)
+            segments.append(esg.get("segment"))
+            rows.append({criterion: (esg.get(criterion) or {}).get("available", False) for criterion in ESG_CRITERIA})
+        if not supplier_ids:
+            return {}
+
+        new_segments = segment_matrix(availability_matrix(rows), scoring_policy)
+        changed_rows = np.flatnonzero(np.array(segments, dtype=object) != new_segments)
+        changed = {supplier_ids[row]: str(new_segments[row]) for row in changed_rows}
+        previous_segments = dict(zip(supplier_ids, segments))
+
+        # Bulk write back, each supplier with its history entry, and the segment counts once per batch
+        now = datetime.now(timezone.utc)
+        changed_items = list(changed.items())
+        for start in range(0, len(changed_items), SEGMENT_BATCH_SIZE):
+            batch = self.client.batch()
+            segment_counts = {}
+            chunk = changed_items[start:start + SEGMENT_BATCH_SIZE]
+            before = self._segment_history_states(suppliers_ref, [supplier_id for supplier_id, _ in chunk], previous_segments)
+            for supplier_id, segment in chunk:
+                doc_ref = suppliers_ref.document(supplier_id)
+                batch.update(doc_ref, {"esg.segment": segment, "esg.segment_updated": now})
+                state, has_history = before[supplier_id]
+                after = state.model_copy(update={"segment": segment, "updated": now})
+                for entry in history_entries(state, after, has_history):
+                    batch.set(doc_ref.collection("history").document(), entry)
+                previous = previous_segments[supplier_id]
+                if previous:
+                    segment_counts[previous] = segment_counts.get(previous, 0) - 1
+                segment_counts[segment] = segment_counts.get(segment, 0) + 1
+            segment_counts = {key: count for key, count in segment_counts.items() if count}
+            self._add_aggregate_diff(batch, org_id, {"segments": segment_counts} if segment_counts else {})
+            batch.commit()
+        if changed:
+            self._notify("segments", org_id, changed)
+        return changed
+
+
+    def _segment_history_states(self, suppliers_ref, supplier_ids: List[str], segments: Dict[str, str]) -> Dict[str, tuple]:
+        # State each re-segmented supplier's history entries start from, with whether it has a history yet
+        # Suppliers saved before the history existed are read in full for their base entry
+        states = {}
+        missing = []
+        for supplier_id in supplier_ids:
+            if suppliers_ref.document(supplier_id).collection("history").limit(1).get():
+                states[supplier_id] = (ESGState(segment=segments[supplier_id]), True)
+            else:
+                missing.append(suppliers_ref.document(supplier_id))
+        for doc in self.client.get_all(missing):
+            previous = self.parse_supplier(doc.id, doc.to_dict()) if doc.exists else None
+            states[doc.id] = (esg_state(previous) if previous else ESGState(segment=segments[doc.id]), False)
+        return states
+
+
+    def get_supplier_history(self, org_id: str, supplier_id: str) -> List[dict]:
+        # Append-only log of ESG deltas for a supplier, oldest first
+        history_ref = (
+            self.client.collection("orgs").document(org_id)
+            .collection("suppliers").document(supplier_id)
+            .collection("history")
+        )
+        return [doc.to_dict() for doc in history_ref.order_by("timestamp").stream()]
+
+
+    def get_supplier_esg_at(self, org_id: str, supplier_id: str, at: datetime) -> Optional[ESGState]:
+        # A supplier's ESG coverage as it was at the given date, rebuilt from its history
+        return reconstruct(self.get_supplier_history(org_id=org_id, supplier_id=supplier_id), at=at)
 
 
     def get_org_suppliers(
         self,
         org_id: str,
     ) -> List[Supplier]:
+        return list(self.iter_org_suppliers(org_id=org_id))
+
+
+    def iter_org_suppliers(
+        self,
+        org_id: str,
+    ) -> Iterator[Supplier]:
         # Reference to the 'suppliers' collection
         suppliers_ref = self.client.collection("orgs").document(org_id).collection("suppliers")
 
-        # Retrieve all documents in the 'suppliers' collection
-        docs = suppliers_ref.stream()
+        # Stream documents in the 'suppliers' collection one at a time
+        for doc in suppliers_ref.stream():
+            supplier = self.parse_supplier(doc.id, doc.to_dict())
+            if supplier:
+                yield supplier
 
-        # Initialize an empty list to hold Supplier instances
-        supplier_list = []
 
-        # Iterate over each document
-        for doc in docs:
-            data = doc.to_dict()
-            if "reduction_targets" not in data["esg"]:
-                data["esg"]["reduction_targets"] = {"available": False, "summary": "", "sources": []}
-            try:
-                # Deserialize Firestore data into a Supplier instance
-                supplier = Supplier(**data)
-                supplier_list.append(supplier)
-            except ValidationError as e:
-                print(f"Error parsing supplier {doc.id}: {e}")
-        
-        return supplier_list
+    def get_org_suppliers_updated_since(
+        self,
+        org_id: str,
+        since: Optional[datetime] = None,
+    ) -> List[Supplier]:
+        # Suppliers whose ESG data or segment changed at or after the cursor, oldest first
+        # The bound is inclusive so documents sharing the cursor timestamp are never skipped
+        suppliers_ref = self.client.collection("orgs").document(org_id).collection("suppliers")
+        queries = [suppliers_ref.order_by("esg.updated")]
+        if since is not None:
+            queries = [
+                suppliers_ref.where("esg.updated", ">=", since),
+                # Re-scored segments leave esg.updated alone, it dates the research
+                suppliers_ref.where("esg.segment_updated", ">=", since),
+            ]
+
+        suppliers = {}
+        for query in queries:
+            for doc in query.stream():
+                supplier = self.parse_supplier(doc.id, doc.to_dict())
+                if supplier:
+                    suppliers[supplier.id] = supplier
+        return sorted(suppliers.values(), key=supplier_changed)
+
+
+    def get_org_supplier_ids(self, org_id: str) -> List[str]:
+        # Empty projection returns document references only, no supplier data is transferred
+        suppliers_ref = self.client.collection("orgs").document(org_id).collection("suppliers")
+        return [doc.id for doc in suppliers_ref.select([]).stream()]
+    
+
+    def _index_evidence(self, org_id: str, supplier: Supplier) -> None:
+        # Only indexes already built are kept in step, others are built on first search
+        index = self._evidence_indexes.get(org_id)
+        if index:
+            index.add_supplier(supplier)
+
+
+    def search_evidence(
+        self,
+        org_id: str,
+        query: str,
+        limit: int = 20,
+    ) -> List[EvidenceHit]:
+        # BM25 search over an org's ESG summaries and source quotes
+        with self._evidence_lock:
+            index = self._evidence_indexes.get(org_id)
+            if index is None or time.time() - index.built_at > EVIDENCE_INDEX_TTL:
+                index = EvidenceIndex()
+                for supplier in self.iter_org_suppliers(org_id=org_id):
+                    index.add_supplier(supplier)
+                self._evidence_indexes[org_id] = index
+        return index.search(query=query, limit=limit)
     
 
-    def create_task(self, user_id: str, org_id: str, company_names: List[str]) -> str:
+    def create_task(self, user_id: str, org_id: str, company_names: List[str], mode: str = "interactive", priority: str = "bulk") -> str:
         # Create a new task document
+        from firebase_admin.firestore import SERVER_TIMESTAMP
+
         task_ref = self.client.collection("tasks").document()
         
         # Set the main task data
         task_ref.set({
             "user_id": user_id,
             "org_id": org_id,
-            "timestamp": firestore.SERVER_TIMESTAMP,
+            "mode": mode,
+            "priority": priority,
+            "timestamp": SERVER_TIMESTAMP,
         })
         
         # Add companies as a subcollection
@@ -168,6 +442,11 @@ class DB():
         return task_ref.id  # Return the task ID
     
 
+    def cancel_task(self, task_id: str) -> None:
+        # Flag picked up by the API, which skips companies not yet started and stops running ones
+        self.client.collection("tasks").document(task_id).update({"cancelled": True})
+    
+
     def get_tasks_by_org(self, org_id: str) -> List[dict]:
         # Query tasks collection for documents with matching org_id
         tasks_query = self.client.collection("tasks").where("org_id", "==", org_id)
@@ -0,0 +1,122 @@
+import hashlib
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field
+
+from utils.supplier_data import Supplier, ESG_CRITERIA, source_id
+
+
+# Base entries of suppliers whose previous research date is unknown sort before everything else
+HISTORY_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# What the history tracks for one criterion: availability, a hash of the summary and the cited sources
+class CriterionState(BaseModel):
+    available: bool = False
+    summary_hash: Optional[str] = None
+    sources: Dict[str, str] = Field(default_factory=dict)
+
+
+# A supplier's ESG coverage at one point in time, rebuilt from its history
+class ESGState(BaseModel):
+    updated: Optional[datetime] = None
+    segment: Optional[str] = None
+    criteria: Dict[str, CriterionState] = Field(default_factory=dict)
+
+
+def summary_hash(summary: str) -> str:
+    return hashlib.sha1(summary.encode("utf-8")).hexdigest()[:12]
+
+
+def esg_state(supplier: Supplier) -> ESGState:
+    criteria = {}
+    for criterion in ESG_CRITERIA:
+        data = getattr(supplier.esg, criterion)
+        if data is None:
+            continue
+        criteria[criterion] = CriterionState(
+            available=data.available,
+            summary_hash=summary_hash(data.summary),
+            sources={source_id(source.link): source.link for source in data.sources},
+        )
+    return ESGState(updated=supplier.esg.updated, segment=supplier.esg.segment, criteria=criteria)
+
+
+# Compact record of what changed between two states, or None if nothing did
+# Only changed fields are stored, e.g.
+#   {"timestamp": ..., "segment": "High", "changes": {"scope_3": {"available": True, "summary_hash": "...",
+#    "sources_added": {"<source id>": "<link>"}, "sources_removed": ["<source id>"]}}}
+def esg_delta(before: Optional[ESGState], after: ESGState) -> Optional[dict]:
+    before = before or ESGState()
+    changes = {}
+    for criterion, state in after.criteria.items():
+        previous = before.criteria.get(criterion, CriterionState())
+        change = {}
+        if state.available != previous.available:
+            change["available"] = state.available
+        if state.summary_hash != previous.summary_hash:
+            change["summary_hash"] = state.summary_hash
+        added = {sid: link for sid, link in state.sources.items() if sid not in previous.sources}
+        removed = [sid for sid in previous.sources if sid not in state.sources]
+        if added:
+            change["sources_added"] = added
+        if removed:
+            change["sources_removed"] = removed
+        if change:
+            changes[criterion] = change
+
+    delta = {}
+    if after.segment != before.segment:
+        delta["segment"] = after.segment
+    if changes:
+        delta["changes"] = changes
+    if not delta:
+        return None
+    delta["timestamp"] = after.updated
+    return delta
+
+
+# History entries to append when a supplier's ESG data goes from before to after
+# Suppliers saved before the history existed get a full base entry of their previous state first,
+# stamped with when that state was researched, so replaying the history doesn't lose what didn't change
+def history_entries(before: Optional[ESGState], after: ESGState, has_history: bool) -> List[dict]:
+    entries = []
+    if before is not None and not has_history:
+        base = esg_delta(None, before)
+        if base:
+            base["timestamp"] = before.updated or HISTORY_EPOCH
+            entries.append(base)
+    delta = esg_delta(before, after)
+    if delta:
+        entries.append(delta)
+    return entries
+
+
+def apply_delta(state: ESGState, delta: dict) -> ESGState:
+    state = state.model_copy(deep=True)
+    state.updated = delta["timestamp"]
+    if "segment" in delta:
+        state.segment = delta["segment"]
+    for criterion, change in delta.get("changes", {}).items():
+        criterion_state = state.criteria.setdefault(criterion, CriterionState())
+        if "available" in change:
+            criterion_state.available = change["available"]
+        if "summary_hash" in change:
+            criterion_state.summary_hash = change["summary_hash"]
+        criterion_state.sources.update(change.get("sources_added", {}))
+        for sid in change.get("sources_removed", []):
+            criterion_state.sources.pop(sid, None)
+    return state
+
+
+# Replay a supplier's deltas, oldest first, up to and including the given date
+# Returns None if the supplier had no recorded ESG data by then
+def reconstruct(deltas: List[dict], at: datetime) -> Optional[ESGState]:
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    state = None
+    for delta in sorted(deltas, key=lambda delta: delta["timestamp"]):
+        if delta["timestamp"] > at:
+            break
+        state = apply_delta(state or ESGState(), delta)
+    return state
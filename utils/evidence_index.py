@@ -0,0 +1,136 @@
+import re
+import math
+import time
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+from utils.supplier_data import Supplier, ESG_CRITERIA
+
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Common words carrying no signal in evidence text
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "their", "this", "to", "was", "were", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+class EvidenceHit(BaseModel):
+    supplier_id: str
+    supplier_name: str
+    criterion: str
+    field: str
+    text: str
+    link: Optional[str] = None
+    score: float
+
+
+# One searchable piece of evidence, a criterion summary or a single source quote
+class _EvidenceDoc():
+
+
+    def __init__(self, supplier: Supplier, criterion: str, field: str, text: str, link: Optional[str]) -> None:
+        self.supplier_id = supplier.id
+        self.supplier_name = supplier.name
+        self.criterion = criterion
+        self.field = field
+        self.text = text
+        self.link = link
+        self.terms = Counter(tokenize(text))
+        self.length = sum(self.terms.values())
+
+
+# Inverted index with BM25 ranking over one org's summaries and source quotes
+class EvidenceIndex():
+
+
+    def __init__(self) -> None:
+        self.built_at = time.time()
+        self._docs: Dict[int, _EvidenceDoc] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._by_supplier: Dict[str, List[int]] = {}
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+
+    def add_supplier(self, supplier: Supplier) -> None:
+        # Replaces any evidence previously indexed for the supplier
+        with self._lock:
+            self._remove(supplier.id)
+            doc_ids = []
+            for criterion in ESG_CRITERIA:
+                data_summary = getattr(supplier.esg, criterion)
+                if data_summary is None or not data_summary.available:
+                    continue
+                docs = [_EvidenceDoc(supplier, criterion, "summary", data_summary.summary, None)]
+                docs += [_EvidenceDoc(supplier, criterion, "quote", source.key_quote, source.link) for source in data_summary.sources]
+                for doc in docs:
+                    if not doc.length:
+                        continue
+                    doc_id = self._next_id
+                    self._next_id += 1
+                    self._docs[doc_id] = doc
+                    self._total_length += doc.length
+                    for term, frequency in doc.terms.items():
+                        self._postings.setdefault(term, {})[doc_id] = frequency
+                    doc_ids.append(doc_id)
+            self._by_supplier[supplier.id] = doc_ids
+
+
+    def remove_supplier(self, supplier_id: str) -> None:
+        with self._lock:
+            self._remove(supplier_id)
+
+
+    def _remove(self, supplier_id: str) -> None:
+        for doc_id in self._by_supplier.pop(supplier_id, []):
+            doc = self._docs.pop(doc_id)
+            self._total_length -= doc.length
+            for term in doc.terms:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+
+
+    def search(self, query: str, limit: int = 20) -> List[EvidenceHit]:
+        terms = set(tokenize(query))
+        with self._lock:
+            num_docs = len(self._docs)
+            if not terms or not num_docs:
+                return []
+            avg_length = self._total_length / num_docs
+
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log((num_docs - len(postings) + 0.5) / (len(postings) + 0.5) + 1)
+                for doc_id, frequency in postings.items():
+                    length_norm = 1 - BM25_B + BM25_B * self._docs[doc_id].length / avg_length
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [
+                EvidenceHit(
+                    supplier_id=self._docs[doc_id].supplier_id,
+                    supplier_name=self._docs[doc_id].supplier_name,
+                    criterion=self._docs[doc_id].criterion,
+                    field=self._docs[doc_id].field,
+                    text=self._docs[doc_id].text,
+                    link=self._docs[doc_id].link,
+                    score=score,
+                )
+                for doc_id, score in ranked
+            ]
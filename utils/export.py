@@ -0,0 +1,119 @@
+import csv
+import io
+from itertools import islice
+from typing import Iterable, Iterator, List, BinaryIO
+
+from utils.supplier_data import Supplier, ESG_CRITERIA, ESG_CRITERIA_LABELS
+
+
+# Rows written per chunk by the CSV and Parquet writers
+EXPORT_CHUNK_SIZE = 500
+
+# Supported export formats mapped to (file extension, MIME type)
+EXPORT_FORMATS = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def export_columns() -> List[str]:
+    columns = ["Supplier Names", "Website", "Description", "Notes", "ESG Rating", "Last Updated"]
+    for criterion in ESG_CRITERIA:
+        label = ESG_CRITERIA_LABELS[criterion]
+        columns += [f"{label} Available", f"{label} Summary", f"{label} Source Count", f"{label} First Link"]
+    return columns
+
+
+# Flatten a supplier into one export row, each criterion becomes four typed columns
+def flatten_supplier(supplier: Supplier) -> list:
+    row = [
+        supplier.name,
+        supplier.website,
+        supplier.description,
+        supplier.notes,
+        supplier.esg.segment,
+        supplier.esg.updated,
+    ]
+    for criterion in ESG_CRITERIA:
+        data_summary = getattr(supplier.esg, criterion)
+        if data_summary is None:
+            row += [False, "", 0, None]
+        else:
+            first_link = data_summary.sources[0].link if data_summary.sources else None
+            row += [data_summary.available, data_summary.summary, len(data_summary.sources), first_link]
+    return row
+
+
+def _chunks(suppliers: Iterable[Supplier], size: int) -> Iterator[List[list]]:
+    iterator = iter(suppliers)
+    while chunk := [flatten_supplier(supplier) for supplier in islice(iterator, size)]:
+        yield chunk
+
+
+# Write suppliers to an Excel workbook in write-only mode, rows are streamed to the file
+def write_xlsx(suppliers: Iterable[Supplier], file: BinaryIO) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title="Suppliers")
+    sheet.append(export_columns())
+    for supplier in suppliers:
+        row = flatten_supplier(supplier)
+        # Excel cannot store timezone aware datetimes
+        row[5] = row[5].replace(tzinfo=None) if row[5] else None
+        sheet.append(row)
+    workbook.save(file)
+
+
+# Write suppliers to CSV in chunks of rows
+def write_csv(suppliers: Iterable[Supplier], file: BinaryIO, chunk_size: int = EXPORT_CHUNK_SIZE) -> None:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(export_columns())
+    for chunk in _chunks(suppliers, chunk_size):
+        writer.writerows(chunk)
+    text.flush()
+    # Hand the underlying file back to the caller open
+    text.detach()
+
+
+# Write suppliers to Parquet, one row group per chunk
+def write_parquet(suppliers: Iterable[Supplier], file: BinaryIO, chunk_size: int = EXPORT_CHUNK_SIZE) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [
+        pa.field("Supplier Names", pa.string()),
+        pa.field("Website", pa.string()),
+        pa.field("Description", pa.string()),
+        pa.field("Notes", pa.string()),
+        pa.field("ESG Rating", pa.string()),
+        pa.field("Last Updated", pa.timestamp("us", tz="UTC")),
+    ]
+    for criterion in ESG_CRITERIA:
+        label = ESG_CRITERIA_LABELS[criterion]
+        fields += [
+            pa.field(f"{label} Available", pa.bool_()),
+            pa.field(f"{label} Summary", pa.string()),
+            pa.field(f"{label} Source Count", pa.int32()),
+            pa.field(f"{label} First Link", pa.string()),
+        ]
+    schema = pa.schema(fields)
+
+    with pq.ParquetWriter(file, schema) as writer:
+        for chunk in _chunks(suppliers, chunk_size):
+            columns = list(zip(*chunk))
+            writer.write_batch(pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, fields)], schema=schema))
+
+
+# Write suppliers in the given export format
+def write_export(export_format: str, suppliers: Iterable[Supplier], file: BinaryIO) -> None:
+    if export_format == "Excel":
+        write_xlsx(suppliers, file)
+    elif export_format == "CSV":
+        write_csv(suppliers, file)
+    elif export_format == "Parquet":
+        write_parquet(suppliers, file)
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
@@ -0,0 +1,211 @@
+import os
+import uuid
+import threading
+import traceback
+from typing import Optional, List, Dict, Callable
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, Field
+
+from utils.db import db
+from utils.agent import CancelToken
+from utils.supplier_data import Supplier
+from utils.pipeline import (
+    ProgressReporter,
+    onboard_supplier,
+    refresh_supplier,
+    refresh_criteria,
+    ONBOARD_STEPS,
+)
+from utils.criteria import COMPANY_TIMEOUT
+
+
+# Supplier pipelines run concurrently in the Streamlit process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+# Intermediate agent steps kept per job, older ones are dropped
+MAX_JOB_STEPS = 200
+
+# Finished jobs kept per org for display
+MAX_FINISHED_JOBS = 20
+
+
+class JobStep(BaseModel):
+    label: str
+    content: str
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    org_id: str
+    supplier_name: str
+    supplier_id: Optional[str] = None
+    status: str = "queued"
+    current: Optional[str] = None
+    completed: List[str] = Field(default_factory=list)
+    total: int
+    steps: List[JobStep] = Field(default_factory=list)
+    error: Optional[str] = None
+    cancelled: bool = False
+    result: Optional[Supplier] = None
+    created: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    finished: Optional[datetime] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def progress(self) -> float:
+        return min(len(self.completed) / self.total, 1.0) if self.total else 0.0
+
+
+# Records pipeline progress on the job, read by the UI on each poll
+class JobReporter(ProgressReporter):
+
+
+    def __init__(self, job: Job) -> None:
+        self.job = job
+
+
+    def start(self, label: str) -> None:
+        self.job.current = label
+
+
+    def step(self, label: str, content: str) -> None:
+        self.job.steps.append(JobStep(label=label, content=str(content)))
+        if len(self.job.steps) > MAX_JOB_STEPS:
+            del self.job.steps[0]
+
+
+    def done(self, label: str) -> None:
+        self.job.completed.append(label)
+
+
+# Background executor shared by all sessions, jobs outlive the browser session that queued them
+class JobManager():
+
+
+    def __init__(self, max_workers: int) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supplier-job")
+        self._jobs: Dict[str, Job] = {}
+        self._tokens: Dict[str, CancelToken] = {}
+        self._lock = threading.Lock()
+
+
+    def _submit(self, job: Job, run: Callable[[JobReporter, CancelToken], Supplier], save: Callable[[Supplier], None]) -> Job:
+        def _run():
+            # A job stopped while still queued is never started
+            if job.cancelled:
+                job.status = "cancelled"
+                job.finished = datetime.now(timezone.utc)
+                self._tokens.pop(job.id, None)
+                return
+            job.status = "running"
+            try:
+                # The company budget only starts counting once the job leaves the queue
+                supplier = run(JobReporter(job), self._tokens[job.id].child(timeout=COMPANY_TIMEOUT))
+                # A job stopped while running still saves what its agents found so far
+                save(supplier)
+                job.result = supplier
+                job.supplier_id = supplier.id
+                job.status = "cancelled" if job.cancelled else "success"
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.status = "error"
+            finally:
+                job.current = None
+                job.finished = datetime.now(timezone.utc)
+                self._tokens.pop(job.id, None)
+                self._prune(job.org_id)
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._tokens[job.id] = CancelToken()
+        self._executor.submit(_run)
+        return job
+
+
+    def submit_onboarding(
+        self,
+        org_id: str,
+        name: str,
+        website: Optional[str] = None,
+        description: Optional[str] = None,
+        notes: Optional[str] = None,
+    ) -> Job:
+        job = Job(id=str(uuid.uuid4()), kind="onboard", org_id=org_id, supplier_name=name, total=ONBOARD_STEPS)
+        return self._submit(
+            job=job,
+            run=lambda reporter, cancel_token: onboard_supplier(
+                name=name,
+                website=website,
+                description=description,
+                notes=notes,
+                reporter=reporter,
+                cancel_token=cancel_token,
+            ),
+            save=lambda supplier: db.insert_supplier(supplier=supplier, org_id=org_id),
+        )
+
+
+    def submit_refresh(self, org_id: str, supplier: Supplier) -> Job:
+        # A supplier already being refreshed is not queued twice
+        existing = self.get_supplier_job(org_id=org_id, supplier_id=supplier.id)
+        if existing and existing.active:
+            return existing
+        job = Job(
+            id=str(uuid.uuid4()),
+            kind="refresh",
+            org_id=org_id,
+            supplier_name=supplier.name,
+            supplier_id=supplier.id,
+            total=len(refresh_criteria(supplier)),
+        )
+        return self._submit(
+            job=job,
+            run=lambda reporter, cancel_token: refresh_supplier(supplier=supplier, reporter=reporter, cancel_token=cancel_token),
+            save=lambda updated: db.update_supplier(supplier=updated, org_id=org_id),
+        )
+
+
+    def get_jobs(self, org_id: str) -> List[Job]:
+        # Most recent first
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.org_id == org_id]
+        return sorted(jobs, key=lambda job: job.created, reverse=True)
+
+
+    def get_supplier_job(self, org_id: str, supplier_id: str) -> Optional[Job]:
+        # Most recent job for a supplier
+        return next((job for job in self.get_jobs(org_id) if job.supplier_id == supplier_id), None)
+
+
+    def cancel(self, job_id: str) -> None:
+        # Running agents stop at their next step and answer with what they have found
+        with self._lock:
+            job = self._jobs.get(job_id)
+            token = self._tokens.get(job_id)
+        if job and job.active:
+            job.cancelled = True
+            if token:
+                token.cancel()
+
+
+    def dismiss(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and not job.active:
+                del self._jobs[job_id]
+
+
+    def _prune(self, org_id: str) -> None:
+        finished = [job for job in self.get_jobs(org_id) if not job.active]
+        with self._lock:
+            for job in finished[MAX_FINISHED_JOBS:]:
+                self._jobs.pop(job.id, None)
+
+
+job_manager = JobManager(max_workers=JOB_WORKERS)
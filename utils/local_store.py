@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional, List, Any, Iterator
+from datetime import datetime, timezone
+
+from utils.db import db
+from utils.supplier_data import Supplier, ESG_CRITERIA, supplier_changed
+
+
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH")
+LOCAL_STORE_SYNC_INTERVAL = float(os.getenv("LOCAL_STORE_SYNC_INTERVAL", "60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppliers (
+    org_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (org_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_suppliers_segment ON suppliers (org_id, segment, name_key);
+CREATE INDEX IF NOT EXISTS idx_suppliers_name ON suppliers (org_id, name_key);
+
+CREATE TABLE IF NOT EXISTS supplier_criteria (
+    org_id TEXT NOT NULL,
+    supplier_id TEXT NOT NULL,
+    criterion TEXT NOT NULL,
+    available INTEGER NOT NULL,
+    PRIMARY KEY (org_id, supplier_id, criterion)
+);
+CREATE INDEX IF NOT EXISTS idx_criteria_available ON supplier_criteria (org_id, criterion, available);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    org_id TEXT PRIMARY KEY,
+    cursor TEXT,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+# Convert a timestamp to a sortable UTC string for SQLite
+def to_utc_text(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+# Local SQLite mirror of orgs/{org_id}/suppliers, kept current with incremental syncs on esg.updated
+# and esg.segment_updated
+class LocalStore():
+
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+
+    def _connection(self) -> sqlite3.Connection:
+        # Single connection shared by all Streamlit sessions, access is serialized by self._lock
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+
+    def _upsert(self, conn: sqlite3.Connection, org_id: str, supplier: Supplier) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO suppliers (org_id, id, name, name_key, segment, updated, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                org_id,
+                supplier.id,
+                supplier.name,
+                supplier.name.lower(),
+                supplier.esg.segment,
+                to_utc_text(supplier.esg.updated),
+                supplier.model_dump_json(),
+            ),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO supplier_criteria (org_id, supplier_id, criterion, available) VALUES (?, ?, ?, ?)",
+            [
+                (org_id, supplier.id, criterion, int(bool(data_summary and data_summary.available)))
+                for criterion in ESG_CRITERIA
+                for data_summary in [getattr(supplier.esg, criterion)]
+            ],
+        )
+
+
+    def _delete(self, conn: sqlite3.Connection, org_id: str, supplier_ids: List[str]) -> None:
+        params = [(org_id, supplier_id) for supplier_id in supplier_ids]
+        conn.executemany("DELETE FROM suppliers WHERE org_id = ? AND id = ?", params)
+        conn.executemany("DELETE FROM supplier_criteria WHERE org_id = ? AND supplier_id = ?", params)
+
+
+    def sync(self, org_id: str, force: bool = False) -> int:
+        # Pull suppliers changed since the stored cursor, at most once per sync interval unless forced
+        # Returns the number of supplier records written locally
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT cursor, synced_at FROM sync_state WHERE org_id = ?", (org_id,)).fetchone()
+            cursor, synced_at = row if row else (None, 0.0)
+            if not force and row and time.time() - synced_at < LOCAL_STORE_SYNC_INTERVAL:
+                return 0
+
+        since = datetime.fromisoformat(cursor) if cursor else None
+        changed = db.get_org_suppliers_updated_since(org_id=org_id, since=since)
+        remote_ids = set(db.get_org_supplier_ids(org_id=org_id))
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for supplier in changed:
+                    self._upsert(conn, org_id, supplier)
+                    cursor = max(cursor or "", to_utc_text(supplier_changed(supplier)))
+
+                # Incremental pulls cannot see deletions, reconcile them against the remote id list
+                local_ids = {r[0] for r in conn.execute("SELECT id FROM suppliers WHERE org_id = ?", (org_id,))}
+                self._delete(conn, org_id, list(local_ids - remote_ids))
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (org_id, cursor, synced_at) VALUES (?, ?, ?)",
+                    (org_id, cursor, time.time()),
+                )
+        return len(changed)
+
+
+    def on_supplier_change(self, event: str, org_id: str, payload: Any) -> None:
+        # DB listener, writes through so the mirror reflects this process's edits without a sync
+        if not self.enabled:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                if event == "delete":
+                    self._delete(conn, org_id, [payload])
+                elif event == "segments":
+                    conn.executemany(
+                        "UPDATE suppliers SET segment = ?, data = json_set(data, '$.esg.segment', ?) WHERE org_id = ? AND id = ?",
+                        [(segment, segment, org_id, supplier_id) for supplier_id, segment in payload.items()],
+                    )
+                else:
+                    self._upsert(conn, org_id, payload)
+
+
+    def get_suppliers(
+        self,
+        org_id: str,
+        segment: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+        criterion: Optional[str] = None,
+        available: bool = True,
+    ) -> List[Supplier]:
+        # Indexed local query, results sorted by name
+        query = "SELECT s.data FROM suppliers s"
+        params = []
+        if criterion:
+            if criterion not in ESG_CRITERIA:
+                raise ValueError(f"Unknown ESG criterion: {criterion}")
+            query += " JOIN supplier_criteria c ON c.org_id = s.org_id AND c.supplier_id = s.id AND c.criterion = ? AND c.available = ?"
+            params += [criterion, int(available)]
+        query += " WHERE s.org_id = ?"
+        params.append(org_id)
+        if segment:
+            query += " AND s.segment = ?"
+            params.append(segment)
+        if name_prefix:
+            # Range scan on the name index instead of LIKE, which cannot use it case-insensitively
+            prefix = name_prefix.lower()
+            query += " AND s.name_key >= ? AND s.name_key < ?"
+            params += [prefix, prefix + "\uffff"]
+        query += " ORDER BY s.name_key"
+
+        with self._lock:
+            rows = self._connection().execute(query, params).fetchall()
+        return [Supplier(**json.loads(row[0])) for row in rows]
+
+
+    def iter_suppliers(self, org_id: str) -> Iterator[Supplier]:
+        # Suppliers parsed one at a time, only the serialized rows are held in memory
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT data FROM suppliers WHERE org_id = ? ORDER BY name_key", (org_id,)
+            ).fetchall()
+        for row in rows:
+            yield Supplier(**json.loads(row[0]))
+
+
+    def count_suppliers(self, org_id: str) -> int:
+        with self._lock:
+            row = self._connection().execute("SELECT COUNT(*) FROM suppliers WHERE org_id = ?", (org_id,)).fetchone()
+        return row[0]
+
+
+local_store = LocalStore(path=LOCAL_STORE_PATH)
+db.add_listener(local_store.on_supplier_change)
+
+
+# Read an org's suppliers from the local mirror when LOCAL_STORE_PATH is set, otherwise from Firestore
+def get_org_suppliers(
+    org_id: str,
+    segment: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    criterion: Optional[str] = None,
+    available: bool = True,
+) -> List[Supplier]:
+    if local_store.enabled:
+        local_store.sync(org_id=org_id)
+        return local_store.get_suppliers(
+            org_id=org_id,
+            segment=segment,
+            name_prefix=name_prefix,
+            criterion=criterion,
+            available=available,
+        )
+
+    suppliers = db.get_org_suppliers(org_id=org_id)
+    if segment:
+        suppliers = [supplier for supplier in suppliers if supplier.esg.segment == segment]
+    if name_prefix:
+        suppliers = [supplier for supplier in suppliers if supplier.name.lower().startswith(name_prefix.lower())]
+    if criterion:
+        suppliers = [
+            supplier for supplier in suppliers
+            if bool(getattr(supplier.esg, criterion) and getattr(supplier.esg, criterion).available) == available
+        ]
+    return sorted(suppliers, key=lambda supplier: supplier.name.lower())
+
+
+# Stream an org's suppliers for exports without building the full list up front
+def iter_org_suppliers(org_id: str) -> Iterator[Supplier]:
+    if local_store.enabled:
+        local_store.sync(org_id=org_id)
+        return local_store.iter_suppliers(org_id=org_id)
+    return db.iter_org_suppliers(org_id=org_id)
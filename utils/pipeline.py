@@ -0,0 +1,224 @@
+import time
+import uuid
+import pytz
+from typing import Optional, List, Dict
+from datetime import datetime
+from pydantic import BaseModel
+
+from utils.agent import Agent, CancelToken
+from utils.run_stats import run_stats, CriterionBudget
+from utils.resources import openai_driver, web_tools
+from utils.scoring import segment_for
+from utils.supplier_data import Supplier, ESGData, DataSummary
+from utils.criteria import (
+    Criterion,
+    EvidenceDetector,
+    CRITERIA,
+    BASIC_INFO,
+    CRITERION_TIMEOUT,
+    COMPANY_TIMEOUT,
+    company_task_prefix,
+    inconclusive,
+    stale_criteria,
+)
+from compositeai.agents import AgentResult
+
+
+# Receives progress of a supplier pipeline, the default reporter ignores it
+# Pipelines run outside the Streamlit script thread, so reporters must not call Streamlit
+class ProgressReporter():
+
+
+    def start(self, label: str) -> None:
+        pass
+
+
+    def step(self, label: str, content: str) -> None:
+        pass
+
+
+    def done(self, label: str) -> None:
+        pass
+
+
+# Runs structured output agent to process a task and report its intermediate steps
+# e.g. "Find scope 1 emissions for company"
+def obtain_esg_data(
+    label: str,
+    task: str,
+    response_format: BaseModel,
+    reporter: ProgressReporter,
+    cancel_token: Optional[CancelToken] = None,
+    key: Optional[str] = None,
+    evidence: Optional[EvidenceDetector] = None,
+    runs: Optional[list] = None,
+) -> BaseModel:
+    # Criteria with enough past runs get iteration and token budgets sized from them
+    budget = run_stats.budget(key) if key else CriterionBudget()
+    agent = Agent(
+        driver=openai_driver(),
+        description=f"""
+        You are an analyst searches the web for a company's sustainability and ESG information.
+
+        Use the Google search tool to find relevant data sources and links.
+        Then, use the Web scraping tool to analyze the content of links of interest.
+
+        BE AS CONCISE AS POSSIBLE.
+        """,
+        tools=web_tools(),
+        max_iterations=budget.max_iterations,
+        token_budget=budget.max_tokens,
+        evidence=evidence,
+        response_format=response_format,
+        cancel_token=(cancel_token or CancelToken()).child(timeout=CRITERION_TIMEOUT),
+    )
+    started = time.monotonic()
+    reporter.start(label)
+    for chunk in agent.execute(task, stream=True):
+        if isinstance(chunk, AgentResult):
+            agent_result = chunk.content
+        else:
+            reporter.step(label, chunk.content)
+    reporter.done(label)
+    # Callers that need to know how the run went get its stats
+    if runs is not None and agent.last_run:
+        runs.append(agent.last_run)
+    if key and agent.last_run:
+        run_stats.record(
+            criterion=key,
+            iterations=agent.last_run.iterations,
+            tokens=agent.last_run.tokens,
+            available=isinstance(agent_result, BaseModel) and getattr(agent_result, "available", True),
+            stopped=agent.last_run.stopped,
+            seconds=time.monotonic() - started,
+        )
+    return agent_result
+
+
+# Number of agent runs made by each pipeline, used for progress reporting
+ONBOARD_STEPS = 1 + len(CRITERIA)
+
+
+# Run the agent for each criterion and return {criterion key: result}
+# Criteria not started before the company's budget ran out or it was cancelled are left out,
+# as are those whose run was cut short without finding anything, so stored data is kept
+def research_criteria(
+    task_prefix: str,
+    criteria: List[Criterion],
+    reporter: ProgressReporter,
+    cancel_token: Optional[CancelToken] = None,
+    name: Optional[str] = None,
+    website: Optional[str] = None,
+) -> Dict[str, BaseModel]:
+    results = {}
+    runs = []
+    for criterion in criteria:
+        if cancel_token is not None and cancel_token.cancelled:
+            break
+        started_runs = len(runs)
+        result = obtain_esg_data(
+            label=criterion.label,
+            task=criterion.task(task_prefix),
+            response_format=criterion.response_format,
+            reporter=reporter,
+            cancel_token=cancel_token,
+            key=criterion.key,
+            # Evidence only counts when the page names the company
+            evidence=criterion.detector(name=name, website=website),
+            runs=runs,
+        )
+        if not inconclusive(result, len(runs) > started_runs and runs[-1].stopped):
+            results[criterion.key] = result
+    return results
+
+
+# Research a new supplier from scratch and return it, without saving
+def onboard_supplier(
+    name: str,
+    website: Optional[str] = None,
+    description: Optional[str] = None,
+    notes: Optional[str] = None,
+    reporter: ProgressReporter = ProgressReporter(),
+    cancel_token: Optional[CancelToken] = None,
+) -> Supplier:
+    cancel_token = cancel_token or CancelToken(timeout=COMPANY_TIMEOUT)
+    task_prefix = company_task_prefix(name=name, website=website, description=description, notes=notes)
+    data_basic_info = obtain_esg_data(
+        label=BASIC_INFO.label,
+        task=BASIC_INFO.task(task_prefix),
+        response_format=BASIC_INFO.response_format,
+        reporter=reporter,
+        cancel_token=cancel_token,
+        key=BASIC_INFO.key,
+    )
+    results = research_criteria(
+        task_prefix=task_prefix,
+        criteria=CRITERIA,
+        reporter=reporter,
+        cancel_token=cancel_token,
+        name=name,
+        website=website or data_basic_info.website,
+    )
+
+    now = datetime.now(pytz.timezone('Europe/London'))
+    # Criteria skipped after a cancellation have no data, and are re-run by the next update
+    missing = {
+        criterion.key: DataSummary(available=False, summary="", sources=[])
+        for criterion in CRITERIA
+        if criterion.key not in results
+    }
+    esg = ESGData(
+        **results,
+        **missing,
+        segment="",
+        updated=now,
+        criteria_updated={key: now for key in results},
+    )
+    esg.segment = segment_for(esg)
+    return Supplier(
+        id=str(uuid.uuid4()),
+        name=data_basic_info.name,
+        website=data_basic_info.website,
+        description=data_basic_info.description,
+        notes=notes,
+        esg=esg,
+    )
+
+
+# Criteria an update of the supplier would re-run, all of them when forced
+def refresh_criteria(supplier: Supplier, force: bool = False) -> List[Criterion]:
+    if force:
+        return list(CRITERIA)
+    return stale_criteria(supplier, now=datetime.now(pytz.timezone('Europe/London')))
+
+
+# Re-research an existing supplier's stale ESG data and return the updated supplier, without saving
+def refresh_supplier(
+    supplier: Supplier,
+    reporter: ProgressReporter = ProgressReporter(),
+    force: bool = False,
+    cancel_token: Optional[CancelToken] = None,
+) -> Supplier:
+    supplier = supplier.model_copy(deep=True)
+    task_prefix = company_task_prefix(
+        name=supplier.name,
+        website=supplier.website,
+        description=supplier.description,
+        notes=supplier.notes,
+    )
+    results = research_criteria(
+        task_prefix=task_prefix,
+        criteria=refresh_criteria(supplier, force=force),
+        reporter=reporter,
+        cancel_token=cancel_token or CancelToken(timeout=COMPANY_TIMEOUT),
+        name=supplier.name,
+        website=supplier.website,
+    )
+
+    now = datetime.now(pytz.timezone('Europe/London'))
+    for key, data in results.items():
+        setattr(supplier.esg, key, data)
+        supplier.esg.criteria_updated[key] = now
+    supplier.esg.segment = segment_for(supplier.esg)
+    supplier.esg.updated = now
+    return supplier
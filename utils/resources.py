@@ -0,0 +1,55 @@
+import threading
+from typing import List, Any
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from compositeai.tools import BaseTool
+
+
+# Timeout in seconds for outbound HTTP calls made by agent tools, as (connect, read)
+HTTP_TIMEOUT = (5, 30)
+
+# Keep-alive connections kept per host by the shared HTTP session
+HTTP_POOL_SIZE = 32
+
+_lock = threading.Lock()
+_resources = {}
+
+
+# Create a process-wide resource once, on first use, and share it across sessions and threads
+def shared(name: str, factory) -> Any:
+    resource = _resources.get(name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = factory()
+                _resources[name] = resource
+    return resource
+
+
+def _new_http_session() -> Session:
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Pooled keep-alive HTTP session shared by the web tools
+def http_session() -> Session:
+    return shared("http_session", _new_http_session)
+
+
+# OpenAI driver shared by all agents, its HTTP client is thread-safe and holds no conversation state
+def openai_driver():
+    from compositeai.drivers import OpenAIDriver
+
+    return shared("openai_driver", lambda: OpenAIDriver(model="gpt-4o-mini", seed=1337))
+
+
+# Web search and scraping tools shared by all agents
+def web_tools() -> List[BaseTool]:
+    from utils.tools import PooledWebScrapeTool, PooledGoogleSerperApiTool
+
+    return shared("web_tools", lambda: [PooledWebScrapeTool(), PooledGoogleSerperApiTool()])
@@ -0,0 +1,120 @@
+import os
+import math
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+
+# SQLite file agent run statistics are kept in, in memory for the process lifetime when unset
+RUN_STATS_PATH = os.getenv("RUN_STATS_PATH") or ":memory:"
+
+# Budgets come from this many most recent runs per criterion, once at least RUN_STATS_MIN_RUNS succeeded
+RUN_STATS_WINDOW = 200
+RUN_STATS_MIN_RUNS = int(os.getenv("RUN_STATS_MIN_RUNS", "20"))
+
+# Successful runs a budget leaves room for, e.g. 0.95 cuts runs off at the p95 of successful runs
+RUN_BUDGET_PERCENTILE = float(os.getenv("RUN_BUDGET_PERCENTILE", "0.95"))
+
+# Iteration budgets stay within these bounds, the upper one is the budget before there are stats
+MIN_ITERATIONS = 6
+MAX_ITERATIONS = 20
+
+# Headroom over the percentile of successful runs' tokens
+TOKEN_BUDGET_MARGIN = 1.2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    criterion TEXT NOT NULL,
+    iterations INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    available INTEGER NOT NULL,
+    stopped INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    finished REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_criterion ON runs (criterion, finished);
+"""
+
+
+class CriterionBudget(BaseModel):
+    max_iterations: int = MAX_ITERATIONS
+    max_tokens: Optional[int] = None
+    runs: int = 0
+    successful: int = 0
+
+
+# Nearest-rank percentile of a non-empty list
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+# Iterations, tokens and outcome of every criterion agent run, used to size each criterion's budgets
+# so runs that have gone on longer than nearly all successful ones are cut off
+class RunStats():
+
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._budgets: Dict[str, CriterionBudget] = {}
+
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+
+    def record(self, criterion: str, iterations: int, tokens: int, available: bool, stopped: bool, seconds: float) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO runs (criterion, iterations, tokens, available, stopped, seconds, finished) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (criterion, iterations, tokens, int(available), int(stopped), seconds, time.time()),
+            )
+            conn.commit()
+            # Recomputed on next use
+            self._budgets.pop(criterion, None)
+
+
+    def budget(self, criterion: str) -> CriterionBudget:
+        with self._lock:
+            if criterion not in self._budgets:
+                rows = self._connection().execute(
+                    "SELECT iterations, tokens, available, stopped FROM runs WHERE criterion = ? ORDER BY finished DESC LIMIT ?",
+                    (criterion, RUN_STATS_WINDOW),
+                ).fetchall()
+                self._budgets[criterion] = self._budget_from(rows)
+            return self._budgets[criterion]
+
+
+    @staticmethod
+    def _budget_from(rows: List[tuple]) -> CriterionBudget:
+        # Runs that found data count as successful even when cut off, so budgets that bind can grow back
+        successful = [(iterations, tokens) for iterations, tokens, available, _ in rows if available]
+        if len(successful) < RUN_STATS_MIN_RUNS:
+            return CriterionBudget(runs=len(rows), successful=len(successful))
+        # One iteration for the output step and one of headroom over the successful runs
+        iterations = percentile([iterations for iterations, _ in successful], RUN_BUDGET_PERCENTILE) + 2
+        tokens = percentile([tokens for _, tokens in successful], RUN_BUDGET_PERCENTILE) * TOKEN_BUDGET_MARGIN
+        return CriterionBudget(
+            max_iterations=min(MAX_ITERATIONS, max(MIN_ITERATIONS, int(iterations))),
+            max_tokens=int(tokens),
+            runs=len(rows),
+            successful=len(successful),
+        )
+
+
+    def budgets(self, criteria: List[str]) -> Dict[str, CriterionBudget]:
+        return {criterion: self.budget(criterion) for criterion in criteria}
+
+
+run_stats = RunStats(RUN_STATS_PATH)
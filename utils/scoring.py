@@ -0,0 +1,78 @@
+import os
+import json
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+from utils.supplier_data import ESGData, ESG_CRITERIA
+from utils.criteria import CRITERIA
+
+
+# How a supplier's ESG segment follows from which criteria have data available
+# A supplier scoring at most low_max is Low, at most medium_max is Medium, otherwise High
+class ScoringPolicy(BaseModel):
+    weights: Dict[str, float] = Field(default_factory=lambda: {criterion.key: criterion.weight for criterion in CRITERIA})
+    low_max: float = 2
+    medium_max: float = 5
+
+
+# Policy in use, overridable with a JSON SCORING_POLICY environment variable,
+# e.g. {"weights": {"scope_3": 2}, "medium_max": 6}, unset weights default to the criteria registry
+def load_policy() -> ScoringPolicy:
+    SCORING_POLICY = os.getenv("SCORING_POLICY")
+    if not SCORING_POLICY:
+        return ScoringPolicy()
+    data = json.loads(SCORING_POLICY)
+    weights = ScoringPolicy().weights
+    weights.update(data.pop("weights", {}))
+    return ScoringPolicy(weights=weights, **data)
+
+
+policy = load_policy()
+
+
+# Which criteria have data available in a supplier's ESG data
+def availability(esg: ESGData) -> Dict[str, bool]:
+    return {
+        criterion: getattr(esg, criterion) is not None and getattr(esg, criterion).available
+        for criterion in ESG_CRITERIA
+    }
+
+
+# Stack per-supplier availability into a suppliers x criteria boolean matrix
+def availability_matrix(rows: List[Dict[str, bool]]):
+    import numpy as np
+
+    matrix = np.zeros((len(rows), len(ESG_CRITERIA)), dtype=bool)
+    for column, criterion in enumerate(ESG_CRITERIA):
+        matrix[:, column] = [bool(row.get(criterion)) for row in rows]
+    return matrix
+
+
+# Segment every row of an availability matrix in one vectorized pass
+def segment_matrix(matrix, scoring_policy: Optional[ScoringPolicy] = None):
+    import numpy as np
+
+    scoring_policy = scoring_policy or policy
+    weights = np.array([scoring_policy.weights.get(criterion, 0.0) for criterion in ESG_CRITERIA])
+    scores = matrix @ weights
+    return np.select(
+        [scores <= scoring_policy.low_max, scores <= scoring_policy.medium_max],
+        ["Low", "Medium"],
+        default="High",
+    )
+
+
+# Segment for a single supplier's ESG data, used by the onboarding and update pipelines
+# Same rule as segment_matrix, without loading NumPy for one supplier
+def segment_for(esg: ESGData, scoring_policy: Optional[ScoringPolicy] = None) -> str:
+    scoring_policy = scoring_policy or policy
+    score = sum(
+        scoring_policy.weights.get(criterion, 0.0)
+        for criterion, available in availability(esg).items()
+        if available
+    )
+    if score <= scoring_policy.low_max:
+        return "Low"
+    elif score <= scoring_policy.medium_max:
+        return "Medium"
+    return "High"
@@ -0,0 +1,118 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Tuple, Dict
+
+import numpy as np
+from rapidfuzz import process, fuzz
+from rapidfuzz.utils import default_process
+
+from utils.supplier_data import Supplier
+
+
+# Secondary fields count for less than a name match of the same quality
+WEBSITE_WEIGHT = 0.9
+DESCRIPTION_WEIGHT = 0.8
+
+# Number of supplier list versions whose index is kept in memory
+INDEX_CACHE_SIZE = 8
+
+
+# Normalize a website so the scheme and "www." do not dominate the comparison
+def normalize_website(website: str) -> str:
+    return default_process(re.sub(r"^(https?://)?(www\.)?", "", website.strip().lower()))
+
+
+# Character trigrams of a normalized string, padded so short words still produce some
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Fingerprint of a supplier list, changes whenever a supplier is added, removed, edited or re-scored
+def suppliers_version(suppliers: List[Supplier]) -> str:
+    digest = hashlib.sha1()
+    for supplier in suppliers:
+        segment_updated = supplier.esg.segment_updated.isoformat() if supplier.esg.segment_updated else ""
+        digest.update(
+            f"{supplier.id}|{supplier.name}|{supplier.website}|{supplier.esg.updated.isoformat()}"
+            f"|{supplier.esg.segment}|{segment_updated}\n".encode()
+        )
+    return digest.hexdigest()
+
+
+# Search index over one supplier list, built once and queried on every rerun
+class SupplierSearchIndex():
+
+
+    def __init__(self, suppliers: List[Supplier]) -> None:
+        self.suppliers = suppliers
+
+        # Pre-normalized fields, scored with processor=None at query time
+        self.names = [default_process(supplier.name or "") for supplier in suppliers]
+        self.websites = [normalize_website(supplier.website or "") for supplier in suppliers]
+        self.descriptions = [default_process(supplier.description or "") for supplier in suppliers]
+
+        # Inverted trigram index over all searchable fields, maps trigram to supplier positions
+        postings: Dict[str, List[int]] = {}
+        for i in range(len(suppliers)):
+            text = f"{self.names[i]} {self.websites[i]} {self.descriptions[i]}"
+            for gram in trigrams(text):
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+
+    def _candidates(self, query: str) -> np.ndarray:
+        # Positions sharing at least one trigram with the query
+        grams = [self.postings[gram] for gram in trigrams(query) if gram in self.postings]
+        if not grams:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(grams))
+
+
+    def search(self, query: str, threshold: int = 70) -> List[Tuple[Supplier, float]]:
+        # Ranked (supplier, score) pairs at or above threshold, best match first
+        query = default_process(query)
+        if not query or not self.suppliers:
+            return []
+        candidates = self._candidates(query)
+        if candidates.size == 0:
+            return []
+
+        def score(field: List[str], scorer, weight: float) -> np.ndarray:
+            choices = [field[i] for i in candidates]
+            scores = process.cdist([query], choices, scorer=scorer, processor=None, dtype=np.float32, workers=-1)[0]
+            return scores * weight
+
+        scores = np.maximum.reduce([
+            score(self.names, fuzz.WRatio, 1.0),
+            score(self.websites, fuzz.token_set_ratio, WEBSITE_WEIGHT),
+            score(self.descriptions, fuzz.token_set_ratio, DESCRIPTION_WEIGHT),
+        ])
+
+        keep = scores >= threshold
+        positions, scores = candidates[keep], scores[keep]
+        order = sorted(range(len(positions)), key=lambda k: (-scores[k], self.names[positions[k]]))
+        return [(self.suppliers[positions[k]], float(scores[k])) for k in order]
+
+
+_index_cache: "OrderedDict[str, SupplierSearchIndex]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+# Index for a supplier list, reused across reruns and sessions while the list is unchanged
+def get_search_index(suppliers: List[Supplier]) -> SupplierSearchIndex:
+    version = suppliers_version(suppliers)
+    with _index_cache_lock:
+        index = _index_cache.get(version)
+        if index is not None:
+            _index_cache.move_to_end(version)
+            return index
+
+    index = SupplierSearchIndex(suppliers)
+    with _index_cache_lock:
+        _index_cache[version] = index
+        if len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,201 @@
+import json
+import threading
+from typing import Optional, List, Dict, Set, Any
+from pydantic import PrivateAttr
+
+from compositeai.tools import BaseTool, GoogleSerperApiTool, WebScrapeTool
+
+from utils.db import db
+from utils.resources import http_session, HTTP_TIMEOUT
+from utils.local_store import get_org_suppliers
+from utils.search import get_search_index, suppliers_version
+from utils.supplier_data import Supplier, ESG_CRITERIA
+
+
+# Maximum suppliers described in one tool result, keeps the LLM context bounded
+MAX_TOOL_RESULTS = 20
+
+# Evidence hits considered when filtering suppliers by keywords
+EVIDENCE_SEARCH_LIMIT = 200
+
+
+# In-memory lookup structures over an org's stored ESG data
+class SupplierDataIndex():
+
+
+    def __init__(self, suppliers: List[Supplier], version: str) -> None:
+        self.suppliers = suppliers
+        self.version = version
+        self.positions = {supplier.id: i for i, supplier in enumerate(suppliers)}
+        self.by_segment: Dict[str, Set[int]] = {}
+        self.by_criterion: Dict[str, Set[int]] = {criterion: set() for criterion in ESG_CRITERIA}
+
+        for i, supplier in enumerate(suppliers):
+            self.by_segment.setdefault(supplier.esg.segment.lower(), set()).add(i)
+            for criterion in ESG_CRITERIA:
+                data_summary = getattr(supplier.esg, criterion)
+                if data_summary and data_summary.available:
+                    self.by_criterion[criterion].add(i)
+
+
+    def query(
+        self,
+        org_id: str,
+        name: str = "",
+        criterion: str = "",
+        available: bool = True,
+        segment: str = "",
+        keywords: str = "",
+    ) -> List[Supplier]:
+        matches = set(range(len(self.suppliers)))
+        if criterion:
+            with_criterion = self.by_criterion[criterion]
+            matches &= with_criterion if available else matches - with_criterion
+        if segment:
+            matches &= self.by_segment.get(segment.lower(), set())
+
+        keyword_ranked = []
+        if keywords:
+            # Suppliers in order of their best BM25 evidence hit
+            hits = db.search_evidence(org_id=org_id, query=keywords, limit=EVIDENCE_SEARCH_LIMIT)
+            keyword_ids = [supplier_id for supplier_id in dict.fromkeys(hit.supplier_id for hit in hits) if supplier_id in self.positions]
+            keyword_ranked = [self.suppliers[self.positions[supplier_id]] for supplier_id in keyword_ids]
+            matches &= {self.positions[supplier_id] for supplier_id in keyword_ids}
+
+        if name:
+            ranked = [supplier for supplier, score in get_search_index(self.suppliers).search(query=name)]
+        elif keywords:
+            ranked = keyword_ranked
+        else:
+            ranked = sorted(self.suppliers, key=lambda supplier: supplier.name.lower())
+        return [supplier for supplier in ranked if self.positions[supplier.id] in matches]
+
+
+_index_cache: Dict[str, SupplierDataIndex] = {}
+_index_cache_lock = threading.Lock()
+
+
+def get_data_index(org_id: str) -> SupplierDataIndex:
+    suppliers = get_org_suppliers(org_id=org_id)
+    version = suppliers_version(suppliers)
+    with _index_cache_lock:
+        index = _index_cache.get(org_id)
+        if index is None or index.version != version:
+            index = SupplierDataIndex(suppliers, version)
+            _index_cache[org_id] = index
+    return index
+
+
+# Describe a supplier for the LLM, with details only for the criterion asked about (or all of them)
+def describe_supplier(supplier: Supplier, criterion: str = "") -> Dict[str, Any]:
+    description = {
+        "name": supplier.name,
+        "website": supplier.website,
+        "esg_segment": supplier.esg.segment,
+        "last_updated": supplier.esg.updated.strftime("%Y-%m-%d"),
+        "criteria_available": [c for c in ESG_CRITERIA if getattr(supplier.esg, c) and getattr(supplier.esg, c).available],
+    }
+    for c in [criterion] if criterion else ESG_CRITERIA:
+        data_summary = getattr(supplier.esg, c)
+        if data_summary is None or not data_summary.available:
+            continue
+        description[c] = {
+            "summary": data_summary.summary,
+            "sources": [{"key_quote": source.key_quote, "link": source.link} for source in data_summary.sources[:2]],
+        }
+    return description
+
+
+# Tool giving the chat assistant direct access to the organization's stored supplier ESG data
+class SupplierDataTool(BaseTool):
+    name: str = "search_my_suppliers"
+    description: str = (
+        "Look up the user's own suppliers and their stored ESG data. Use this BEFORE searching the web "
+        "for any question about the user's suppliers. All arguments are optional filters: "
+        "name (supplier name, fuzzy matched), "
+        f"criterion (one of: {', '.join(ESG_CRITERIA)}), "
+        "available (with criterion: true for suppliers that have it, false for those missing it), "
+        "segment (High, Medium or Low), "
+        "keywords (full-text search over the stored summaries and source quotes, best matches first)."
+    )
+    _org_id: Optional[str] = PrivateAttr(default=None)
+
+
+    def set_org(self, org_id: Optional[str]) -> None:
+        self._org_id = org_id
+
+
+    def func(
+        self,
+        name: str = "",
+        criterion: str = "",
+        available: bool = True,
+        segment: str = "",
+        keywords: str = "",
+    ) -> str:
+        try:
+            if not self._org_id:
+                return "Error using search_my_suppliers: no organization is signed in."
+            if criterion and criterion not in ESG_CRITERIA:
+                return f"Error using search_my_suppliers: criterion must be one of {', '.join(ESG_CRITERIA)}."
+
+            index = get_data_index(self._org_id)
+            matches = index.query(
+                org_id=self._org_id,
+                name=name,
+                criterion=criterion,
+                available=available,
+                segment=segment,
+                keywords=keywords,
+            )
+            result = {
+                "total_suppliers": len(index.suppliers),
+                "num_matches": len(matches),
+                "matches": [describe_supplier(supplier, criterion) for supplier in matches[:MAX_TOOL_RESULTS]],
+            }
+            if len(matches) > MAX_TOOL_RESULTS:
+                result["note"] = f"Only the first {MAX_TOOL_RESULTS} matches are shown, narrow the filters for more."
+            return json.dumps(result)
+        except Exception as e:
+            return f"Error using search_my_suppliers: {e}"
+
+
+# Web scraping tool reusing pooled keep-alive connections, with timeouts
+class PooledWebScrapeTool(WebScrapeTool):
+
+
+    def func(self, url: str) -> str:
+        try:
+            response = http_session().get(url, timeout=HTTP_TIMEOUT)
+            if response.status_code == 200:
+                from bs4 import BeautifulSoup
+
+                soup = BeautifulSoup(response.content, "html.parser")
+                text = soup.get_text()
+                if len(text) > 16000:
+                    return "Requested content exceeds maximum length."
+                return text
+            else:
+                return f"Website scrape failed: status code {response.status_code}"
+        except Exception as e:
+            return f"Error using scrape_website: {e}"
+
+
+# Google search tool reusing pooled keep-alive connections, with timeouts
+class PooledGoogleSerperApiTool(GoogleSerperApiTool):
+
+
+    def func(self, query: str) -> Any:
+        try:
+            response = http_session().post(
+                "https://google.serper.dev/search",
+                headers={
+                    "X-API-KEY": self._SERP_API_KEY,
+                    "Content-Type": "application/json",
+                },
+                data=json.dumps({"q": query}),
+                timeout=HTTP_TIMEOUT,
+            )
+            return response.json()["organic"]
+        except Exception as e:
+            return f"Error using google_search: {e}"
@@ -0,0 +1,95 @@
+import io
+import hashlib
+from typing import List, Iterable, Iterator
+from itertools import islice
+from pydantic import BaseModel
+
+
+# Column holding supplier names in bulk upload spreadsheets, matched case-insensitively
+SUPPLIER_NAMES_COLUMN = "supplier names"
+
+# Rows parsed per chunk, bounds memory regardless of upload size
+UPLOAD_CHUNK_SIZE = 10000
+
+# Names longer than this are treated as malformed cells
+MAX_NAME_LENGTH = 200
+
+
+class UploadResult(BaseModel):
+    names: List[str]
+    total_rows: int
+    rejected: int
+    duplicates: int
+
+
+def file_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _csv_chunks(data: bytes, chunk_size: int) -> Iterator[list]:
+    import pandas as pd
+
+    # Read the header alone to find the column, then parse only that column in chunks
+    header = pd.read_csv(io.BytesIO(data), nrows=0).columns
+    column = next((col for col in header if str(col).strip().lower() == SUPPLIER_NAMES_COLUMN), None)
+    if column is None:
+        raise ValueError("No \"Supplier Names\" column")
+    reader = pd.read_csv(
+        io.BytesIO(data),
+        usecols=[column],
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunk_size,
+    )
+    for chunk in reader:
+        yield chunk[column].tolist()
+
+
+def _xlsx_chunks(data: bytes, chunk_size: int) -> Iterator[list]:
+    from openpyxl import load_workbook
+
+    # Read-only mode streams rows from the sheet XML instead of loading the workbook
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        index = next((i for i, col in enumerate(header) if str(col).strip().lower() == SUPPLIER_NAMES_COLUMN), None)
+        if index is None:
+            raise ValueError("No \"Supplier Names\" column")
+        rows = sheet.iter_rows(min_row=2, min_col=index + 1, max_col=index + 1, values_only=True)
+        while chunk := [row[0] for row in islice(rows, chunk_size)]:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+# Parse the supplier names column of an uploaded CSV or Excel file
+# Names are deduplicated case-insensitively, keeping the first spelling seen
+def parse_supplier_names(data: bytes, filename: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> UploadResult:
+    if filename.lower().endswith(".csv"):
+        chunks: Iterable[list] = _csv_chunks(data, chunk_size)
+    else:
+        chunks = _xlsx_chunks(data, chunk_size)
+
+    names = []
+    seen = set()
+    total_rows = rejected = duplicates = 0
+    for chunk in chunks:
+        for value in chunk:
+            name = str(value).strip() if value is not None else ""
+            # Blank cells (including trailing formatted rows in Excel) are not counted as rows
+            if not name:
+                continue
+            total_rows += 1
+            # Reject cells that cannot be a company name, e.g. numbers, dates or stray long text
+            if len(name) > MAX_NAME_LENGTH or not any(char.isalpha() for char in name):
+                rejected += 1
+                continue
+            key = name.lower()
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            names.append(name)
+
+    return UploadResult(names=names, total_rows=total_rows, rejected=rejected, duplicates=duplicates)